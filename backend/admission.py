@@ -0,0 +1,267 @@
+import asyncio
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import orjson
+
+from metrics import ADMISSION_REJECTIONS
+
+# Share of max_inflight each priority may fill: once the worker is that busy,
+# new requests of the priority are shed, so the cheapest and most important
+# requests are the last to be turned away
+PRIORITY_SHARES = {"high": 1.0, "normal": 0.8, "low": 0.5}
+
+
+class AdmissionPolicy(NamedTuple):
+    # Limits for one class of requests, matched by method and path template
+    # ("/api/products/{product_id}", or a prefix ending in "*"). Rates are
+    # requests per second, per client and for the whole class; 0 turns a
+    # bucket off, and bursts default to one second's worth (at least one).
+    # Past concurrency requests in flight (0: no cap), up to queue_size more
+    # wait at most queue_timeout seconds for a slot.
+    name: str
+    methods: Tuple[str, ...]
+    paths: Tuple[str, ...]
+    priority: str = "normal"
+    client_rate: float = 0.0
+    client_burst: float = 0.0
+    route_rate: float = 0.0
+    route_burst: float = 0.0
+    concurrency: int = 0
+    queue_size: int = 0
+    queue_timeout: float = 1.0
+
+
+class Rejection(NamedTuple):
+    status: int
+    reason: str
+    detail: str
+    retry_after: float
+
+
+def _compile(paths: Sequence[str]) -> "re.Pattern":
+    patterns = []
+    for path in paths:
+        pieces = re.split(r"\{[^/}]+\}", path.rstrip("*"))
+        patterns.append("[^/]+".join(re.escape(piece) for piece in pieces) + (".*" if path.endswith("*") else ""))
+    return re.compile("^(?:%s)$" % "|".join(patterns))
+
+
+class LimiterStore:
+    # Token buckets by key. take() spends a token from the bucket at key,
+    # which refills at rate tokens per second up to burst, and returns 0.0
+    # if it had one, else the seconds until it will. Stores shared between
+    # workers must make take() atomic.
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        raise NotImplementedError
+
+    def __len__(self):
+        return 0
+
+
+class MemoryLimiterStore(LimiterStore):
+    # Buckets of this worker only, least recently used evicted past
+    # max_keys. A bucket left alone for burst / rate seconds is full again,
+    # so eviction only forgets clients that would have been admitted anyway
+    # unless more than max_keys of them are active at once.
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimit:
+    # At most limit holders; up to queue_size callers wait in FIFO order and
+    # a released slot is handed straight to the oldest of them. acquire()
+    # returns False at once when the queue is full, or after timeout.
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=self.timeout)
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot that was already handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        if waiter.done():
+            return True
+        self._discard(waiter)
+        return False
+
+    def _discard(self, waiter: asyncio.Future):
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        # active stays the same when the slot goes to a waiter
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class _Route(NamedTuple):
+    policy: AdmissionPolicy
+    pattern: "re.Pattern"
+    slots: Optional[ConcurrencyLimit]
+
+
+class AdmissionController:
+    # Decides, before a request reaches its route, whether this worker takes
+    # it on. Requests are matched to the first policy whose methods and
+    # paths fit; unmatched and excluded paths are always admitted. Checks
+    # run cheapest first: the client's bucket (429), the class bucket,
+    # the priority's share of max_inflight and the class concurrency cap
+    # (503). Every rejection carries Retry-After.
+    def __init__(self, policies: Sequence[AdmissionPolicy], store: Optional[LimiterStore] = None,
+                 max_inflight: int = 0, priority_shares: Dict[str, float] = PRIORITY_SHARES,
+                 exclude_prefixes: Sequence[str] = ()):
+        self.routes = [
+            _Route(policy, _compile(policy.paths),
+                   ConcurrencyLimit(policy.concurrency, policy.queue_size, policy.queue_timeout)
+                   if policy.concurrency > 0 else None)
+            for policy in policies
+        ]
+        self.store = store or MemoryLimiterStore()
+        self.max_inflight = max_inflight
+        self.priority_shares = priority_shares
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.inflight = 0
+        self.admitted: Dict[str, int] = {policy.name: 0 for policy in policies}
+        self.rejected: Dict[Tuple[str, str], int] = {}
+
+    def match(self, method: str, path: str) -> Optional[_Route]:
+        if path.startswith(self.exclude_prefixes):
+            return None
+        for route in self.routes:
+            if method in route.policy.methods and route.pattern.match(path):
+                return route
+        return None
+
+    def _reject(self, route: _Route, status: int, reason: str, detail: str, retry_after: float) -> Rejection:
+        key = (route.policy.name, reason)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+        ADMISSION_REJECTIONS.inc(key)
+        return Rejection(status, reason, detail, retry_after)
+
+    async def admit(self, route: _Route, client: str) -> Optional[Rejection]:
+        # None means admitted, and release(route) must follow
+        policy = route.policy
+        if policy.client_rate > 0:
+            wait = await self.store.take("%s:%s" % (policy.name, client), policy.client_rate,
+                                         max(policy.client_burst or policy.client_rate, 1))
+            if wait:
+                return self._reject(route, 429, "client_rate", "Too many requests, please slow down", wait)
+        if policy.route_rate > 0:
+            wait = await self.store.take(policy.name, policy.route_rate, max(policy.route_burst or policy.route_rate, 1))
+            if wait:
+                return self._reject(route, 503, "route_rate", "Server busy, please retry", wait)
+        share = self.priority_shares.get(policy.priority, 1.0)
+        if self.max_inflight > 0 and self.inflight >= self.max_inflight * share:
+            return self._reject(route, 503, "overload", "Server busy, please retry", 1)
+        if route.slots is not None and not await route.slots.acquire():
+            return self._reject(route, 503, "queue_full", "Server busy, please retry", route.slots.timeout)
+        self.inflight += 1
+        self.admitted[policy.name] += 1
+        return None
+
+    def release(self, route: _Route):
+        self.inflight -= 1
+        if route.slots is not None:
+            route.slots.release()
+
+    def stats(self) -> dict:
+        policies = {}
+        for route in self.routes:
+            name = route.policy.name
+            policies[name] = {
+                "priority": route.policy.priority,
+                "admitted": self.admitted[name],
+                "rejected": {reason: count for (policy, reason), count in self.rejected.items() if policy == name},
+            }
+            if route.slots is not None:
+                policies[name].update(active=route.slots.active, waiting=route.slots.waiting,
+                                      concurrency=route.slots.limit)
+        return {"inflight": self.inflight, "max_inflight": self.max_inflight,
+                "limiter_keys": len(self.store), "policies": policies}
+
+
+class AdmissionMiddleware:
+    # Plain ASGI middleware around the router: rejected requests are
+    # answered with a small JSON error before any body is read or any
+    # dependency runs
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self.controller.match(scope["method"], scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        rejection = await self.controller.admit(route, client[0] if client else "")
+        if rejection is not None:
+            await _send_rejection(send, rejection)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route)
+
+
+async def _send_rejection(send, rejection: Rejection):
+    body = orjson.dumps({"detail": rejection.detail})
+    headers: List[Tuple[bytes, bytes]] = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(rejection.retry_after))).encode()),
+    ]
+    await send({"type": "http.response.start", "status": rejection.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,1419 @@
+"""Benchmarks for the API and its in-process indexes.
+
+HTTP concurrency against a running server (``python server.py``):
+
+    python benchmark.py http --url http://localhost:8001 --concurrency 128 --duration 20
+
+Run it once against the previous build and once against the current one to
+compare requests/s and tail latency at the same concurrency. With --auth the
+requests carry a fresh user's token (default paths: cart, wishlist, me); run
+the server with USER_CACHE_SIZE=0 to measure without the user cache.
+
+Search index build time and query latency on a synthetic catalog:
+
+    python benchmark.py search --products 100000
+
+Facet index build time and count latency for random filter combinations:
+
+    python benchmark.py facets --products 100000
+
+Suggest index build time, memory (traced Python allocations of a second
+build) and per-keystroke latency, exact and with one typo, then incremental
+renames and removals followed by the same keystrokes again:
+
+    python benchmark.py suggest --products 100000
+
+Recommendation build time and memory (co-occurrence matrix and top-K), and
+an incremental refresh after 1% of the baskets change:
+
+    python benchmark.py recommendations --products 100000 --entries 1000000
+
+Per-item cost of serializing a product list (validated models vs rows):
+
+    python benchmark.py serialize --items 100
+
+Catalog latency while logins hammer bcrypt (compare before/after builds):
+
+    python benchmark.py login-storm --url http://localhost:8001 --logins 50 --readers 50
+
+Lost-update check: many concurrent add-to-cart calls for one user and product
+must all be reflected in the final quantity:
+
+    python benchmark.py cart --url http://localhost:8001 --requests 500
+
+Bulk import and export throughput (needs an admin account):
+
+    python benchmark.py import --url http://localhost:8001 --username admin --password admin123 --products 100000
+
+Checkout contention: thousands of checkouts race for one hot SKU with
+--stock units; no more than --stock orders may succeed and stock must never
+go negative (needs an admin account to create the SKU):
+
+    python benchmark.py checkout --username admin --password admin123 --checkouts 5000 --stock 1000
+
+End-to-end suite: starts the app in-process against MONGO_URL (or an
+in-memory stand-in with --in-memory, which needs mongomock-motor), runs the
+browse, search, cart, wishlist, review, login and pages scenarios one route
+at a time, and writes throughput, p50/p95/p99 and database commands per
+request for every route to a JSON file:
+
+    python benchmark.py suite --output after.json --baseline before.json
+
+All of its users share one client address, so the in-process suite runs with
+admission control off unless ADMISSION_ENABLED is set; run a --url target
+with ADMISSION_ENABLED=false too.
+
+The pages scenario measures time-to-data for the home and products pages,
+comparing the old parallel request fan-out with the bootstrap and batch
+endpoints; run it with --url so every request pays for a real HTTP exchange:
+
+    python benchmark.py suite --url http://localhost:8001 --scenario pages
+
+Idle /api/live subscribers one worker holds, server memory per connection,
+and how long a rating change takes to reach all of them (starts a
+single-worker server; use --url and --server-pid for a running one):
+
+    python benchmark.py live --subscribers 5000
+
+Cold start (process start to /health/ready on every worker), throughput and
+shutdown time of the production launcher (serve.py) for each worker count,
+against MONGO_URL:
+
+    python benchmark.py workers --workers 1 --workers 2 --workers 4
+
+Browse latency with admission control off and on, first alone and then
+while --flood-rate login and registration requests per second arrive, each
+from a random X-Forwarded-For address so per-client limits alone cannot stop
+them (starts a single-worker server per setting; use --url for a running one):
+
+    python benchmark.py auth-flood --in-memory --flood-rate 200 --readers 32
+
+Pin the server to cores the load generator does not use (taskset); on a
+shared core the generator's own work shows up as browse latency.
+
+Popularity counters: a simulated --duration seconds of product views, cart
+and wishlist adds at --rate events per second, replayed once per flush
+interval against MONGO_URL (or --in-memory) on a simulated clock. For each
+interval it reports the updates written per second next to the one update
+per event a write-through counter would cost, how many of the true top
+--top products the stored scores rank there and how far their stored
+scores trail the true ones (sampled about every --sample-seconds), and the
+most events that were pending, i.e. lost if the worker had died then:
+
+    python benchmark.py popularity --in-memory --interval 1 --interval 10 --interval 60 --interval 300
+
+Overhead of the /metrics instrumentation (the suite run with and without
+METRICS_ENABLED, interleaved; the target is under 2% of request time):
+
+    python benchmark.py metrics-overhead --in-memory --rounds 3
+
+With --baseline the run exits non-zero if any route's p95 or throughput is
+more than --threshold percent worse. Commands per request are counted with a
+pymongo command listener, so they are only reported against a real MongoDB.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import httpx
+from pymongo import monitoring
+
+SYLLABLES = "ka ra to mi shi no de lu va zen dor gal ex ion ar tem bri sol quo nex".split()
+# Pseudo-vocabulary with a Zipf-like frequency distribution, like real titles
+WORDS = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES})
+WORD_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+GENRES = ["Action", "RPG", "Sports", "Racing", "Adventure", "Strategy", "Open World", "Shooter"]
+PLATFORMS = ["PC", "PlayStation", "Xbox", "Nintendo"]
+STUDIOS = ["Studio %d" % i for i in range(200)]
+
+
+def synthetic_products(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "id": "product-%d" % i,
+            "title": " ".join(rng.choices(WORDS, WORD_WEIGHTS, k=rng.randint(2, 4))).title(),
+            "description": " ".join(rng.choices(WORDS, WORD_WEIGHTS, k=rng.randint(15, 40))),
+            "price": round(rng.uniform(4.99, 79.99), 2),
+            "category_id": "category-%d" % rng.randint(0, 5),
+            "platform": rng.sample(PLATFORMS, rng.randint(1, 3)),
+            "genre": rng.sample(GENRES, rng.randint(1, 3)),
+            "rating": rng.choice(["E", "T", "M"]),
+            "developer": rng.choice(STUDIOS),
+            "publisher": rng.choice(STUDIOS),
+            "in_stock": rng.randint(0, 500),
+            "featured": rng.random() < 0.01,
+            "average_rating": round(rng.uniform(1, 5), 1),
+            "total_reviews": rng.randint(0, 5000),
+        }
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def worker(client, paths, deadline, latencies, errors, headers=None):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(url, paths, concurrency, duration, auth=False):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        headers = await register_user(client) if auth else None
+        # Warm up the connection pool and server-side caches
+        await asyncio.gather(*(client.get(paths[0], headers=headers) for _ in range(concurrency)))
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            worker(client, paths, deadline, latencies, errors, headers) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(func, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
+
+
+def bench_http(args):
+    if args.auth:
+        paths = args.paths or ["/api/cart", "/api/wishlist", "/api/auth/me"]
+    else:
+        paths = args.paths or ["/api/products", "/api/categories", "/api/products?featured=true&limit=8"]
+    return asyncio.run(run(args.url, paths, args.concurrency, args.duration, args.auth))
+
+
+def bench_search(args):
+    from search import SearchIndex
+
+    products = list(synthetic_products(args.products))
+    index = SearchIndex()
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    index.build(products)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(7)
+    queries = [" ".join(rng.choices(WORDS, WORD_WEIGHTS, k=rng.randint(1, 3))) for _ in range(args.queries)]
+    return {
+        "products": len(index),
+        "build_seconds": round(build_seconds, 2),
+        "peak_rss_growth_mb": round(max_rss_mb() - rss_before, 1),
+        "top20": timed(lambda i: index.search(queries[i], limit=20), len(queries)),
+        "all_matches": timed(lambda i: index.search(queries[i]), len(queries)),
+        "incremental_update": timed(lambda i: index.add(products[i]), min(len(products), 1000)),
+    }
+
+
+def bench_facets(args):
+    from facets import FacetIndex
+
+    products = list(synthetic_products(args.products))
+    index = FacetIndex()
+    start = time.perf_counter()
+    index.build(products)
+    build_seconds = time.perf_counter() - start
+
+    rng = random.Random(7)
+    categories = sorted({product["category_id"] for product in products})
+    filters = []
+    for _ in range(args.queries):
+        price_min = round(rng.uniform(0, 40), 2) if rng.random() < 0.3 else None
+        filters.append((
+            {
+                "category_id": rng.choice(categories) if rng.random() < 0.5 else None,
+                "platform": rng.choice(PLATFORMS) if rng.random() < 0.5 else None,
+                "genre": rng.choice(GENRES) if rng.random() < 0.3 else None,
+            },
+            price_min, price_min + round(rng.uniform(5, 40), 2) if price_min is not None else None,
+        ))
+    return {
+        "products": len(index),
+        "build_seconds": round(build_seconds, 2),
+        "unfiltered": timed(lambda i: index.counts({}), args.queries),
+        "filtered": timed(lambda i: index.counts(filters[i][0], None, filters[i][1], filters[i][2]), args.queries),
+        "incremental_update": timed(lambda i: index.add(products[i]), min(len(products), 1000)),
+    }
+
+
+def bench_suggest(args):
+    from suggest import SuggestIndex, normalize
+
+    products = list(synthetic_products(args.products))
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.build(products)
+    build_seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    measured = SuggestIndex()
+    measured.build(products)
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    del measured
+
+    # Every prefix of a word someone might type, and the same with the
+    # third character mistyped
+    rng = random.Random(7)
+    prefixes = []
+    for _ in range(args.queries):
+        word = rng.choice(normalize(rng.choice(products)["title"]).split())
+        prefixes.append(word[:rng.randint(1, len(word))])
+    typos = [prefix[:2] + "q" + prefix[3:] if len(prefix) > 3 else prefix for prefix in prefixes]
+
+    def keystrokes():
+        return {
+            sort: timed(lambda i: index.suggest(prefixes[i], args.limit, sort), len(prefixes))
+            for sort in ("popular", "rating")
+        }
+
+    result = {
+        "products": len(index),
+        "build_seconds": round(build_seconds, 2),
+        "memory_mb": round(memory_mb, 1),
+        "index": index.stats(),
+        "exact": keystrokes(),
+        "fuzzy": timed(lambda i: index.suggest(typos[i], args.limit, "popular", True), len(typos)),
+    }
+    updates = min(len(products) // 2, 1000)
+
+    def rename(i):
+        index.add(dict(products[i], title="Renamed %s" % products[i]["title"], total_reviews=i))
+
+    result["incremental_update"] = timed(rename, updates)
+    result["incremental_remove"] = timed(lambda i: index.remove(products[updates + i]["id"]), updates)
+    result["exact_after_updates"] = keystrokes()
+    return result
+
+
+def synthetic_baskets(products, entries, seed=42, per_user=5):
+    # Power-law product popularity, like real wishlists
+    rng = random.Random(seed)
+    baskets = {}
+    for user in range(entries // per_user):
+        baskets["user-%d" % user] = {
+            "product-%d" % min(int(products * rng.random() ** 3), products - 1) for _ in range(per_user)
+        }
+    return baskets
+
+
+def bench_recommendations(args):
+    from recommendations import CooccurrenceModel
+
+    baskets = synthetic_baskets(args.products, args.entries)
+    model = CooccurrenceModel()
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    rows = model.build(baskets)
+    matrix_seconds = time.perf_counter() - start
+    model.top_neighbours(rows, args.top_k)
+    build_seconds = time.perf_counter() - start
+    rss_after = max_rss_mb()
+
+    rng = random.Random(7)
+    users = list(baskets)
+    for user in rng.sample(users, len(users) // 100):
+        baskets[user] = {"product-%d" % rng.randrange(args.products) for _ in range(5)}
+    start = time.perf_counter()
+    rows = model.update(baskets)
+    model.top_neighbours(rows, args.top_k)
+    refresh_seconds = time.perf_counter() - start
+    return {
+        "products_with_baskets": len(model.items),
+        "baskets": len(baskets),
+        "cooccurrence_nonzeros": int(model.cooccurrence.nnz),
+        "matrix_seconds": round(matrix_seconds, 2),
+        "build_seconds": round(build_seconds, 2),
+        "peak_rss_growth_mb": round(rss_after - rss_before, 1),
+        "refresh_products_updated": int(len(rows)),
+        "refresh_seconds": round(refresh_seconds, 2),
+    }
+
+
+async def register_user(client, prefix="bench"):
+    # Creates a throwaway account and returns its Authorization header
+    username = "%s-%d-%d" % (prefix, time.time_ns(), random.randint(0, 1 << 30))
+    await client.post("/api/auth/register", json={
+        "username": username, "email": "%s@example.com" % username,
+        "password": "benchmark", "full_name": "Benchmark User",
+    })
+    response = await client.post("/api/auth/login", data={"username": username, "password": "benchmark"})
+    response.raise_for_status()
+    return {"Authorization": "Bearer %s" % response.json()["access_token"]}
+
+
+async def run_cart(url, requests, concurrency):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        headers = await register_user(client)
+        products = (await client.get("/api/products", params={"limit": 1})).json()
+        if not products:
+            raise SystemExit("The catalog is empty; seed it with initialize_db.py first")
+        product_id = products[0]["id"]
+
+        semaphore = asyncio.Semaphore(concurrency)
+        async def add():
+            async with semaphore:
+                response = await client.post("/api/cart/add", headers=headers,
+                                             json={"product_id": product_id, "quantity": 1})
+                return response.status_code == 200
+
+        started = time.perf_counter()
+        succeeded = sum(await asyncio.gather(*(add() for _ in range(requests))))
+        elapsed = time.perf_counter() - started
+
+        cart = (await client.get("/api/cart", headers=headers)).json()
+        quantity = sum(item["quantity"] for item in cart["items"] if item["product"]["id"] == product_id)
+        await client.delete("/api/cart", headers=headers)
+    return {
+        "requests": requests,
+        "succeeded": succeeded,
+        "final_quantity": quantity,
+        "lost_updates": succeeded - quantity,
+        "requests_per_second": round(requests / elapsed, 1),
+    }
+
+
+async def run_login_storm(url, logins, readers, duration):
+    limits = httpx.Limits(max_connections=logins + readers)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        username = "storm-%d" % time.time_ns()
+        await client.post("/api/auth/register", json={
+            "username": username, "email": "%s@example.com" % username,
+            "password": "benchmark", "full_name": "Login Storm",
+        })
+        credentials = {"username": username, "password": "benchmark"}
+        deadline = time.perf_counter() + duration
+        login_statuses = []
+
+        async def login_worker():
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/auth/login", data=credentials)
+                login_statuses.append(response.status_code)
+
+        latencies, errors = [], []
+        catalog = ["/api/products", "/api/categories", "/api/products?featured=true&limit=8"]
+        await asyncio.gather(
+            *(login_worker() for _ in range(logins)),
+            *(worker(client, catalog, deadline, latencies, errors) for _ in range(readers)),
+        )
+    return {
+        "logins": len(login_statuses),
+        "logins_per_second": round(len(login_statuses) / duration, 1),
+        "logins_rejected_503": login_statuses.count(503),
+        "catalog_requests": len(latencies),
+        "catalog_p50_ms": round(percentile(latencies, 50), 2),
+        "catalog_p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def bench_login_storm(args):
+    return asyncio.run(run_login_storm(args.url, args.logins, args.readers, args.duration))
+
+
+def bench_serialize(args):
+    import os
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    from datetime import datetime
+    from typing import List
+
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from server import Product, product_row
+
+    docs = []
+    for doc in synthetic_products(args.items):
+        doc.update(image_url="https://example.com/%s.jpg" % doc["id"], release_date=datetime(2023, 1, 1))
+        docs.append(doc)
+    response_model = TypeAdapter(List[Product])
+
+    def validated(_):
+        # Previous path: Product(**doc) per row, then response_model
+        # validation and jsonable_encoder + JSONResponse rendering
+        models = [Product(**doc) for doc in docs]
+        checked = response_model.validate_python([model.model_dump() for model in models])
+        return orjson.dumps(jsonable_encoder(checked))
+
+    def rows(_):
+        return orjson.dumps([product_row(doc) for doc in docs])
+
+    per_item = lambda result: {
+        key.replace("_ms", "_us"): round(value * 1000 / args.items, 2) for key, value in result.items()
+    }
+    return {
+        "items": args.items,
+        "validated_models_per_item": per_item(timed(validated, args.iterations)),
+        "trusted_rows_per_item": per_item(timed(rows, args.iterations)),
+    }
+
+
+def bench_cart(args):
+    return asyncio.run(run_cart(args.url, args.requests, args.concurrency))
+
+
+async def run_import(url, username, password, count, fmt):
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        response = await client.post("/api/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        headers = {"Authorization": "Bearer %s" % response.json()["access_token"]}
+
+        with tempfile.TemporaryFile() as upload:
+            for doc in synthetic_products(count):
+                doc.update(id="import-%s" % doc["id"], image_url="https://example.com/%s.jpg" % doc["id"],
+                           release_date="2023-01-01T00:00:00")
+                upload.write(json.dumps(doc).encode() + b"\n")
+            size = upload.tell()
+            upload.seek(0)
+            started = time.perf_counter()
+            response = await client.post("/api/admin/products/import", headers=headers,
+                                         files={"file": ("products.ndjson", upload)})
+            import_seconds = time.perf_counter() - started
+        response.raise_for_status()
+        report = response.json()
+
+        exported = 0
+        started = time.perf_counter()
+        async with client.stream("GET", "/api/admin/products/export", headers=headers,
+                                 params={"format": fmt}) as stream:
+            async for chunk in stream.aiter_bytes():
+                exported += len(chunk)
+        export_seconds = time.perf_counter() - started
+    return {
+        "rows": report["rows"],
+        "upload_mb": round(size / 2 ** 20, 1),
+        "import_errors": report["error_count"],
+        "import_rows_per_second": round(report["rows"] / import_seconds, 1),
+        "export_mb": round(exported / 2 ** 20, 1),
+        "export_mb_per_second": round(exported / 2 ** 20 / export_seconds, 1),
+    }
+
+
+async def run_checkout(url, username, password, users, checkouts, stock):
+    limits = httpx.Limits(max_connections=users)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        response = await client.post("/api/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        admin = {"Authorization": "Bearer %s" % response.json()["access_token"]}
+        response = await client.post("/api/products", headers=admin, json={
+            "title": "Launch Day Edition %d" % time.time_ns(), "description": "Checkout contention benchmark",
+            "price": 69.99, "image_url": "https://example.com/launch.jpg", "category_id": "benchmark",
+            "platform": ["PC"], "genre": ["Action"], "rating": "M", "release_date": "2024-01-01T00:00:00",
+            "developer": "Benchmark", "publisher": "Benchmark", "in_stock": stock,
+        })
+        response.raise_for_status()
+        product_id = response.json()["id"]
+
+        buyers = await asyncio.gather(*(register_user(client, prefix="buyer") for _ in range(users)))
+        attempts = iter(range(checkouts))
+        statuses = []
+
+        async def buyer(headers):
+            for _ in attempts:
+                await client.post("/api/cart/add", headers=headers, json={"product_id": product_id, "quantity": 1})
+                response = await client.post("/api/checkout", headers={
+                    **headers, "Idempotency-Key": "checkout-%d" % time.time_ns(),
+                })
+                statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(buyer(headers) for headers in buyers))
+        elapsed = time.perf_counter() - started
+
+        remaining = (await client.get("/api/products/%s" % product_id)).json()
+        await client.delete("/api/products/%s" % product_id, headers=admin)
+    orders = statuses.count(200)
+    return {
+        "checkouts": len(statuses),
+        "stock": stock,
+        "orders": orders,
+        "rejected_out_of_stock": statuses.count(409),
+        "other_errors": len(statuses) - orders - statuses.count(409),
+        "final_stock": remaining["in_stock"],
+        "oversold": orders > stock or remaining["in_stock"] < 0,
+        "stock_consistent": remaining["in_stock"] == stock - orders,
+        "orders_per_second": round(orders / elapsed, 1),
+        "checkouts_per_second": round(len(statuses) / elapsed, 1),
+    }
+
+
+def bench_checkout(args):
+    return asyncio.run(run_checkout(args.url, args.username, args.password, args.users, args.checkouts, args.stock))
+
+
+def bench_import(args):
+    return asyncio.run(run_import(args.url, args.username, args.password, args.products, args.format))
+
+
+class CommandCounter(monitoring.CommandListener):
+    # Counts database commands (round trips) issued by the app; handshake and
+    # session housekeeping commands are not queries
+    IGNORED = {"ping", "hello", "ismaster", "isMaster", "endSessions", "saslStart", "saslContinue"}
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            with self._lock:
+                self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Scenario -> routes; each route builds (method, path, request kwargs) for
+# one request from the shared catalog context, the worker's user and an rng,
+# or a list of requests issued together and timed until the last completes.
+# Routes run as separate timed phases in this order, so commands per request
+# can be attributed to each route.
+SCENARIOS = {
+    "browse": [
+        ("GET /api/products", lambda ctx, user, rng: ("GET", "/api/products", {})),
+        ("GET /api/products?category&sort", lambda ctx, user, rng: (
+            "GET", "/api/products", {"params": {"category": rng.choice(ctx["categories"]), "sort": "price_asc"}})),
+        ("GET /api/products/{id}", lambda ctx, user, rng: ("GET", "/api/products/%s" % rng.choice(ctx["products"]), {})),
+        ("GET /api/categories", lambda ctx, user, rng: ("GET", "/api/categories", {})),
+    ],
+    "search": [
+        ("GET /api/products?q", lambda ctx, user, rng: (
+            "GET", "/api/products", {"params": {"q": " ".join(rng.sample(ctx["words"], rng.randint(1, 2)))}})),
+    ],
+    "cart": [
+        ("POST /api/cart/add", lambda ctx, user, rng: (
+            "POST", "/api/cart/add", {"json": {"product_id": rng.choice(ctx["products"]), "quantity": 1}})),
+        ("GET /api/cart", lambda ctx, user, rng: ("GET", "/api/cart", {})),
+    ],
+    "wishlist": [
+        ("POST /api/wishlist/add", lambda ctx, user, rng: (
+            "POST", "/api/wishlist/add", {"json": {"product_id": rng.choice(ctx["products"])}})),
+        ("GET /api/wishlist", lambda ctx, user, rng: ("GET", "/api/wishlist", {})),
+    ],
+    "review": [
+        # Each user walks its own shuffled product list; once it wraps around,
+        # duplicate reviews are rejected and counted as client errors
+        ("POST /api/products/{id}/reviews", lambda ctx, user, rng: (
+            "POST", "/api/products/%s/reviews" % next(user["unreviewed"]),
+            {"json": {"user_id": "-", "product_id": "-", "rating": rng.randint(1, 5), "comment": "benchmark"}})),
+        ("GET /api/products/{id}/reviews", lambda ctx, user, rng: (
+            "GET", "/api/products/%s/reviews" % rng.choice(ctx["products"]), {})),
+    ],
+    "login": [
+        ("POST /api/auth/login", lambda ctx, user, rng: ("POST", "/api/auth/login", {"data": user["credentials"]})),
+    ],
+    # Time-to-data per page: the separate requests a page used to fire in
+    # parallel against the single bootstrap or batch request replacing them
+    "pages": [
+        ("page home: fan-out", lambda ctx, user, rng: [
+            ("GET", "/api/products", {"params": {"featured": "true", "limit": 8}}),
+        ]),
+        ("page home: bootstrap", lambda ctx, user, rng: ("GET", "/api/bootstrap/home", {})),
+        ("page products: fan-out", lambda ctx, user, rng: [
+            ("GET", "/api/products", {"params": {"sort": "title"}}),
+            ("GET", "/api/products/facets", {}),
+            ("GET", "/api/categories", {}),
+            ("GET", "/api/wishlist", {}),
+        ]),
+        ("page products: bootstrap", lambda ctx, user, rng: ("GET", "/api/bootstrap/products", {"params": {"sort": "title"}})),
+        ("filter change: fan-out", lambda ctx, user, rng: [
+            ("GET", "/api/products", {"params": {"category": ctx["categories"][0], "sort": "title"}}),
+            ("GET", "/api/products/facets", {"params": {"category": ctx["categories"][0]}}),
+        ]),
+        ("filter change: batch", lambda ctx, user, rng: ("POST", "/api/batch", {"json": {"requests": [
+            {"path": "/api/products?sort=title&category=%s" % ctx["categories"][0]},
+            {"path": "/api/products/facets?category=%s" % ctx["categories"][0]},
+        ]}})),
+    ],
+}
+
+
+async def run_route(client, ctx, users, build, duration, counter):
+    latencies, statuses = [], {"errors": 0, "client_errors": 0}
+    commands_before = counter.count if counter else 0
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def route_worker(user, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            requests = build(ctx, user, rng)
+            if isinstance(requests, tuple):
+                requests = [requests]
+            start = time.perf_counter()
+            try:
+                responses = await asyncio.gather(*(
+                    client.request(method, path, headers=user["headers"], **kwargs)
+                    for method, path, kwargs in requests
+                ))
+            except httpx.HTTPError:
+                statuses["errors"] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            worst = max(response.status_code for response in responses)
+            if worst >= 500:
+                statuses["errors"] += 1
+            elif worst >= 400:
+                statuses["client_errors"] += 1
+
+    await asyncio.gather(*(route_worker(user, seed) for seed, user in enumerate(users)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        **statuses,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "db_commands_per_request": (
+            round((counter.count - commands_before) / len(latencies), 2) if counter and latencies else None
+        ),
+    }
+
+
+async def seed_catalog(database, count):
+    # Only used for an empty database: synthetic products plus their categories
+    docs = []
+    for doc in synthetic_products(count):
+        doc.update(image_url="https://example.com/%s.jpg" % doc["id"], release_date=datetime(2023, 1, 1))
+        docs.append(doc)
+    await database.products.insert_many(docs)
+    categories = sorted({doc["category_id"] for doc in docs})
+    await database.categories.insert_many([
+        {"id": category, "name": category, "description": "", "image_url": ""} for category in categories
+    ])
+
+
+async def load_context(client):
+    products = (await client.get("/api/products", params={"limit": 200})).json()
+    if not products:
+        raise SystemExit("The catalog is empty; seed it with initialize_db.py first")
+    categories = [category["id"] for category in (await client.get("/api/categories")).json()]
+    words = sorted({word for product in products for word in product["title"].split()})
+    return {
+        "products": [product["id"] for product in products],
+        "categories": categories or sorted({product["category_id"] for product in products}),
+        "words": words,
+    }
+
+
+async def create_users(client, count, products):
+    users = []
+    for i in range(count):
+        headers = await register_user(client, prefix="suite")
+        me = (await client.get("/api/auth/me", headers=headers)).json()
+        unreviewed = list(products)
+        random.Random(i).shuffle(unreviewed)
+        users.append({
+            "headers": headers,
+            "credentials": {"username": me["username"], "password": "benchmark"},
+            "unreviewed": itertools.cycle(unreviewed),
+        })
+    return users
+
+
+async def run_suite(client, args, counter):
+    ctx = await load_context(client)
+    users = await create_users(client, args.concurrency, ctx["products"])
+    # Warm up caches and connection pools before the first timed phase
+    await asyncio.gather(*(client.get("/api/products") for _ in range(args.concurrency)))
+
+    results = {}
+    for scenario in args.scenarios:
+        for label, build in SCENARIOS[scenario]:
+            results[label] = await run_route(client, ctx, users, build, args.duration, counter)
+            results[label]["scenario"] = scenario
+            print("%-36s %s" % (label, json.dumps(results[label])), file=sys.stderr)
+    return results
+
+
+def use_in_memory_database():
+    try:
+        import mongomock_motor
+    except ImportError:
+        raise SystemExit("--in-memory needs mongomock-motor: pip install mongomock-motor")
+    import database
+    database.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+
+
+async def run_in_process(args):
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+    if args.in_memory:
+        use_in_memory_database()
+
+    import server
+
+    # The stand-in does not emit command events, so nothing would be counted
+    counter = None if args.in_memory else CommandCounter()
+    if counter:
+        server.MONGO_POOL_OPTIONS.setdefault("event_listeners", []).append(counter)
+
+    async with server.app.router.lifespan_context(server.app):
+        if await server.db.products.count_documents({}) == 0:
+            await seed_catalog(server.db, args.products)
+            await server.build_catalog_indexes()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            return await run_suite(client, args, counter)
+
+
+async def run_remote(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        return await run_suite(client, args, None)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(routes, baseline, threshold):
+    regressions = []
+    for label, result in routes.items():
+        before = baseline.get("routes", {}).get(label)
+        if not before or "p95_ms" not in before or "p95_ms" not in result:
+            continue
+        if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + threshold / 100):
+            regressions.append({"route": label, "metric": "p95_ms", "before": before["p95_ms"], "after": result["p95_ms"]})
+        if result["requests_per_second"] < before["requests_per_second"] * (1 - threshold / 100):
+            regressions.append({"route": label, "metric": "requests_per_second",
+                                "before": before["requests_per_second"], "after": result["requests_per_second"]})
+    return regressions
+
+
+def bench_suite(args):
+    routes = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    report = {
+        "revision": git_revision(),
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "target": args.url or ("in-memory" if args.in_memory else "in-process"),
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "routes": routes,
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            report["regressions"] = compare(routes, json.load(baseline), args.threshold)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    return report
+
+
+def serve(port, in_memory, products):
+    # Server process of the live and auth-flood benchmarks: uvicorn with one worker, seeded
+    # with synthetic products when the database is empty
+    from contextlib import asynccontextmanager
+
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    if in_memory:
+        use_in_memory_database()
+    import server
+    import uvicorn
+
+    app_lifespan = server.app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with app_lifespan(app):
+            if await server.db.products.count_documents({}) == 0:
+                await seed_catalog(server.db, products)
+                await server.build_catalog_indexes()
+            yield
+
+    server.app.router.lifespan_context = lifespan
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def process_rss_mb(pid):
+    with open("/proc/%d/status" % pid) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+async def open_stream(host, port, product_ids):
+    # A bare-bones SSE client: one socket, no parser, read until the initial
+    # snapshot has arrived
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((
+        "GET /api/live?products=%s HTTP/1.1\r\nHost: %s\r\nAccept: text/event-stream\r\n\r\n"
+        % (",".join(product_ids), host)
+    ).encode())
+    await reader.readuntil(b"retry: 5000")
+    return reader, writer
+
+
+async def run_live(url, subscribers, per_client, connect_batch, server_pid):
+    host, port = url.split("://", 1)[-1].rstrip("/").split(":")
+    port = int(port)
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        for _ in range(100):
+            try:
+                products = (await client.get("/api/products", params={"limit": 200})).json()
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+        else:
+            raise SystemExit("The server did not come up")
+        ids = [product["id"] for product in products]
+        hot = ids[0]
+        rss_before = process_rss_mb(server_pid) if server_pid else None
+
+        rng = random.Random(42)
+        streams = []
+        started = time.perf_counter()
+        for start in range(0, subscribers, connect_batch):
+            count = min(connect_batch, subscribers - start)
+            streams += await asyncio.gather(*(
+                open_stream(host, port, [hot] + rng.sample(ids[1:], per_client - 1)) for _ in range(count)
+            ))
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(1)
+        rss_after = process_rss_mb(server_pid) if server_pid else None
+
+        # Fan-out: a review on the hot product must reach every subscriber
+        headers = await register_user(client, prefix="live")
+
+        async def receive(reader):
+            await reader.readuntil(b'"average_rating"')
+            return time.perf_counter()
+
+        waiters = [asyncio.create_task(receive(reader)) for reader, _ in streams]
+        published = time.perf_counter()
+        response = await client.post("/api/products/%s/reviews" % hot, headers=headers, json={
+            "user_id": "-", "product_id": "-", "rating": 5, "comment": "benchmark"})
+        response.raise_for_status()
+        done, pending = await asyncio.wait(waiters, timeout=30)
+        delays = [(task.result() - published) * 1000 for task in done]
+        for task in pending:
+            task.cancel()
+        for _, writer in streams:
+            writer.close()
+
+    result = {
+        "subscribers": len(streams),
+        "connect_seconds": round(connect_seconds, 2),
+        "fanout_delivered": len(done),
+        "fanout_p50_ms": round(percentile(delays, 50), 1) if delays else None,
+        "fanout_max_ms": round(max(delays), 1) if delays else None,
+    }
+    if server_pid:
+        result.update(
+            server_rss_before_mb=round(rss_before, 1),
+            server_rss_after_mb=round(rss_after, 1),
+            kb_per_subscriber=round((rss_after - rss_before) * 1024 / len(streams), 1),
+        )
+    return result
+
+
+def bench_live(args):
+    # Every subscriber costs a socket on each side; raise the soft limit to
+    # the hard one (the server process inherits it)
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.url:
+        return asyncio.run(run_live(args.url, args.subscribers, args.products_per_client,
+                                    args.connect_batch, args.server_pid))
+
+    port = args.port
+    command = [sys.executable, "-c", "import benchmark; benchmark.serve(%d, %r, %d)"
+               % (port, args.in_memory, args.products)]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return asyncio.run(run_live("http://127.0.0.1:%d" % port, args.subscribers, args.products_per_client,
+                                    args.connect_batch, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def wait_until_ready(url, workers, started, timeout):
+    # Polls /health/ready on fresh connections (so the kernel hands them to
+    # different workers) until every worker has answered ready. Returns the
+    # seconds since started until the first and the last worker was ready.
+    ready, first = set(), None
+    while time.perf_counter() - started < timeout:
+        try:
+            async with httpx.AsyncClient(base_url=url, timeout=5) as client:
+                response = await client.get("/health/ready")
+            if response.status_code == 200:
+                first = first or time.perf_counter() - started
+                ready.add(response.json()["pid"])
+                if len(ready) >= workers:
+                    return first, time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+    raise SystemExit("%d of %d workers ready after %.0fs" % (len(ready), workers, timeout))
+
+
+def bench_workers(args):
+    # Cold start, throughput and shutdown time of serve.py per worker count.
+    # The load generator is this single process; with many workers it can
+    # become the bottleneck, so compare against --url runs from other hosts.
+    import signal
+
+    url = "http://127.0.0.1:%d" % args.port
+    paths = args.paths or ["/api/products", "/api/categories", "/api/products?featured=true&limit=8"]
+    serve = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+    results = []
+    for count in args.workers:
+        command = [sys.executable, serve, "--workers", str(count), "--port", str(args.port), "--log-level", "warning"]
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=os.path.dirname(serve))
+        try:
+            first, last = asyncio.run(wait_until_ready(url, count, started, args.startup_timeout))
+            load = asyncio.run(run(url, paths, args.concurrency, args.duration))
+        finally:
+            stopping = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        results.append({
+            "workers": count,
+            "first_ready_seconds": round(first, 2),
+            "all_ready_seconds": round(last, 2),
+            "shutdown_seconds": round(time.perf_counter() - stopping, 2),
+            **load,
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    base = results[0]["requests_per_second"]
+    for result in results:
+        result["speedup"] = round(result["requests_per_second"] / base, 2) if base else None
+    return {"cpu_count": os.cpu_count(), "paths": paths, "results": results}
+
+
+async def run_auth_flood(url, flood_rate, flooders, readers, duration):
+    catalog = ["/api/products", "/api/categories", "/api/products?featured=true&limit=8"]
+    limits = httpx.Limits(max_connections=flooders + readers)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        username = "flood-%d" % time.time_ns()
+        response = await client.post("/api/auth/register", json={
+            "username": username, "email": "%s@example.com" % username,
+            "password": "benchmark", "full_name": "Auth Flood",
+        })
+        response.raise_for_status()
+        credentials = {"username": username, "password": "benchmark"}
+        await asyncio.gather(*(client.get(catalog[0]) for _ in range(readers)))
+
+        quiet, quiet_errors = [], []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(worker(client, catalog, deadline, quiet, quiet_errors) for _ in range(readers)))
+
+        # Open loop: flood requests start at a fixed rate whether or not earlier
+        # ones were answered, so both settings get the same offered load
+        rng = random.Random(42)
+        statuses = {}
+
+        async def flood_request(i):
+            headers = {"X-Forwarded-For": "10.%d.%d.%d" % (rng.randrange(256), rng.randrange(256), rng.randrange(256))}
+            try:
+                if i % 2:
+                    response = await client.post("/api/auth/login", data=credentials, headers=headers)
+                else:
+                    name = "flood-%d-%d" % (i, time.time_ns())
+                    response = await client.post("/api/auth/register", headers=headers, json={
+                        "username": name, "email": "%s@example.com" % name,
+                        "password": "benchmark", "full_name": "Auth Flood",
+                    })
+                status = response.status_code
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+
+        async def flood():
+            pending = set()
+            next_start = time.perf_counter()
+            for i in itertools.count():
+                if next_start >= deadline:
+                    break
+                if len(pending) < flooders:
+                    task = asyncio.create_task(flood_request(i))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                else:
+                    statuses["not sent"] = statuses.get("not sent", 0) + 1
+                next_start += 1 / flood_rate
+                await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            await asyncio.gather(*pending)
+
+        flooded, flooded_errors = [], []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(flood(), *(worker(client, catalog, deadline, flooded, flooded_errors) for _ in range(readers)))
+    return {
+        "browse_p50_ms": round(percentile(quiet, 50), 2),
+        "browse_p95_ms": round(percentile(quiet, 95), 2),
+        "browse_requests_per_second": round(len(quiet) / duration, 1),
+        "flooded_browse_p50_ms": round(percentile(flooded, 50), 2),
+        "flooded_browse_p95_ms": round(percentile(flooded, 95), 2),
+        "flooded_browse_requests_per_second": round(len(flooded) / duration, 1),
+        "flooded_browse_errors": len(flooded_errors),
+        "auth_statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def popularity_events(args):
+    # Zipf-distributed product choice over a ranking that drifts: every
+    # five simulated minutes a few products jump to the top, like a launch
+    rng = random.Random(11)
+    ranking = ["product-%d" % i for i in range(args.products)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, args.products + 1)))
+    events = []
+    for i in range(int(args.rate * args.duration)):
+        at = i / args.rate
+        if i % int(args.rate * 300) == 0 and i:
+            for _ in range(3):
+                ranking.insert(0, ranking.pop(rng.randrange(args.products // 10, args.products)))
+        product_id = rng.choices(ranking, cum_weights=cum_weights)[0]
+        roll = rng.random()
+        events.append((at, product_id, "view" if roll < 0.85 else "cart" if roll < 0.95 else "wishlist"))
+    return events
+
+
+async def run_popularity(args):
+    from popularity import PopularityCounter, PopularityScale, POPULARITY_FIELD
+
+    if args.in_memory:
+        import mongomock_motor
+        client = mongomock_motor.AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    collection = client["benchmark_popularity"]["products"]
+    events = popularity_events(args)
+    scale = PopularityScale(0.0, args.half_life_hours * 3600)
+    top = args.top
+
+    results = {"events": len(events), "write_through_updates_per_second": args.rate}
+    for interval in args.intervals:
+        await collection.drop()
+        await collection.insert_many([{"id": "product-%d" % i} for i in range(args.products)])
+        await collection.create_index([(POPULARITY_FIELD, -1), ("id", -1)])
+        now = [0.0]
+        counter = PopularityCounter(lambda: collection, scale, interval, max_pending=args.products + 1,
+                                    clock=lambda: now[0])
+        truth = {}
+        flush_ms, overlaps, errors = [], [], []
+        # Samples fall at random points between flushes, not right after one
+        sampler = random.Random(5)
+        next_flush, pending_events, max_pending = interval, 0, 0
+        next_sample = sampler.uniform(0, 2 * args.sample_seconds)
+        for at, product_id, event in events:
+            while at >= next_flush:
+                started = time.perf_counter()
+                await counter.flush()
+                flush_ms.append((time.perf_counter() - started) * 1000)
+                max_pending, pending_events = max(max_pending, pending_events), 0
+                next_flush += interval
+            while at >= next_sample:
+                expected = [pid for pid, _ in sorted(truth.items(), key=lambda item: -item[1])[:top]]
+                if expected:
+                    ranked = await collection.find({POPULARITY_FIELD: {"$gt": 0}}, {"_id": 0, "id": 1}) \
+                        .sort([(POPULARITY_FIELD, -1), ("id", -1)]).limit(top).to_list(length=top)
+                    overlaps.append(len(set(expected) & {doc["id"] for doc in ranked}) / len(expected))
+                    stored = {doc["id"]: doc.get(POPULARITY_FIELD, 0.0) async for doc in collection.find(
+                        {"id": {"$in": expected}}, {"_id": 0, "id": 1, POPULARITY_FIELD: 1})}
+                    errors.append(sum(truth[pid] - stored.get(pid, 0.0) for pid in expected)
+                                  / sum(truth[pid] for pid in expected))
+                next_sample += sampler.uniform(0, 2 * args.sample_seconds)
+            now[0] = at
+            counter.record(product_id, event)
+            truth[product_id] = truth.get(product_id, 0.0) + scale.weight(event, at)
+            pending_events += 1
+        await counter.flush()
+        results["interval_%gs" % interval] = {
+            "flushes": counter.flushes,
+            "updates_per_second": round(counter.updates / args.duration, 2),
+            "events_per_update": counter.stats()["events_per_update"],
+            "flush_p50_ms": round(percentile(flush_ms, 50), 2),
+            "flush_p99_ms": round(percentile(flush_ms, 99), 2),
+            "top_overlap_mean": round(sum(overlaps) / len(overlaps), 3) if overlaps else None,
+            "top_overlap_min": round(min(overlaps), 3) if overlaps else None,
+            "top_score_error_mean": round(sum(errors) / len(errors), 4) if errors else None,
+            "max_pending_events": max_pending,
+        }
+        print("interval %gs %s" % (interval, json.dumps(results["interval_%gs" % interval])), file=sys.stderr)
+    await collection.drop()
+    return results
+
+
+def bench_popularity(args):
+    if args.in_memory:
+        try:
+            import mongomock_motor  # noqa: F401
+        except ImportError:
+            raise SystemExit("--in-memory needs mongomock-motor: pip install mongomock-motor")
+    args.intervals = args.intervals or [1.0, 10.0, 60.0, 300.0]
+    return asyncio.run(run_popularity(args))
+
+
+def bench_auth_flood(args):
+    if args.url:
+        return asyncio.run(run_auth_flood(args.url, args.flood_rate, args.flooders, args.readers, args.duration))
+
+    url = "http://127.0.0.1:%d" % args.port
+    command = [sys.executable, "-c", "import benchmark; benchmark.serve(%d, %r, %d)"
+               % (args.port, args.in_memory, args.products)]
+    results = {}
+    for enabled in ("false", "true"):
+        server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  env={**os.environ, "ADMISSION_ENABLED": enabled})
+        try:
+            asyncio.run(wait_until_ready(url, 1, time.perf_counter(), 120))
+            results["admission_" + ("on" if enabled == "true" else "off")] = asyncio.run(
+                run_auth_flood(url, args.flood_rate, args.flooders, args.readers, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        print(json.dumps(results), file=sys.stderr)
+    return results
+
+
+def bench_metrics_overhead(args):
+    # Runs the suite in fresh processes with metrics off and on, alternating
+    # so drift (thermal, caches) affects both sides equally
+    samples = {"false": [], "true": []}
+    for _ in range(args.rounds):
+        for enabled in samples:
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                command = [sys.executable, os.path.abspath(__file__), "suite", "--output", output.name,
+                           "--duration", str(args.duration), "--concurrency", str(args.concurrency)]
+                for scenario in args.scenarios:
+                    command += ["--scenario", scenario]
+                if args.in_memory:
+                    command.append("--in-memory")
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                               env={**os.environ, "METRICS_ENABLED": enabled})
+                samples[enabled].append(json.load(output)["routes"])
+
+    routes = {}
+    for label in samples["false"][0]:
+        off = [run[label]["p50_ms"] for run in samples["false"]]
+        on = [run[label]["p50_ms"] for run in samples["true"]]
+        off_p50, on_p50 = percentile(off, 50), percentile(on, 50)
+        routes[label] = {
+            "p50_ms_without": off_p50,
+            "p50_ms_with": on_p50,
+            "overhead_percent": round((on_p50 - off_p50) / off_p50 * 100, 2) if off_p50 else None,
+        }
+    overheads = [route["overhead_percent"] for route in routes.values() if route["overhead_percent"] is not None]
+    return {
+        "rounds": args.rounds,
+        "median_overhead_percent": round(percentile(overheads, 50), 2),
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    http = commands.add_parser("http", help="concurrent requests against a running server")
+    http.add_argument("--url", default="http://localhost:8001")
+    http.add_argument("--path", action="append", dest="paths",
+                      help="Path to request, may be repeated (default: catalog reads)")
+    http.add_argument("--concurrency", type=int, default=128)
+    http.add_argument("--duration", type=float, default=20.0)
+    http.add_argument("--auth", action="store_true", help="send requests as a freshly registered user")
+    http.set_defaults(func=bench_http)
+
+    search = commands.add_parser("search", help="search index build and query latency")
+    search.add_argument("--products", type=int, default=100000)
+    search.add_argument("--queries", type=int, default=500)
+    search.set_defaults(func=bench_search)
+
+    recommendations = commands.add_parser("recommendations", help="co-occurrence build time and memory")
+    recommendations.add_argument("--products", type=int, default=100000)
+    recommendations.add_argument("--entries", type=int, default=1000000, help="wishlist/cart entries")
+    recommendations.add_argument("--top-k", type=int, default=20)
+    recommendations.set_defaults(func=bench_recommendations)
+
+    facets = commands.add_parser("facets", help="facet index build and count latency")
+    facets.add_argument("--products", type=int, default=100000)
+    facets.add_argument("--queries", type=int, default=500)
+    facets.set_defaults(func=bench_facets)
+
+    suggest = commands.add_parser("suggest", help="suggest index build, memory and keystroke latency")
+    suggest.add_argument("--products", type=int, default=100000)
+    suggest.add_argument("--queries", type=int, default=2000)
+    suggest.add_argument("--limit", type=int, default=5)
+    suggest.set_defaults(func=bench_suggest)
+
+    serialize = commands.add_parser("serialize", help="product list serialization cost")
+    serialize.add_argument("--items", type=int, default=100)
+    serialize.add_argument("--iterations", type=int, default=200)
+    serialize.set_defaults(func=bench_serialize)
+
+    storm = commands.add_parser("login-storm", help="catalog latency during a login storm")
+    storm.add_argument("--url", default="http://localhost:8001")
+    storm.add_argument("--logins", type=int, default=50, help="concurrent login clients")
+    storm.add_argument("--readers", type=int, default=50, help="concurrent catalog clients")
+    storm.add_argument("--duration", type=float, default=20.0)
+    storm.set_defaults(func=bench_login_storm)
+
+    cart = commands.add_parser("cart", help="concurrent add-to-cart lost-update check")
+    cart.add_argument("--url", default="http://localhost:8001")
+    cart.add_argument("--requests", type=int, default=500)
+    cart.add_argument("--concurrency", type=int, default=100)
+    cart.set_defaults(func=bench_cart)
+
+    bulk = commands.add_parser("import", help="bulk import/export throughput")
+    bulk.add_argument("--url", default="http://localhost:8001")
+    bulk.add_argument("--username", required=True, help="admin account")
+    bulk.add_argument("--password", required=True)
+    bulk.add_argument("--products", type=int, default=100000)
+    bulk.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="export format")
+    bulk.set_defaults(func=bench_import)
+
+    checkout = commands.add_parser("checkout", help="concurrent checkouts on one hot SKU")
+    checkout.add_argument("--url", default="http://localhost:8001")
+    checkout.add_argument("--username", required=True, help="admin account")
+    checkout.add_argument("--password", required=True)
+    checkout.add_argument("--users", type=int, default=200, help="concurrent buyers")
+    checkout.add_argument("--checkouts", type=int, default=5000)
+    checkout.add_argument("--stock", type=int, default=1000)
+    checkout.set_defaults(func=bench_checkout)
+
+    suite = commands.add_parser("suite", help="end-to-end scenarios with per-route latency and query counts")
+    suite.add_argument("--url", help="benchmark a running server instead of starting the app in-process")
+    suite.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    suite.add_argument("--scenario", action="append", dest="scenarios", choices=list(SCENARIOS),
+                       help="scenario to run (repeatable; default: all)")
+    suite.add_argument("--concurrency", type=int, default=16)
+    suite.add_argument("--duration", type=float, default=10.0, help="seconds per route")
+    suite.add_argument("--products", type=int, default=2000, help="synthetic products for an empty database")
+    suite.add_argument("--output", default="benchmark-results.json")
+    suite.add_argument("--baseline", help="previous --output file to compare against")
+    suite.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    suite.set_defaults(func=bench_suite, scenarios=None)
+
+    live = commands.add_parser("live", help="idle SSE subscribers per worker and fan-out latency")
+    live.add_argument("--url", help="use a running server instead of starting one")
+    live.add_argument("--server-pid", type=int, help="pid of the --url server, to report its memory")
+    live.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    live.add_argument("--port", type=int, default=8011)
+    live.add_argument("--subscribers", type=int, default=5000)
+    live.add_argument("--products-per-client", type=int, default=5)
+    live.add_argument("--connect-batch", type=int, default=200)
+    live.add_argument("--products", type=int, default=2000, help="synthetic products for an empty database")
+    live.set_defaults(func=bench_live)
+
+    workers = commands.add_parser("workers", help="cold start and throughput of serve.py per worker count")
+    workers.add_argument("--workers", type=int, action="append", help="worker count (repeatable; default: 1, 2, 4)")
+    workers.add_argument("--port", type=int, default=8012)
+    workers.add_argument("--path", action="append", dest="paths", help="path to request (repeatable)")
+    workers.add_argument("--concurrency", type=int, default=64)
+    workers.add_argument("--duration", type=float, default=10.0)
+    workers.add_argument("--startup-timeout", type=float, default=120.0)
+    workers.set_defaults(func=bench_workers)
+
+    flood = commands.add_parser("auth-flood", help="browse latency while login and registration are flooded")
+    flood.add_argument("--url", help="use a running server instead of starting one per setting")
+    flood.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    flood.add_argument("--port", type=int, default=8013)
+    flood.add_argument("--flood-rate", type=float, default=200.0, help="login/registration requests started per second")
+    flood.add_argument("--flooders", type=int, default=500, help="most flood requests in flight at once")
+    flood.add_argument("--readers", type=int, default=32, help="concurrent catalog clients")
+    flood.add_argument("--duration", type=float, default=15.0, help="seconds per phase")
+    flood.add_argument("--products", type=int, default=2000, help="synthetic products for an empty database")
+    flood.set_defaults(func=bench_auth_flood)
+
+    popularity = commands.add_parser("popularity", help="popularity flush interval: write load vs accuracy")
+    popularity.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    popularity.add_argument("--interval", type=float, action="append", dest="intervals",
+                            help="flush interval in seconds (repeatable; default: 1, 10, 60, 300)")
+    popularity.add_argument("--products", type=int, default=2000)
+    popularity.add_argument("--rate", type=float, default=20.0, help="events per simulated second")
+    popularity.add_argument("--duration", type=float, default=1800.0, help="simulated seconds")
+    popularity.add_argument("--half-life-hours", type=float, default=0.5,
+                            help="short enough for decay to matter within --duration")
+    popularity.add_argument("--top", type=int, default=20)
+    popularity.add_argument("--sample-seconds", type=float, default=30.0)
+    popularity.set_defaults(func=bench_popularity)
+
+    overhead = commands.add_parser("metrics-overhead", help="request latency with and without metrics")
+    overhead.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    overhead.add_argument("--scenario", action="append", dest="scenarios", choices=list(SCENARIOS),
+                          help="scenario to run (repeatable; default: browse, cart)")
+    overhead.add_argument("--rounds", type=int, default=3)
+    overhead.add_argument("--concurrency", type=int, default=16)
+    overhead.add_argument("--duration", type=float, default=5.0, help="seconds per route")
+    overhead.set_defaults(func=bench_metrics_overhead, scenarios=None)
+
+    args = parser.parse_args()
+    if args.command == "metrics-overhead" and not args.scenarios:
+        args.scenarios = ["browse", "cart"]
+    if args.command == "workers" and not args.workers:
+        args.workers = [1, 2, 4]
+    if args.command == "suite" and not args.scenarios:
+        args.scenarios = list(SCENARIOS)
+    result = args.func(args)
+    print(json.dumps(result, indent=2))
+    if result.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import itertools
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Set, Tuple
+
+
+class TTLCache:
+    # Bounded in-process cache: entries expire after ttl seconds and the least
+    # recently used entry is evicted once maxsize is reached. maxsize=0
+    # disables caching. Not thread-safe; it is only used from the event loop.
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def items(self):
+        # Live (unexpired) entries, without touching LRU order or counters
+        now = time.monotonic()
+        return [(key, value) for key, (expires, value) in self._data.items() if expires > now]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    headers: Dict[str, str]
+    etag: str
+    last_modified: float
+
+
+class CacheBackend:
+    # Storage interface for cached responses. Entries carry tags, and
+    # invalidate() drops every entry with any of the given tags; backends
+    # shared between workers must propagate that to all of them.
+    # generation(tags) identifies the last invalidation of each tag: an
+    # entry built from data read after taking it is passed to set() with it,
+    # and dropped if a tag was invalidated while the entry was being built.
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    def generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CachedResponse, tags: Iterable[str], generation: Optional[Tuple[int, ...]] = None):
+        raise NotImplementedError
+
+    def invalidate(self, tags: Iterable[str]):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    # Per-process backend: a TTLCache of responses plus a tag -> keys index.
+    # Invalidations are stamped from one increasing counter, so a stamp
+    # forgotten by the bounded stamp cache can only make set() skip an entry,
+    # never accept one built before an invalidation.
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tags: Dict[str, Set[str]] = defaultdict(set)
+        self._invalidated = TTLCache(maxsize=4 * max(maxsize, 1), ttl=ttl)
+        self._stamps = itertools.count(1)
+        self.stale_sets = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self._entries.get(key)
+
+    def generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._invalidated.get(tag, 0) for tag in tags)
+
+    def set(self, key: str, entry: CachedResponse, tags: Iterable[str], generation: Optional[Tuple[int, ...]] = None):
+        tags = list(tags)
+        if generation is not None and self.generation(tags) != generation:
+            self.stale_sets += 1
+            return
+        self._entries.set(key, entry)
+        for tag in tags:
+            keys = self._tags[tag]
+            keys.add(key)
+            # Keys evicted by LRU/TTL stay in the tag index until the tag is
+            # invalidated; prune them before the index outgrows the cache
+            if len(keys) > 2 * max(self._entries.maxsize, 1):
+                live = {live_key for live_key, _ in self._entries.items()}
+                keys &= live
+
+    def invalidate(self, tags: Iterable[str]):
+        for tag in tags:
+            self._invalidated.set(tag, next(self._stamps))
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key)
+
+    def stats(self) -> dict:
+        stats = self._entries.stats()
+        stats["stale_sets"] = self.stale_sets
+        stats["memory_bytes"] = sum(
+            len(key) + len(entry.body) + sum(len(k) + len(v) for k, v in entry.headers.items())
+            for key, entry in self._entries.items()
+        )
+        return stats
@@ -0,0 +1,140 @@
+import codecs
+import csv
+import io
+from typing import AbstractSet, AsyncIterator, Iterable, Iterator, List, Tuple, Union
+
+import orjson
+
+IMPORT_FORMATS = ("ndjson", "csv")
+# List fields are written as "PC|Xbox" in CSV files
+CSV_LIST_SEPARATOR = "|"
+CSV_LIST_FIELDS = {"platform", "genre"}
+CSV_JSON_FIELDS = {"rating_histogram"}
+# Streamed exports are flushed in chunks of about this many bytes
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def detect_format(filename: str, requested: str = None) -> str:
+    if requested:
+        return requested
+    return "csv" if (filename or "").lower().endswith(".csv") else "ndjson"
+
+
+def _csv_to_row(record: dict, text_fields: AbstractSet[str]) -> dict:
+    # An empty cell is an empty string in a text field and an empty list in
+    # a list field, so exported rows import unchanged; elsewhere it means the
+    # value is missing (a new id, a default)
+    row = {}
+    for key, value in record.items():
+        if key is None or value is None:
+            continue
+        if key in CSV_LIST_FIELDS:
+            row[key] = [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+        elif value == "":
+            if key in text_fields:
+                row[key] = value
+        elif key in CSV_JSON_FIELDS:
+            row[key] = orjson.loads(value)
+        else:
+            row[key] = value
+    return row
+
+
+class _NotUTF8(ValueError):
+    pass
+
+
+def _text_lines(binary_file) -> Iterator[str]:
+    # Decodes line by line, so a line that is not UTF-8 is reported with its
+    # number instead of failing the chunk of the file around it
+    for number, line in enumerate(binary_file, start=1):
+        try:
+            yield line.decode("utf-8-sig" if number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            raise _NotUTF8(number)
+
+
+def read_rows(binary_file, fmt: str,
+              text_fields: AbstractSet[str] = frozenset()) -> Iterator[Tuple[int, Union[dict, str]]]:
+    # Yields (line number, row) for each record, or (line number, error
+    # message) for records that cannot be parsed. The file is read
+    # incrementally, so memory does not grow with its size. text_fields are
+    # the CSV columns whose empty cells are kept as "".
+    if fmt == "csv":
+        reader = csv.DictReader(_text_lines(binary_file))
+        while True:
+            try:
+                record = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as exc:
+                yield reader.line_num, f"Invalid CSV: {exc}"
+                break
+            except _NotUTF8 as exc:
+                yield exc.args[0], "Not UTF-8 text; the rest of the file was not read"
+                break
+            try:
+                yield reader.line_num, _csv_to_row(record, text_fields)
+            except orjson.JSONDecodeError as exc:
+                yield reader.line_num, f"Invalid JSON value: {exc}"
+    else:
+        for number, line in enumerate(binary_file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = orjson.loads(line[3:] if number == 1 and line.startswith(codecs.BOM_UTF8) else line)
+            except orjson.JSONDecodeError as exc:
+                # orjson only accepts UTF-8, so this covers other encodings
+                yield number, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield number, "Expected a JSON object"
+                continue
+            yield number, row
+
+
+async def _chunked(lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for line in lines:
+        buffer += line
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _ndjson_lines(cursor) -> AsyncIterator[bytes]:
+    async for doc in cursor:
+        yield orjson.dumps(doc) + b"\n"
+
+
+async def _csv_lines(cursor, fields: List[str]) -> AsyncIterator[bytes]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def render(values: Iterable) -> bytes:
+        out.seek(0)
+        out.truncate()
+        writer.writerow(values)
+        return out.getvalue().encode()
+
+    yield render(fields)
+    async for doc in cursor:
+        values = []
+        for field in fields:
+            value = doc.get(field)
+            if field in CSV_LIST_FIELDS:
+                value = CSV_LIST_SEPARATOR.join(value or [])
+            elif field in CSV_JSON_FIELDS:
+                value = orjson.dumps(value or {}).decode()
+            elif hasattr(value, "isoformat"):
+                value = value.isoformat()
+            values.append("" if value is None else value)
+        yield render(values)
+
+
+def export_stream(cursor, fmt: str, fields: List[str]) -> AsyncIterator[bytes]:
+    # Streams the cursor as NDJSON or CSV without materializing the result
+    lines = _csv_lines(cursor, fields) if fmt == "csv" else _ndjson_lines(cursor)
+    return _chunked(lines)
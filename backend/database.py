@@ -0,0 +1,40 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+
+
+class Database:
+    # Holds the Motor client for the running process. The client is created
+    # inside the FastAPI lifespan (never at import time) so every worker
+    # process and event loop gets its own connection pool.
+    def __init__(self):
+        self.client = None
+        self._db = None
+
+    async def connect(self, url: str, name: str, **options):
+        self.client = AsyncIOMotorClient(url, **options)
+        self._db = self.client[name]
+        # Fail fast at startup instead of on the first request
+        await self.client.admin.command("ping")
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self._db = None
+
+    @property
+    def connected(self) -> bool:
+        return self._db is not None
+
+    def __getattr__(self, name: str):
+        # Collections are resolved lazily: db.users, db.products, ...
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str):
+        if self._db is None:
+            raise RuntimeError("Database is not connected")
+        return self._db[name]
+
+
+db = Database()
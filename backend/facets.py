@@ -0,0 +1,175 @@
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Fields counted by /api/products/facets; list fields count every value
+FACET_FIELDS = ("platform", "genre", "category_id", "rating")
+# Price ranges shown in the sidebar: (min inclusive, max exclusive or None)
+PRICE_BUCKETS = [(0, 10), (10, 20), (20, 30), (30, 50), (50, 70), (70, None)]
+FACET_PROJECTION = {"_id": 0, "id": 1, "price": 1, "featured": 1, **{field: 1 for field in FACET_FIELDS}}
+
+
+def _mask(slots: Iterable[int], size: int) -> int:
+    # Builds a bitmask in O(len(slots) + size / 8) instead of one
+    # big-int OR per slot
+    bits = bytearray((size + 7) // 8)
+    for slot in slots:
+        bits[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _price_bucket(price: float) -> int:
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        if price >= low and (high is None or price < high):
+            return index
+    return 0
+
+
+class FacetIndex:
+    # In-process facet counts over the catalog. Every product gets a slot
+    # and every facet value a bitmask (a Python int) of the slots that have
+    # it, so a count is an AND of a few masks and a popcount. Products are
+    # added, replaced and removed one at a time from the catalog hooks.
+    def __init__(self):
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._all = 0
+        self._masks: Dict[str, Dict] = defaultdict(dict)
+        self._doc_keys: Dict[str, List[Tuple[str, object]]] = {}
+        # Whole-euro price -> {slot: price}, for exact price range filters
+        self._prices: Dict[int, Dict[int, float]] = defaultdict(dict)
+        self._doc_prices: Dict[str, float] = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _keys(product: dict) -> List[Tuple[str, object]]:
+        keys = []
+        for field in FACET_FIELDS:
+            value = product.get(field)
+            for item in (value if isinstance(value, list) else [value]):
+                if item is not None and item != "":
+                    keys.append((field, item))
+        if product.get("featured"):
+            keys.append(("featured", True))
+        price = product.get("price")
+        if price is not None:
+            keys.append(("price_bucket", _price_bucket(price)))
+            keys.append(("price", math.floor(price)))
+        return keys
+
+    def build(self, products: Iterable[dict]):
+        self.clear()
+        slots_by_key: Dict[Tuple[str, object], List[int]] = defaultdict(list)
+        for slot, product in enumerate(products):
+            product_id = product["id"]
+            keys = self._keys(product)
+            self._slots[product_id] = slot
+            self._doc_keys[product_id] = keys
+            for key in keys:
+                slots_by_key[key].append(slot)
+            if product.get("price") is not None:
+                self._prices[math.floor(product["price"])][slot] = product["price"]
+                self._doc_prices[product_id] = product["price"]
+        self._size = len(self._slots)
+        self._all = _mask(range(self._size), self._size)
+        for (field, value), slots in slots_by_key.items():
+            self._masks[field][value] = _mask(slots, self._size)
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        if product_id in self._slots:
+            self.remove(product_id)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._size
+            self._size += 1
+        bit = 1 << slot
+        keys = self._keys(product)
+        for field, value in keys:
+            masks = self._masks[field]
+            masks[value] = masks.get(value, 0) | bit
+        self._slots[product_id] = slot
+        self._doc_keys[product_id] = keys
+        self._all |= bit
+        if product.get("price") is not None:
+            self._prices[math.floor(product["price"])][slot] = product["price"]
+            self._doc_prices[product_id] = product["price"]
+
+    def remove(self, product_id: str):
+        slot = self._slots.pop(product_id, None)
+        if slot is None:
+            return
+        keep = ~(1 << slot)
+        for field, value in self._doc_keys.pop(product_id):
+            masks = self._masks[field]
+            mask = masks[value] & keep
+            if mask:
+                masks[value] = mask
+            else:
+                del masks[value]
+        price = self._doc_prices.pop(product_id, None)
+        if price is not None:
+            self._prices[math.floor(price)].pop(slot, None)
+        self._all &= keep
+        self._free.append(slot)
+
+    def mask_of(self, product_ids: Iterable[str]) -> int:
+        return _mask((self._slots[pid] for pid in product_ids if pid in self._slots), self._size)
+
+    def _price_mask(self, price_min: Optional[float], price_max: Optional[float]) -> int:
+        low = -math.inf if price_min is None else price_min
+        high = math.inf if price_max is None else price_max
+        mask = 0
+        edge_slots = []
+        for euro, euro_mask in self._masks["price"].items():
+            if low <= euro and euro + 1 <= high:
+                mask |= euro_mask
+            elif euro <= high and euro + 1 > low:
+                # Partly inside the range: check each product's exact price
+                edge_slots += [slot for slot, price in self._prices[euro].items() if low <= price <= high]
+        return mask | _mask(edge_slots, self._size) if edge_slots else mask
+
+    def counts(self, filters: Dict[str, Optional[str]], featured: Optional[bool] = None,
+               price_min: Optional[float] = None, price_max: Optional[float] = None,
+               product_ids: Optional[Iterable[str]] = None) -> dict:
+        # Each facet is counted with every filter applied except its own, so
+        # the counts show what selecting another value of it would return.
+        # product_ids restricts the counts (e.g. to search results). Empty
+        # values ("?category=") are no filter, as on /api/products.
+        constraints = {}
+        for field, value in filters.items():
+            if value:
+                constraints[field] = self._masks[field].get(value, 0)
+        if featured is not None:
+            featured_mask = self._masks["featured"].get(True, 0)
+            constraints["featured"] = featured_mask if featured else self._all & ~featured_mask
+        if price_min is not None or price_max is not None:
+            constraints["price"] = self._price_mask(price_min, price_max)
+        universe = self._all if product_ids is None else self.mask_of(product_ids)
+
+        def matching(excluded: Optional[str]) -> int:
+            mask = universe
+            for field, constraint in constraints.items():
+                if field != excluded:
+                    mask &= constraint
+            return mask
+
+        result = {"total": matching(None).bit_count()}
+        for field in FACET_FIELDS:
+            base = matching(field)
+            values = {value: (base & mask).bit_count() for value, mask in self._masks[field].items()}
+            result[field] = dict(sorted(values.items(), key=lambda item: (-item[1], str(item[0]))))
+        base = matching("price")
+        price_masks = self._masks["price_bucket"]
+        result["price"] = [
+            {"min": low, "max": high, "count": (base & price_masks.get(index, 0)).bit_count()}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ]
+        return result
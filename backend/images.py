@@ -0,0 +1,138 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Variant name -> (width, height, crop). Sized for 2x screens: admin table
+# thumbnails (50x50), listing cards (300x400) and the product page (600x800).
+IMAGE_VARIANTS: Dict[str, Tuple[int, int, bool]] = {
+    "thumb": (100, 100, True),
+    "card": (600, 800, True),
+    "large": (1200, 1600, False),
+}
+VARIANT_FORMAT = "WEBP"
+VARIANT_MEDIA_TYPE = "image/webp"
+VARIANT_QUALITY = 80
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ImageError(ValueError):
+    pass
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers never see a partially written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def render_variant(data: bytes, variant: str) -> bytes:
+    width, height, crop = IMAGE_VARIANTS[variant]
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        if crop:
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        return out.getvalue()
+
+
+class ImageStore:
+    # Content-addressed files: originals are stored once under the SHA-256 of
+    # their bytes, and every variant is derived from (hash, variant), so
+    # URLs never change meaning and can be cached forever. Variants are
+    # rendered at upload and re-rendered lazily if missing (e.g. a variant
+    # added later). All methods block; call them from a worker thread.
+    def __init__(self, root: str):
+        self.root = root
+
+    def _original_path(self, digest: str) -> str:
+        return os.path.join(self.root, "originals", digest[:2], digest)
+
+    def _variant_path(self, digest: str, variant: str) -> str:
+        return os.path.join(self.root, "variants", variant, digest[:2], digest + ".webp")
+
+    def save(self, data: bytes) -> str:
+        # Renders every variant before storing anything, so an upload that
+        # fails to decode (corrupt, truncated, oversized) leaves no files
+        digest = hashlib.sha256(data).hexdigest()
+        missing = [variant for variant in IMAGE_VARIANTS if not os.path.exists(self._variant_path(digest, variant))]
+        try:
+            rendered = {variant: render_variant(data, variant) for variant in missing}
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+            raise ImageError("Not a valid image")
+        if not os.path.exists(self._original_path(digest)):
+            _write_atomic(self._original_path(digest), data)
+        for variant, variant_data in rendered.items():
+            _write_atomic(self._variant_path(digest, variant), variant_data)
+        return digest
+
+    def load(self, digest: str, variant: str) -> Optional[Tuple[bytes, str]]:
+        # Returns (bytes, media type), or None for unknown images/variants
+        if not _HASH_RE.match(digest) or (variant != "original" and variant not in IMAGE_VARIANTS):
+            return None
+        try:
+            with open(self._original_path(digest), "rb") as original:
+                if variant == "original":
+                    data = original.read()
+                    with Image.open(io.BytesIO(data)) as image:
+                        return data, Image.MIME.get(image.format, "application/octet-stream")
+                path = self._variant_path(digest, variant)
+                if not os.path.exists(path):
+                    _write_atomic(path, render_variant(original.read(), variant))
+        except FileNotFoundError:
+            return None
+        with open(path, "rb") as rendered:
+            return rendered.read(), VARIANT_MEDIA_TYPE
+
+
+def image_url(digest: str, variant: str = "large") -> str:
+    return f"/api/images/{digest}/{variant}"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Single byte range "bytes=start-end" / "bytes=start-" / "bytes=-suffix";
+    # returns inclusive (start, end), None to serve the whole body, and
+    # raises ValueError when the range cannot be satisfied
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def placeholder_svg(width: int, height: int) -> bytes:
+    label = f"{width}×{height}"
+    font_size = max(8, min(width, height) // 8)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}"><rect width="100%" height="100%" fill="#1e293b"/>'
+        f'<text x="50%" y="50%" fill="#64748b" font-family="sans-serif" font-size="{font_size}" '
+        f'text-anchor="middle" dominant-baseline="middle">{label}</text></svg>'
+    ).encode()
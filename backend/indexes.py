@@ -0,0 +1,178 @@
+"""Index registry for every collection the API queries.
+
+Indexes are applied idempotently at startup (see server.lifespan) or from the
+command line:
+
+    python indexes.py apply    # create any missing index
+    python indexes.py check    # report missing/unused indexes and collection scans
+"""
+import asyncio
+import json
+import logging
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Listing sort keys of /api/products; each is paired with id for keyset pagination
+PRODUCT_SORT_FIELDS = ["title", "price", "average_rating", "release_date", "popularity"]
+
+
+def _product_listing_indexes():
+    indexes = []
+    for field in PRODUCT_SORT_FIELDS:
+        indexes += [
+            IndexModel([(field, ASCENDING), ("id", ASCENDING)]),
+            IndexModel([("category_id", ASCENDING), (field, ASCENDING), ("id", ASCENDING)]),
+            IndexModel([("featured", ASCENDING), (field, ASCENDING), ("id", ASCENDING)]),
+        ]
+    # Unsorted listings page on id alone
+    indexes += [
+        IndexModel([("category_id", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("featured", ASCENDING), ("id", ASCENDING)]),
+    ]
+    return indexes
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        *_product_listing_indexes(),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "wishlists": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "reviews": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("product_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("product_id", ASCENDING), ("rating", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "recommendations": [
+        IndexModel([("product_id", ASCENDING)], unique=True),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel(
+            [("user_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            unique=True, partialFilterExpression={"idempotency_key": {"$type": "string"}},
+        ),
+    ],
+}
+
+# Queries on the request path that must be served by an index:
+# (collection, filter, sort). Values are placeholders; only the shape matters.
+HOT_QUERIES = [
+    ("users", {"username": "?"}, None),
+    ("users", {"$or": [{"username": "?"}, {"email": "?"}]}, None),
+    ("products", {"id": "?"}, None),
+    ("products", {"id": {"$in": ["?"]}}, None),
+    ("products", {}, [("title", ASCENDING), ("id", ASCENDING)]),
+    ("products", {"featured": True}, [("id", ASCENDING)]),
+    ("products", {"category_id": "?"}, [("price", DESCENDING), ("id", DESCENDING)]),
+    ("products", {"price": {"$gte": 0, "$lte": 1}}, [("price", ASCENDING), ("id", ASCENDING)]),
+    ("products", {}, [("popularity", DESCENDING), ("id", DESCENDING)]),
+    ("carts", {"user_id": "?"}, None),
+    ("wishlists", {"user_id": "?"}, None),
+    ("reviews", {"product_id": "?"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("reviews", {"product_id": "?"}, [("rating", DESCENDING), ("id", DESCENDING)]),
+    ("reviews", {"user_id": "?", "product_id": "?"}, None),
+    ("recommendations", {"updated_at": {"$gte": "?"}}, None),
+    ("orders", {"user_id": "?"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    ("orders", {"user_id": "?", "idempotency_key": "?"}, None),
+]
+
+
+async def apply_indexes(database):
+    # create_indexes is a no-op for indexes that already exist with the same
+    # spec; a failure on one collection (e.g. duplicates blocking a unique
+    # index) is logged and does not stop the others
+    created = {}
+    for collection, indexes in INDEXES.items():
+        try:
+            created[collection] = await database[collection].create_indexes(indexes)
+        except OperationFailure as exc:
+            logger.error("Could not create indexes on %s: %s", collection, exc)
+    return created
+
+
+def _plan_stages(plan):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def check_indexes(database):
+    report = {"missing": [], "unused": [], "collection_scans": []}
+
+    for collection, indexes in INDEXES.items():
+        existing = await database[collection].index_information()
+        for index in indexes:
+            name = index.document["name"]
+            if name not in existing:
+                report["missing"].append(f"{collection}.{name}")
+
+        # $indexStats counts accesses since the server (or index) started
+        try:
+            async for stats in database[collection].aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    report["unused"].append(f"{collection}.{stats['name']}")
+        except OperationFailure as exc:
+            logger.warning("$indexStats unavailable for %s: %s", collection, exc)
+
+    for collection, query, sort in HOT_QUERIES:
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = list(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        if "COLLSCAN" in stages:
+            report["collection_scans"].append({
+                "collection": collection,
+                "filter": query,
+                "sort": sort,
+            })
+    return report
+
+
+async def main(command: str):
+    from server import db, MONGO_URL, DB_NAME, MONGO_POOL_OPTIONS
+
+    await db.connect(MONGO_URL, DB_NAME, **MONGO_POOL_OPTIONS)
+    try:
+        if command == "apply":
+            created = await apply_indexes(db)
+            print(json.dumps(created, indent=2))
+        report = await check_indexes(db)
+        print(json.dumps(report, indent=2))
+        return 1 if report["missing"] or report["collection_scans"] else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("apply", "check"):
+        print(__doc__)
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1])))
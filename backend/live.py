@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+import orjson
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Product fields pushed to subscribers when they change
+LIVE_FIELDS = ("price", "in_stock", "average_rating", "total_reviews")
+LIVE_PROJECTION = {"_id": 0, "id": 1, **{field: 1 for field in LIVE_FIELDS}}
+
+Deliver = Callable[[str, dict], None]
+Receive = Callable[[dict], None]
+
+
+class Subscription:
+    # One client's product ids and the changes not sent to it yet. Changes to
+    # the same product are merged, so a slow client holds at most one pending
+    # event per product however often the product changes.
+    __slots__ = ("product_ids", "pending", "closed", "_ready")
+
+    def __init__(self, product_ids: Iterable[str]):
+        self.product_ids = frozenset(product_ids)
+        self.pending: Dict[str, dict] = {}
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def push(self, product_id: str, fields: dict):
+        current = self.pending.get(product_id)
+        if current is None:
+            self.pending[product_id] = dict(fields)
+        else:
+            current.update(fields)
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next_changes(self, timeout: float) -> Dict[str, dict]:
+        # Waits up to timeout seconds; an empty dict means nothing changed
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+class LiveBackend:
+    # Carries product changes between workers. publish() and broadcast()
+    # must not block; start() is given the hub's deliver function, which the
+    # backend calls for every change published by any worker, this one
+    # included, and a receive function for the messages broadcast by the
+    # other workers.
+    async def start(self, deliver: Deliver, receive: Optional[Receive] = None):
+        raise NotImplementedError
+
+    def publish(self, product_id: str, fields: dict):
+        raise NotImplementedError
+
+    def broadcast(self, message: dict):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class MemoryLiveBackend(LiveBackend):
+    # Single worker: changes go straight to this process's subscribers
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver, receive: Optional[Receive] = None):
+        self._deliver = deliver
+
+    def publish(self, product_id: str, fields: dict):
+        if self._deliver is not None:
+            self._deliver(product_id, fields)
+
+    def broadcast(self, message: dict):
+        # There are no other workers to tell
+        pass
+
+
+class MongoLiveBackend(LiveBackend):
+    # Multiple workers: changes are appended to a capped collection that
+    # every worker tails, so each change reaches the subscribers of all of
+    # them. Works on a standalone server (no change streams needed). Changes
+    # published before start() or after stop() reach no one, as with the
+    # memory backend. Broadcast messages go through the same collection,
+    # tagged with the sending worker so it skips its own.
+    # ObjectIds made by different processes are not ordered within a second,
+    # so events carry the time they were written and a reopened cursor
+    # resumes resume_overlap before the newest one seen, skipping events it
+    # already delivered. The overlap also covers clock skew between hosts.
+    def __init__(self, database, collection: str = "live_events", size_bytes: int = 16 * 1024 * 1024,
+                 batch_size: int = 500, resume_overlap: float = 5.0):
+        self.database = database
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.batch_size = batch_size
+        self.resume_overlap = timedelta(seconds=resume_overlap)
+        self.origin = uuid.uuid4().hex
+        self._outbox: Optional[asyncio.Queue] = None
+        self._collection = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, deliver: Deliver, receive: Optional[Receive] = None):
+        collection = self.database[self.collection_name]
+        try:
+            await collection.database.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        self._collection = collection
+        self._outbox = asyncio.Queue()
+        # Taken here rather than in the tail task, so events published as
+        # soon as start() returns are not missed
+        started = datetime.utcnow()
+        self._tasks = [
+            asyncio.create_task(self._write(collection)),
+            asyncio.create_task(self._tail(collection, started, deliver, receive)),
+        ]
+
+    def publish(self, product_id: str, fields: dict):
+        if self._outbox is not None:
+            self._outbox.put_nowait({"product_id": product_id, "fields": fields})
+
+    def broadcast(self, message: dict):
+        if self._outbox is not None:
+            self._outbox.put_nowait({"origin": self.origin, "message": message})
+
+    async def _write(self, collection):
+        # Batches bursts (imports, checkouts) into one insert
+        while True:
+            docs = [await self._outbox.get()]
+            while not self._outbox.empty() and len(docs) < self.batch_size:
+                docs.append(self._outbox.get_nowait())
+            await self._insert(collection, docs)
+
+    @staticmethod
+    async def _insert(collection, docs: List[dict]):
+        written = datetime.utcnow()
+        for doc in docs:
+            doc["ts"] = written
+        try:
+            await collection.insert_many(docs)
+        except PyMongoError:
+            logger.exception("Publishing %d live events failed", len(docs))
+
+    async def _tail(self, collection, started: datetime, deliver: Deliver, receive: Optional[Receive]):
+        # Starts with the events written since start(). A tailable cursor dies
+        # when the collection is empty or the server drops it; it is then
+        # reopened resume_overlap before the newest event seen. Events seen
+        # within the overlap are remembered so none is delivered twice.
+        newest = started
+        seen: Dict[object, datetime] = {}
+        prune_at = 4 * self.batch_size
+        while True:
+            query = {"ts": {"$gte": newest - self.resume_overlap}}
+            try:
+                async for doc in collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT):
+                    if doc["_id"] in seen:
+                        continue
+                    seen[doc["_id"]] = doc["ts"]
+                    newest = max(newest, doc["ts"])
+                    if len(seen) > prune_at:
+                        horizon = newest - self.resume_overlap
+                        seen = {event_id: ts for event_id, ts in seen.items() if ts >= horizon}
+                        prune_at = max(4 * self.batch_size, 2 * len(seen))
+                    if "message" not in doc:
+                        deliver(doc["product_id"], doc["fields"])
+                    elif receive is not None and doc["origin"] != self.origin:
+                        receive(doc["message"])
+            except PyMongoError as exc:
+                logger.warning("Live event cursor failed: %s", exc)
+            await asyncio.sleep(1)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        # Changes still queued are written so the other workers get them
+        outbox, self._outbox = self._outbox, None
+        docs = []
+        while outbox is not None and not outbox.empty():
+            docs.append(outbox.get_nowait())
+        if docs:
+            await self._insert(self._collection, docs)
+
+
+class LiveHub:
+    # In-process pub/sub of product changes: the routes publish through the
+    # backend, and the backend hands every change back to deliver(), which
+    # fans it out to the subscriptions of that product in this worker
+    def __init__(self, backend: LiveBackend):
+        self.backend = backend
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    async def start(self, receive: Optional[Receive] = None):
+        await self.backend.start(self.deliver, receive)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def publish(self, product_id: str, fields: dict):
+        self.backend.publish(product_id, fields)
+
+    def broadcast(self, message: dict):
+        self.backend.broadcast(message)
+
+    def deliver(self, product_id: str, fields: dict):
+        for subscription in self._subscribers.get(product_id, ()):
+            subscription.push(product_id, fields)
+
+    def subscribe(self, product_ids: Iterable[str]) -> Subscription:
+        subscription = Subscription(product_ids)
+        for product_id in subscription.product_ids:
+            self._subscribers.setdefault(product_id, set()).add(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for product_id in subscription.product_ids:
+            subscribers = self._subscribers.get(product_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[product_id]
+        self._count -= 1
+
+    def close_all(self):
+        # Ends every open stream (e.g. before a worker shuts down); clients
+        # reconnect, to another worker if this one stopped accepting
+        for subscribers in list(self._subscribers.values()):
+            for subscription in subscribers:
+                subscription.close()
+
+    def stats(self) -> dict:
+        return {"subscriptions": self._count, "products": len(self._subscribers)}
+
+
+def sse_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+async def event_stream(hub: LiveHub, product_ids: List[str], load_current: Callable[[], Awaitable[List[dict]]],
+                       heartbeat: float):
+    # Server-Sent Events for one client. It subscribes before reading the
+    # current values, so nothing that changes in between is lost, and sends
+    # those values first, so a reconnecting client catches up. Comments are
+    # sent while idle to keep proxies from closing the connection.
+    subscription = hub.subscribe(product_ids)
+    try:
+        yield b"retry: 5000\n\n" + b"".join(
+            sse_event("product", product) for product in await load_current()
+        )
+        while True:
+            changes = await subscription.next_changes(heartbeat)
+            if subscription.closed:
+                return
+            if not changes:
+                yield b": ping\n\n"
+                continue
+            yield b"".join(sse_event("product", {"id": product_id, **fields}) for product_id, fields in changes.items())
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cached hits (sub-millisecond) through slow bcrypt logins
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s counter" % self.name]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append("%s%s %s" % (self.name, _format_labels(self.labels, labels), value))
+        return lines
+
+
+class Histogram:
+    # Fixed-bucket histogram per label set. Bucket counts are stored
+    # non-cumulatively and summed at render time, so observe() is one bisect
+    # and two additions.
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append("%s_bucket%s %d" % (self.name, _format_labels(self.labels, labels, le), cumulative))
+            lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labels, labels), total))
+            lines.append("%s_count%s %d" % (self.name, _format_labels(self.labels, labels), cumulative))
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route"))
+REQUESTS = Counter(
+    "http_requests_total", "Requests by route template and status code", ("method", "route", "status"))
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection"))
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection"))
+MONGO_SLOW_COMMANDS = Counter(
+    "mongo_slow_commands_total", "MongoDB commands over the slow query threshold", ("command", "collection"))
+REQUEST_MONGO_COMMANDS = Histogram(
+    "http_request_mongo_commands", "MongoDB commands issued per request", ("method", "route"), COUNT_BUCKETS)
+REQUEST_MONGO_DURATION = Histogram(
+    "http_request_mongo_duration_seconds", "Time spent in MongoDB per request", ("method", "route"))
+ADMISSION_REJECTIONS = Counter(
+    "http_admission_rejections_total", "Requests turned away by admission control", ("policy", "reason"))
+POPULARITY_EVENTS = Counter(
+    "popularity_events_total", "Product views, cart adds and wishlist adds counted", ("event",))
+POPULARITY_FLUSHES = Counter(
+    "popularity_flushes_total", "Bulk writes of pending popularity counters")
+
+METRICS = [
+    REQUEST_DURATION, REQUESTS, REQUEST_MONGO_COMMANDS, REQUEST_MONGO_DURATION,
+    MONGO_COMMAND_DURATION, MONGO_COMMAND_FAILURES, MONGO_SLOW_COMMANDS, ADMISSION_REJECTIONS,
+    POPULARITY_EVENTS, POPULARITY_FLUSHES,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+class RequestStats:
+    __slots__ = ("scope", "commands", "mongo_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.commands = 0
+        self.mongo_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+# Motor copies the context into its executor threads, so the command listener
+# sees the RequestStats of the request that issued each command
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (no BaseHTTPMiddleware task overhead). Requests
+    # are labelled with the matched route template, e.g.
+    # /api/products/{product_id}, so label cardinality stays bounded.
+    def __init__(self, app, exclude_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            labels = (scope["method"], stats.route)
+            REQUEST_DURATION.observe(labels, elapsed)
+            REQUESTS.inc(labels + (status,))
+            REQUEST_MONGO_COMMANDS.observe(labels, stats.commands)
+            REQUEST_MONGO_DURATION.observe(labels, stats.mongo_seconds)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    # Records every MongoDB command by command name and collection, adds it
+    # to the current request's totals and logs commands slower than
+    # slow_ms (0 disables slow query logging)
+    IGNORED = {"ping", "hello", "ismaster", "isMaster", "endSessions", "saslStart", "saslContinue"}
+    # Command fields worth logging for a slow query; documents are never logged
+    LOGGED_FIELDS = ("filter", "sort", "pipeline", "q", "limit")
+
+    def __init__(self, slow_ms: float = 100.0):
+        self.slow_ms = slow_ms
+        self._pending: Dict[Tuple, Tuple] = {}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection, command, current_request.get()
+        )
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, command, stats = pending
+        seconds = event.duration_micros / 1e6
+        labels = (event.command_name, collection)
+        MONGO_COMMAND_DURATION.observe(labels, seconds)
+        if failed:
+            MONGO_COMMAND_FAILURES.inc(labels)
+        if stats is not None:
+            stats.commands += 1
+            stats.mongo_seconds += seconds
+        if self.slow_ms and seconds * 1000 >= self.slow_ms:
+            MONGO_SLOW_COMMANDS.inc(labels)
+            logger.warning(
+                "Slow MongoDB %s on %s: %.1f ms (route %s) %s", event.command_name, collection,
+                seconds * 1000, stats.route if stats is not None else "-",
+                {field: command[field] for field in self.LOGGED_FIELDS if field in command},
+            )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
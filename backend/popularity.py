@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from metrics import POPULARITY_EVENTS, POPULARITY_FLUSHES
+
+logger = logging.getLogger(__name__)
+
+# Events counted toward a product's popularity, their weight in the score
+# and the raw counter each one also increments
+EVENT_WEIGHTS = {"view": 1.0, "cart": 5.0, "wishlist": 3.0}
+EVENT_FIELDS = {"view": "activity.views", "cart": "activity.cart_adds", "wishlist": "activity.wishlist_adds"}
+POPULARITY_FIELD = "popularity"
+
+
+def epoch_seconds(value: str) -> float:
+    # "2026-01-01" or a full ISO timestamp, as UTC
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+async def backfill_scores(collection) -> int:
+    # Products stored without a score (written before scores existed or by
+    # other tools) get 0: a keyset cursor on the popular sort compares with
+    # $lt, which never matches a missing field, so they could not be paged to
+    result = await collection.update_many({POPULARITY_FIELD: {"$exists": False}}, {"$set": {POPULARITY_FIELD: 0.0}})
+    return result.modified_count
+
+
+class PopularityScale:
+    # Exponentially decayed popularity kept with $inc alone. An event at time
+    # t adds weight * 2 ** ((t - epoch) / half_life) to the stored score
+    # instead of decaying every stored score as time passes; all scores share
+    # the factor 2 ** ((now - epoch) / half_life), so sorting the stored
+    # values sorts the decayed ones, and decayed() recovers the decayed value.
+    # Stored values double every half-life and reach the float limit after
+    # about 1000 half-lives; rebase() moves the epoch forward well before.
+    def __init__(self, epoch: float, half_life: float):
+        self.epoch = epoch
+        self.half_life = half_life
+
+    def growth(self, at: float) -> float:
+        return 2.0 ** ((at - self.epoch) / self.half_life)
+
+    def weight(self, event: str, at: float) -> float:
+        return EVENT_WEIGHTS[event] * self.growth(at)
+
+    def decayed(self, stored: float, at: float) -> float:
+        return stored / self.growth(at) if stored else 0.0
+
+    async def rebase(self, collection, new_epoch: float) -> int:
+        # Rescales every stored score to new_epoch; run it with the writers
+        # stopped and restart them with the new epoch
+        factor = 2.0 ** ((self.epoch - new_epoch) / self.half_life)
+        result = await collection.update_many({POPULARITY_FIELD: {"$gt": 0}}, {"$mul": {POPULARITY_FIELD: factor}})
+        self.epoch = new_epoch
+        return result.modified_count
+
+
+class PopularityCounter:
+    # Write-behind counters. record() only adds to an in-process map; flush()
+    # writes everything accumulated since the last flush as one unordered
+    # bulk_write of $inc updates, one per product, however many events each
+    # had. Increments commute, so any number of workers can flush into the
+    # same documents. Updates that fail are put back for the next flush; an
+    # error that leaves the outcome unknown (e.g. a lost connection) puts
+    # back everything, which can count a batch twice but never drops it.
+    # Events still pending when a worker dies are lost: at most one
+    # interval's worth.
+    def __init__(self, collection: Callable[[], object], scale: PopularityScale, interval: float,
+                 max_pending: int = 50000, clock: Callable[[], float] = time.time):
+        self.collection = collection
+        self.scale = scale
+        self.interval = interval
+        self.max_pending = max_pending
+        self.clock = clock
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.recorded = 0
+        self.flushes = 0
+        self.updates = 0
+        self.failed = 0
+        self.last_flush_seconds: Optional[float] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def record(self, product_id: str, event: str, count: int = 1):
+        increments = self._pending.get(product_id)
+        if increments is None:
+            increments = self._pending[product_id] = {}
+            if len(self._pending) >= self.max_pending:
+                self._full.set()
+        score = self.scale.weight(event, self.clock()) * count
+        increments[POPULARITY_FIELD] = increments.get(POPULARITY_FIELD, 0.0) + score
+        field = EVENT_FIELDS[event]
+        increments[field] = increments.get(field, 0) + count
+        self.recorded += count
+        POPULARITY_EVENTS.inc((event,), count)
+
+    def _restore(self, batch: Dict[str, Dict[str, float]]):
+        for product_id, increments in batch.items():
+            current = self._pending.setdefault(product_id, {})
+            for field, amount in increments.items():
+                current[field] = current.get(field, 0) + amount
+
+    async def flush(self) -> int:
+        # Returns the number of product updates written
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            self._full.clear()
+            if not batch:
+                return 0
+            product_ids = list(batch)
+            operations = [UpdateOne({"id": product_id}, {"$inc": batch[product_id]}) for product_id in product_ids]
+            started = time.perf_counter()
+            try:
+                await self.collection().bulk_write(operations, ordered=False)
+            except BulkWriteError as exc:
+                failed = [product_ids[error["index"]] for error in exc.details.get("writeErrors", [])]
+                self._restore({product_id: batch[product_id] for product_id in failed})
+                self.failed += len(failed)
+                logger.warning("%d of %d popularity updates failed; retrying them on the next flush",
+                               len(failed), len(operations))
+                written = len(operations) - len(failed)
+            except (Exception, asyncio.CancelledError):
+                self._restore(batch)
+                self.failed += len(operations)
+                raise
+            else:
+                written = len(operations)
+            finally:
+                self.last_flush_seconds = time.perf_counter() - started
+                self.flushes += 1
+            self.updates += written
+            POPULARITY_FLUSHES.inc((), 1)
+            return written
+
+    async def run(self):
+        # Flushes every interval seconds, or sooner once max_pending products
+        # are waiting; cancel it and await flush() to stop
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing popularity counters failed")
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "half_life_hours": round(self.scale.half_life / 3600, 2),
+            "pending_products": self.pending,
+            "recorded_events": self.recorded,
+            "flushes": self.flushes,
+            "updates_written": self.updates,
+            "updates_failed": self.failed,
+            "events_per_update": round(self.recorded / self.updates, 2) if self.updates else None,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2) if self.last_flush_seconds is not None else None,
+        }
+
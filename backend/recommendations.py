@@ -0,0 +1,226 @@
+"""Item-to-item recommendations from cart and wishlist co-occurrence.
+
+Every user's cart and wishlist form one basket. The baskets are a sparse
+user x product matrix X; X.T @ X counts how often two products are wanted
+by the same user, and each product keeps its top-K neighbours by cosine
+similarity in the recommendations collection, which the API serves from
+memory (see Recommendations in server.py):
+
+    python recommendations.py build      # full rebuild
+    python recommendations.py refresh    # only what changed since the last run
+
+The co-occurrence matrix and the baskets it was built from are saved to
+--state, so a refresh only multiplies the baskets that changed and rewrites
+the products in them. Scores of those products inside other products' lists
+are brought up to date by the next full build (e.g. nightly).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne
+from scipy import sparse
+
+DEFAULT_STATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations_state.npz")
+WRITE_BATCH_SIZE = 1000
+TOP_K_CHUNK_ROWS = 10000
+
+
+class CooccurrenceModel:
+    def __init__(self):
+        self.items: List[str] = []
+        self.item_index: Dict[str, int] = {}
+        self.users: List[str] = []
+        self.user_index: Dict[str, int] = {}
+        # users x items, 1 where the product is in the user's cart or wishlist
+        self.baskets = sparse.csr_matrix((0, 0), dtype=np.int32)
+        # items x items co-occurrence counts; the diagonal holds basket counts
+        self.cooccurrence = sparse.csr_matrix((0, 0), dtype=np.int32)
+
+    def _register(self, baskets: Dict[str, Iterable[str]]):
+        for user_id, product_ids in baskets.items():
+            if user_id not in self.user_index:
+                self.user_index[user_id] = len(self.users)
+                self.users.append(user_id)
+            for product_id in product_ids:
+                if product_id not in self.item_index:
+                    self.item_index[product_id] = len(self.items)
+                    self.items.append(product_id)
+
+    def _basket_matrix(self, baskets: Dict[str, Iterable[str]]) -> sparse.csr_matrix:
+        rows, cols = [], []
+        for user_id, product_ids in baskets.items():
+            row = self.user_index[user_id]
+            for product_id in product_ids:
+                rows.append(row)
+                cols.append(self.item_index[product_id])
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+            shape=(len(self.users), len(self.items)),
+        )
+        # A product in both the cart and the wishlist counts once
+        matrix.data[:] = 1
+        return matrix
+
+    def build(self, baskets: Dict[str, Iterable[str]]) -> np.ndarray:
+        self.__init__()
+        self._register(baskets)
+        self.baskets = self._basket_matrix(baskets)
+        self.cooccurrence = (self.baskets.T @ self.baskets).tocsr()
+        return np.arange(len(self.items))
+
+    def update(self, baskets: Dict[str, Iterable[str]]) -> np.ndarray:
+        # Applies the difference between the previous and the current baskets
+        # and returns the items whose co-occurrence counts changed
+        self._register(baskets)
+        shape = (len(self.users), len(self.items))
+        old = self.baskets.copy()
+        old.resize(shape)
+        new = self._basket_matrix(baskets)
+        changed = np.unique((new - old).nonzero()[0])
+        self.baskets = new
+        if not len(changed):
+            return changed
+        old_rows, new_rows = old[changed], new[changed]
+        delta = (new_rows.T @ new_rows - old_rows.T @ old_rows).tocsr()
+        cooccurrence = self.cooccurrence.copy()
+        cooccurrence.resize((shape[1], shape[1]))
+        self.cooccurrence = (cooccurrence + delta).tocsr()
+        self.cooccurrence.eliminate_zeros()
+        # Products in a changed basket get exact new neighbour lists. Their
+        # changed basket counts also shift the cosine scores they have in
+        # other products' lists; those catch up on the next full build.
+        return np.unique(delta.nonzero()[0])
+
+    def top_neighbours(self, rows: Iterable[int], k: int, min_count: int = 1) -> Dict[str, List[Tuple[str, float]]]:
+        rows = np.asarray(rows, dtype=np.int64)
+        norms = np.sqrt(self.cooccurrence.diagonal().astype(np.float64))
+        result = {}
+        # Chunked to bound the temporary arrays on large catalogs
+        for start in range(0, len(rows), TOP_K_CHUNK_ROWS):
+            result.update(self._top_chunk(rows[start:start + TOP_K_CHUNK_ROWS], norms, k, min_count))
+        return result
+
+    def _top_chunk(self, rows: np.ndarray, norms: np.ndarray, k: int, min_count: int) -> dict:
+        # Scores every stored pair of the rows at once, then sorts by
+        # (row, score desc, item) and keeps the first k entries per row
+        matrix = self.cooccurrence[rows].tocsr()
+        lengths = np.diff(matrix.indptr)
+        pair_rows = np.repeat(np.arange(len(rows)), lengths)
+        cols = matrix.indices
+        scores = matrix.data / (norms[rows][pair_rows] * norms[cols])
+        keep = (cols != rows[pair_rows]) & (matrix.data >= min_count)
+        pair_rows, cols, scores = pair_rows[keep], cols[keep], scores[keep]
+
+        order = np.lexsort((cols, -scores, pair_rows))
+        pair_rows, cols, scores = pair_rows[order], cols[order], scores[order]
+        starts = np.searchsorted(pair_rows, np.arange(len(rows)))
+        rank = np.arange(len(pair_rows)) - starts[pair_rows]
+        top = rank < k
+        pair_rows, cols, scores = pair_rows[top], cols[top], np.round(scores[top], 6)
+
+        items = self.items
+        lists = [[] for _ in rows]
+        for pair_row, col, score in zip(pair_rows.tolist(), cols.tolist(), scores.tolist()):
+            lists[pair_row].append((items[col], score))
+        return {items[row]: ranked for row, ranked in zip(rows.tolist(), lists)}
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            items=np.array(self.items, dtype=str), users=np.array(self.users, dtype=str),
+            baskets_indptr=self.baskets.indptr, baskets_indices=self.baskets.indices,
+            cooccurrence_indptr=self.cooccurrence.indptr, cooccurrence_indices=self.cooccurrence.indices,
+            cooccurrence_data=self.cooccurrence.data,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CooccurrenceModel":
+        model = cls()
+        with np.load(path) as state:
+            model.items = state["items"].tolist()
+            model.users = state["users"].tolist()
+            model.item_index = {item: index for index, item in enumerate(model.items)}
+            model.user_index = {user: index for index, user in enumerate(model.users)}
+            shape = (len(model.users), len(model.items))
+            model.baskets = sparse.csr_matrix(
+                (np.ones(len(state["baskets_indices"]), dtype=np.int32),
+                 state["baskets_indices"], state["baskets_indptr"]), shape=shape)
+            model.cooccurrence = sparse.csr_matrix(
+                (state["cooccurrence_data"], state["cooccurrence_indices"], state["cooccurrence_indptr"]),
+                shape=(shape[1], shape[1]))
+        return model
+
+
+async def load_baskets(database) -> Dict[str, set]:
+    baskets: Dict[str, set] = {}
+    for collection in ("carts", "wishlists"):
+        async for doc in database[collection].find({}, {"_id": 0, "user_id": 1, "items.product_id": 1}):
+            product_ids = [item["product_id"] for item in doc.get("items", [])]
+            if product_ids:
+                baskets.setdefault(doc["user_id"], set()).update(product_ids)
+    return baskets
+
+
+async def write_neighbours(database, neighbours: Dict[str, List[Tuple[str, float]]]) -> int:
+    # Stamped per batch so the API's incremental reload (updated_at >= its
+    # last load) sees every batch of a run that is still in progress
+    written = 0
+    items = list(neighbours.items())
+    for start in range(0, len(items), WRITE_BATCH_SIZE):
+        updated_at = datetime.utcnow()
+        await database.recommendations.bulk_write([
+            ReplaceOne({"product_id": product_id}, {
+                "product_id": product_id,
+                "neighbours": [neighbour for neighbour, _ in ranked],
+                "scores": [score for _, score in ranked],
+                "updated_at": updated_at,
+            }, upsert=True)
+            for product_id, ranked in items[start:start + WRITE_BATCH_SIZE]
+        ], ordered=False)
+        written += len(items[start:start + WRITE_BATCH_SIZE])
+    return written
+
+
+async def main(args) -> dict:
+    from server import db, MONGO_URL, DB_NAME, MONGO_POOL_OPTIONS
+
+    await db.connect(MONGO_URL, DB_NAME, **MONGO_POOL_OPTIONS)
+    try:
+        started = time.perf_counter()
+        baskets = await load_baskets(db)
+        loaded = time.perf_counter()
+        if args.command == "refresh" and os.path.exists(args.state):
+            model = CooccurrenceModel.load(args.state)
+            rows = model.update(baskets)
+        else:
+            model = CooccurrenceModel()
+            rows = model.build(baskets)
+        neighbours = model.top_neighbours(rows, args.top_k, args.min_count)
+        computed = time.perf_counter()
+        written = await write_neighbours(db, neighbours)
+        model.save(args.state)
+        return {
+            "baskets": len(baskets),
+            "products": len(model.items),
+            "products_updated": written,
+            "load_seconds": round(loaded - started, 2),
+            "compute_seconds": round(computed - loaded, 2),
+            "write_seconds": round(time.perf_counter() - computed, 2),
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["build", "refresh"])
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--min-count", type=int, default=1, help="minimum co-occurrences for a neighbour")
+    parser.add_argument("--state", default=DEFAULT_STATE)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
@@ -0,0 +1,141 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Fields indexed for /api/products?q=... and how much a match in each counts
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "genre": 2.0,
+    "developer": 1.5,
+    "publisher": 1.5,
+    "description": 1.0,
+}
+SEARCH_PROJECTION = {"_id": 0, "id": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    # Lowercase and strip accents so "Città" matches "citta"
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(normalized)
+
+
+class SearchIndex:
+    # In-process inverted index with BM25 ranking over weighted product fields.
+    # Each posting stores the document's BM25 term weight (everything except
+    # the idf), so a query is one pass over the postings of its terms.
+    # Documents are added, replaced and removed one at a time, so the index is
+    # kept current from the product write routes without full rebuilds.
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_lengths: Dict[str, float] = {}
+        self._total_length = 0.0
+        self._avg_length = 1.0
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def __contains__(self, product_id: str):
+        return product_id in self._doc_lengths
+
+    def build(self, products: Iterable[dict]):
+        # Two passes so every posting is weighted with the final average length
+        self.clear()
+        analyzed = [(product["id"], self._analyze(product)) for product in products]
+        total = sum(sum(frequencies.values()) for _, frequencies in analyzed)
+        self._avg_length = total / len(analyzed) if analyzed else 1.0
+        for product_id, frequencies in analyzed:
+            self._insert(product_id, frequencies)
+
+    def clear(self):
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0.0
+        self._avg_length = 1.0
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        if product_id in self._doc_lengths:
+            self.remove(product_id)
+        frequencies = self._analyze(product)
+        # The new document counts toward the average it is weighted with
+        total = self._total_length + sum(frequencies.values())
+        self._avg_length = total / (len(self._doc_lengths) + 1) or 1.0
+        self._insert(product_id, frequencies)
+
+    def remove(self, product_id: str):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(product_id)
+        self._avg_length = (self._total_length / len(self._doc_lengths) if self._doc_lengths else 0.0) or 1.0
+
+    def _analyze(self, product: dict) -> Dict[str, float]:
+        frequencies: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            value = product.get(field) or ""
+            if isinstance(value, list):
+                value = " ".join(value)
+            for term in tokenize(value):
+                frequencies[term] += weight
+        return frequencies
+
+    def _insert(self, product_id: str, frequencies: Dict[str, float]):
+        length = sum(frequencies.values())
+        # Postings keep the average length current when they were written;
+        # later adds and removes move it slowly, and build() reweights all
+        norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+        for term, tf in frequencies.items():
+            self._postings[term][product_id] = tf * (self.k1 + 1) / (tf + norm)
+        self._doc_terms[product_id] = list(frequencies)
+        self._doc_lengths[product_id] = length
+        self._total_length += length
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        # Returns (product_id, score) pairs, best match first. With limit=None
+        # every matching document is returned.
+        doc_count = len(self._doc_lengths)
+        term_postings = [self._postings[term] for term in set(tokenize(query)) if term in self._postings]
+        if not term_postings or not doc_count:
+            return []
+
+        if len(term_postings) == 1:
+            # A single term ranks by its postings directly; idf is a constant
+            postings = term_postings[0]
+            idf = self._idf(len(postings), doc_count)
+            ranked = self._top(postings, limit)
+            return [(product_id, idf * weight) for product_id, weight in ranked]
+
+        scores: Dict[str, float] = defaultdict(float)
+        for postings in term_postings:
+            idf = self._idf(len(postings), doc_count)
+            for product_id, weight in postings.items():
+                scores[product_id] += idf * weight
+        return self._top(scores, limit)
+
+    @staticmethod
+    def _idf(df: int, doc_count: int) -> float:
+        return math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    @staticmethod
+    def _top(scores: Dict[str, float], limit: Optional[int]) -> List[Tuple[str, float]]:
+        # Both sorts are stable, so equal scores keep a consistent order
+        # between requests and pagination does not repeat or skip results
+        if limit is None:
+            return sorted(scores.items(), key=itemgetter(1), reverse=True)
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
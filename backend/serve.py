@@ -0,0 +1,135 @@
+"""Production entry point: several uvicorn workers sharing one socket.
+
+    LIVE_BACKEND=mongo python serve.py --workers 4 --port 8001
+
+Workers are spawned, not forked, so each imports the app itself and opens its
+own MongoDB pool inside the FastAPI lifespan (see server.lifespan); nothing
+created at import time is shared between processes. Pool sizes and timeouts
+come from the MONGO_* environment variables read by server.py.
+
+A worker reports ready on /health/ready once its indexes are applied, its
+in-process catalog indexes are built and the hottest responses are cached.
+On SIGTERM or SIGINT it reports unavailable, keeps serving for
+--drain-seconds so load balancers can take it out of rotation, ends open
+event streams, and gives in-flight requests up to --graceful-timeout seconds
+to finish before its pools are closed.
+
+The supervisor signals every worker at once and then waits for all of them,
+so stopping takes up to --drain-seconds + --graceful-timeout, plus a moment
+for the final popularity flush, however many workers there are. Keep that
+total a few seconds under the orchestrator's grace period (Kubernetes
+terminationGracePeriodSeconds, 30s by default; docker stop -t, 10s), or
+workers are killed mid-request. The defaults (no drain, 8s graceful timeout)
+fit under both; behind a load balancer, give --drain-seconds its health check
+interval and raise the grace period to cover the sum.
+
+Behind a reverse proxy or load balancer, pass its addresses to
+--forwarded-allow-ips (or FORWARDED_ALLOW_IPS; "*" when only the proxy can
+reach the port). Client addresses are then read from X-Forwarded-For, which
+the per-client rate limits of server.py's admission control depend on;
+otherwise every client shares the proxy's address and its limits.
+
+Each worker holds its own catalog indexes and response cache. With more than
+one worker, set LIVE_BACKEND=mongo: catalog writes are then broadcast to every
+worker, which reindexes the products and drops the cached responses they
+change, and live updates reach the streams held by every worker. Without it
+the workers disagree after a write until their caches expire and they
+restart, so the default is one worker per core only with LIVE_BACKEND=mongo
+and a single worker otherwise.
+"""
+import argparse
+import asyncio
+import copy
+import logging
+import os
+from typing import List, Optional
+
+import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+from uvicorn.supervisors import Multiprocess
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class DrainingSupervisor(Multiprocess):
+    # uvicorn's supervisor stops workers one at a time (terminate, then join),
+    # so N workers took N drains to stop and the later ones kept taking
+    # traffic until their turn; signal them all, then wait for each
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%d]", self.pid)
+
+
+class DrainingServer(uvicorn.Server):
+    def __init__(self, config: uvicorn.Config, drain_seconds: float = 0.0):
+        super().__init__(config)
+        self.drain_seconds = drain_seconds
+
+    async def shutdown(self, sockets: Optional[List] = None):
+        import server
+
+        server.worker_state["ready"] = False
+        if self.drain_seconds > 0 and not self.force_exit:
+            logger.info("Draining for %.1fs before shutdown", self.drain_seconds)
+            await asyncio.sleep(self.drain_seconds)
+        # Event streams never finish on their own; end them so the graceful
+        # shutdown below only waits for ordinary requests
+        server.live_hub.close_all()
+        await super().shutdown(sockets)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    shared = os.getenv("LIVE_BACKEND", "memory") == "mongo"
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1) if shared else "1")),
+                        help="worker processes (default: one per core with LIVE_BACKEND=mongo, else one)")
+    parser.add_argument("--drain-seconds", type=float, default=float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "0")),
+                        help="keep serving while unready before shutting down")
+    parser.add_argument("--graceful-timeout", type=float,
+                        default=float(os.getenv("SHUTDOWN_GRACEFUL_TIMEOUT", "8")),
+                        help="seconds in-flight requests get to finish")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_SECONDS", "5")))
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("LISTEN_BACKLOG", "2048")))
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="proxy addresses trusted to set X-Forwarded-For (comma-separated, or *)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and not shared:
+        logger.warning("%d workers with LIVE_BACKEND=memory: catalog writes and live updates only "
+                       "reach the worker that made them", args.workers)
+
+    # The app's own loggers (startup timings, slow queries) go to the same
+    # stream as uvicorn's
+    log_config = copy.deepcopy(LOGGING_CONFIG)
+    log_config["loggers"][""] = {"handlers": ["default"], "level": args.log_level.upper()}
+
+    config = uvicorn.Config(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        log_config=log_config,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+    server = DrainingServer(config, drain_seconds=args.drain_seconds)
+    if args.workers > 1:
+        sock = config.bind_socket()
+        DrainingSupervisor(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
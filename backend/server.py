@@ -1,19 +1,260 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response, status, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import json_util
+from typing import Optional, List, Dict, Iterable
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
 import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import sys
+import threading
+import time
+import orjson
+import multiprocessing
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlencode, urlsplit
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from database import db
+from search import SearchIndex, SEARCH_PROJECTION
+from cache import TTLCache, CachedResponse, MemoryCacheBackend
+from indexes import apply_indexes
+from catalog_io import IMPORT_FORMATS, detect_format, read_rows, export_stream
+from facets import FacetIndex, FACET_PROJECTION
+from popularity import PopularityCounter, PopularityScale, POPULARITY_FIELD, backfill_scores, epoch_seconds
+from suggest import SuggestIndex, SUGGEST_PROJECTION, SUGGEST_SORTS, SUGGEST_MAX_LIMIT
+from metrics import CommandMetrics, MetricsMiddleware, render_metrics
+from live import LiveHub, MemoryLiveBackend, MongoLiveBackend, LIVE_FIELDS, LIVE_PROJECTION, event_stream
+from admission import AdmissionController, AdmissionMiddleware, AdmissionPolicy, MemoryLimiterStore
+from images import ImageStore, ImageError, IMAGE_VARIANTS, image_url, parse_range, placeholder_svg
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# MongoDB connection
+MONGO_URL = os.getenv("MONGO_URL")
+DB_NAME = os.getenv("DB_NAME", "gaming_ecommerce")
+MONGO_POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "10")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+}
+APPLY_INDEXES_ON_STARTUP = os.getenv("APPLY_INDEXES_ON_STARTUP", "true").lower() == "true"
+
+# Request and MongoDB metrics served at /metrics; commands slower than
+# MONGO_SLOW_QUERY_MS are logged (0 disables the log)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+if METRICS_ENABLED:
+    MONGO_POOL_OPTIONS["event_listeners"] = [CommandMetrics(slow_ms=MONGO_SLOW_QUERY_MS)]
+
+# Sort options for /api/products: name -> (field, direction)
+PRODUCT_SORTS = {
+    "title": ("title", ASCENDING),
+    "price_asc": ("price", ASCENDING),
+    "price_desc": ("price", DESCENDING),
+    "rating": ("average_rating", DESCENDING),
+    "newest": ("release_date", DESCENDING),
+    "popular": (POPULARITY_FIELD, DESCENDING),
+}
+
+# Product fields owned by create_review
+REVIEW_AGGREGATE_FIELDS = {"average_rating", "total_reviews", "rating_histogram"}
+
+# Sort options for product reviews (always descending): name -> field
+REVIEW_SORTS = {
+    "newest": "created_at",
+    "highest": "rating",
+}
+
+# Paths whose cached responses are built before the worker reports ready, so
+# the first visitors after a deploy do not all miss the cache at once
+WARMUP_PATHS = [path for path in os.getenv(
+    "WARMUP_PATHS", "/api/products?sort=title,/api/products?featured=true&limit=8,/api/categories,/api/products/facets"
+).split(",") if path]
+
+# Readiness for load balancers (/health/ready): set once startup and warm-up
+# are done, cleared as soon as shutdown begins (see serve.py)
+worker_state = {"ready": False, "startup_seconds": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    phases = {}
+
+    async def phase(name, step):
+        began = time.perf_counter()
+        await step
+        phases[name] = round(time.perf_counter() - began, 3)
+
+    await phase("connect", db.connect(MONGO_URL, DB_NAME, **MONGO_POOL_OPTIONS))
+    password_hasher.start()
+    if APPLY_INDEXES_ON_STARTUP:
+        await phase("indexes", apply_indexes(db))
+    await phase("popularity", backfill_scores(db.products))
+    await phase("catalog", build_catalog_indexes())
+    await phase("recommendations", recommendation_store.reload())
+    await phase("warmup", warm_response_cache())
+    reloader = asyncio.create_task(reload_recommendations_periodically())
+    flusher = asyncio.create_task(popularity_counter.run())
+    catalog_changes = asyncio.Queue()
+    syncer = asyncio.create_task(apply_catalog_changes(catalog_changes))
+    await live_hub.start(catalog_changes.put_nowait)
+    worker_state.update(ready=True, startup_seconds=round(time.perf_counter() - started, 3))
+    logger.info("Worker %d ready in %.2fs %s", os.getpid(), worker_state["startup_seconds"], phases)
+    yield
+    worker_state["ready"] = False
+    live_hub.close_all()
+    await live_hub.stop()
+    reloader.cancel()
+    flusher.cancel()
+    syncer.cancel()
+    try:
+        await popularity_counter.flush()
+    except Exception:
+        logger.exception("Final popularity flush failed")
+    password_hasher.shutdown()
+    db.close()
+
+app = FastAPI(title="Gaming E-commerce API", version="1.0.0", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
+
+# Security
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+# Resolved users are cached per token subject; USER_CACHE_SIZE=0 disables it
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# Trust the signed id/is_admin claims so most requests need no user lookup.
+# Changes to is_admin then take effect when the token expires.
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# Catalog response cache; RESPONSE_CACHE_SIZE=0 disables it (ETags still work)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+CATALOG_CACHE_CONTROL = "public, max-age=%d" % int(os.getenv("CATALOG_MAX_AGE_SECONDS", "10"))
+
+# Password hashing: cost factor and the worker pool bcrypt runs in.
+# Existing hashes are re-hashed on login when BCRYPT_ROUNDS changes.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # thread | process
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+# Added to the hash workers' nice value, so on busy cores bcrypt gets the CPU
+# time other routes leave over; 0 keeps the workers' priority
+PASSWORD_HASH_NICE = int(os.getenv("PASSWORD_HASH_NICE", "10"))
+
+# How often precomputed recommendations are reloaded; 0 loads them at startup only
+RECOMMENDATIONS_RELOAD_SECONDS = float(os.getenv("RECOMMENDATIONS_RELOAD_SECONDS", "300"))
+
+# Popularity (sort=popular): product views, cart adds and wishlist adds are
+# counted in memory and written every POPULARITY_FLUSH_SECONDS as one bulk
+# $inc, or sooner once POPULARITY_MAX_PENDING products are waiting. An
+# event's weight halves every POPULARITY_HALF_LIFE_HOURS; stored scores are
+# relative to POPULARITY_EPOCH, so moving it needs PopularityScale.rebase()
+POPULARITY_FLUSH_SECONDS = float(os.getenv("POPULARITY_FLUSH_SECONDS", "10"))
+POPULARITY_MAX_PENDING = int(os.getenv("POPULARITY_MAX_PENDING", "50000"))
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "72"))
+POPULARITY_EPOCH = os.getenv("POPULARITY_EPOCH", "2026-01-01")
 
-app = FastAPI(title="Gaming E-commerce API", version="1.0.0")
+# Bulk product import: rows per bulk_write, and how many row errors are listed
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", "1000"))
+
+# /api/batch: sub-requests per batch, and paths it will not run (streams,
+# binary bodies and nested batches)
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_EXCLUDED_PREFIXES = ("/api/batch", "/api/admin/", "/api/images/", "/api/live")
+
+# Live product updates (/api/live). One worker can use the in-process
+# backend; several workers need "mongo" so changes reach all of them.
+LIVE_BACKEND = os.getenv("LIVE_BACKEND", "memory")  # memory | mongo
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "25"))
+LIVE_MAX_PRODUCTS = int(os.getenv("LIVE_MAX_PRODUCTS", "200"))
+
+# Uploaded product images: originals and resized variants live on disk under
+# IMAGE_STORAGE_DIR, addressed by content hash so they can be cached forever
+IMAGE_STORAGE_DIR = os.getenv("IMAGE_STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLACEHOLDER_MAX_SIZE = 2000
+image_store = ImageStore(IMAGE_STORAGE_DIR)
+
+# Admission control: every request is matched to the first of
+# ADMISSION_POLICIES and turned away early, with Retry-After, when its class
+# is over its limits (429 for one client, 503 for the whole worker). Limiter
+# state is per worker, so N workers allow N times the rates below.
+# ADMISSION_ENABLED=false turns it off.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "256"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "2"))
+ADMISSION_LIMITER_KEYS = int(os.getenv("ADMISSION_LIMITER_KEYS", "100000"))
+# Requests per second per client outside auth; 0 = no per-client limit
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))
+# Logins and registrations per client, and per worker. Hashing runs in its
+# own pool, so the worker default is what that pool sustains: one bcrypt hash
+# at 12 rounds takes about 250ms of a core, and each extra round doubles it.
+# Clients are told apart by address; behind a proxy that needs serve.py's
+# --forwarded-allow-ips, or every client shares the proxy's limit.
+PASSWORD_HASHES_PER_SECOND = PASSWORD_HASH_WORKERS * 4 / 2 ** (BCRYPT_ROUNDS - 12)
+AUTH_CLIENT_RATE_PER_MINUTE = float(os.getenv("AUTH_CLIENT_RATE_PER_MINUTE", "20"))
+AUTH_CLIENT_BURST = int(os.getenv("AUTH_CLIENT_BURST", "10"))
+AUTH_RATE_PER_SECOND = float(os.getenv("AUTH_RATE_PER_SECOND", str(PASSWORD_HASHES_PER_SECOND)))
+AUTH_BURST = int(os.getenv("AUTH_BURST", "10"))
+# Uncached review pages and writes run at most this many at a time
+REVIEWS_MAX_CONCURRENCY = int(os.getenv("REVIEWS_MAX_CONCURRENCY", "32"))
+WRITES_MAX_CONCURRENCY = int(os.getenv("WRITES_MAX_CONCURRENCY", "64"))
+
+ADMISSION_POLICIES = [
+    AdmissionPolicy("auth", ("POST",), ("/api/auth/login", "/api/auth/register"), priority="low",
+                    client_rate=AUTH_CLIENT_RATE_PER_MINUTE / 60, client_burst=AUTH_CLIENT_BURST,
+                    route_rate=AUTH_RATE_PER_SECOND, route_burst=AUTH_BURST,
+                    concurrency=PASSWORD_HASH_WORKERS, queue_size=PASSWORD_HASH_QUEUE_SIZE,
+                    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS),
+    # Whole-catalog imports and exports
+    AdmissionPolicy("bulk", ("GET", "POST"), ("/api/admin/products/*",), priority="low", concurrency=2),
+    AdmissionPolicy("reviews", ("GET",), ("/api/products/{product_id}/reviews",),
+                    client_rate=ADMISSION_CLIENT_RATE, concurrency=REVIEWS_MAX_CONCURRENCY,
+                    queue_size=2 * REVIEWS_MAX_CONCURRENCY, queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS),
+    # Cached catalog reads are shed last
+    AdmissionPolicy("catalog", ("GET", "HEAD"), (
+        "/api/products", "/api/products/*", "/api/categories", "/api/bootstrap/*", "/api/images/*", "/api/placeholder/*",
+    ), priority="high", client_rate=ADMISSION_CLIENT_RATE),
+    AdmissionPolicy("batch", ("POST",), ("/api/batch",), priority="high", client_rate=ADMISSION_CLIENT_RATE),
+    AdmissionPolicy("writes", ("POST", "PUT", "PATCH", "DELETE"), ("/api/*",), priority="low",
+                    client_rate=ADMISSION_CLIENT_RATE, concurrency=WRITES_MAX_CONCURRENCY,
+                    queue_size=2 * WRITES_MAX_CONCURRENCY, queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS),
+    AdmissionPolicy("default", ("GET", "HEAD"), ("/api/*",), client_rate=ADMISSION_CLIENT_RATE),
+]
+admission_controller = AdmissionController(
+    ADMISSION_POLICIES, MemoryLimiterStore(ADMISSION_LIMITER_KEYS), ADMISSION_MAX_INFLIGHT,
+    exclude_prefixes=("/api/live", "/health/", "/metrics"),
+)
+
+# Innermost, so rejections still get CORS headers and are counted by the
+# metrics middleware
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
 
 # CORS middleware
 app.add_middleware(
@@ -22,29 +263,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# MongoDB connection
-MONGO_URL = os.getenv("MONGO_URL")
-client = MongoClient(MONGO_URL)
-db = client.gaming_ecommerce
-
-# Collections
-users_collection = db.users
-products_collection = db.products
-categories_collection = db.categories
-carts_collection = db.carts
-wishlists_collection = db.wishlists
-reviews_collection = db.reviews
-orders_collection = db.orders
+class CatalogGZipMiddleware(GZipMiddleware):
+    # Images are already compressed, and gzip would break their byte ranges;
+    # event streams must reach the client unbuffered
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(("/api/images/", "/api/live")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
-# Security
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+# Compress large responses (product lists); GZIP_MINIMUM_SIZE=0 disables it
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+if GZIP_MINIMUM_SIZE > 0:
+    app.add_middleware(CatalogGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+# Outermost, so recorded latency includes compression and CORS handling.
+# Event streams stay open for minutes and would swamp the latency histogram.
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, exclude_paths=("/metrics", "/health/live", "/health/ready", "/api/live"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
 
 # Pydantic Models
 class UserCreate(BaseModel):
@@ -82,6 +325,7 @@ class Product(BaseModel):
     featured: bool = False
     average_rating: float = 0.0
     total_reviews: int = 0
+    rating_histogram: Dict[str, int] = {}
 
 class Category(BaseModel):
     id: Optional[str] = None
@@ -104,13 +348,109 @@ class Review(BaseModel):
     comment: str
     created_at: Optional[datetime] = None
 
+class OrderItem(BaseModel):
+    product_id: str
+    title: str
+    price: float
+    quantity: int
+
+class Order(BaseModel):
+    id: str
+    user_id: str
+    items: List[OrderItem]
+    total: float
+    status: str  # pending while stock is being reserved, then placed
+    created_at: datetime
+
+class BatchRequest(BaseModel):
+    id: Optional[str] = None
+    path: str  # e.g. "/api/products?featured=true&limit=8"
+
+class Batch(BaseModel):
+    requests: List[BatchRequest]
+
+# Projections and defaults for serving trusted database rows directly:
+# only API fields are read, and rows skip Pydantic validation on the way out
+PRODUCT_PROJECTION = {"_id": 0, **{field: 1 for field in Product.model_fields}}
+CATEGORY_PROJECTION = {"_id": 0, **{field: 1 for field in Category.model_fields}}
+PRODUCT_DEFAULTS = {
+    name: field.get_default(call_default_factory=True)
+    for name, field in Product.model_fields.items() if not field.is_required()
+}
+
+def product_row(doc: dict) -> dict:
+    # A projected product document shaped like Product, without validation
+    return {**PRODUCT_DEFAULTS, **doc}
+
 # Utility functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    # Returns (valid, new_hash); new_hash is set when the stored hash uses
+    # an outdated scheme or cost factor
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def lower_worker_priority(niceness: int):
+    # Executor initializer. On Linux the nice value is per thread, so this
+    # leaves the event loop thread at its priority.
+    if niceness <= 0 or not hasattr(os, "setpriority"):
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, min(19, os.getpriority(os.PRIO_PROCESS, tid) + niceness))
+    except OSError:
+        logger.warning("Could not lower the password hash worker priority")
+
+class PasswordHasher:
+    # Runs bcrypt in a thread or process pool so a burst of logins never
+    # blocks the event loop. At most workers + queue_size calls are in
+    # flight; past that, requests are rejected with 503 instead of queueing.
+    def __init__(self, kind: str, workers: int, queue_size: int, niceness: int = 0):
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.niceness = niceness
+        self._executor = None
+        self._slots = None
+
+    def start(self):
+        if self.kind == "process":
+            # spawn, not fork: the parent already runs an event loop and Mongo threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=lower_worker_priority, initargs=(self.niceness,))
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash",
+                                                initializer=lower_worker_priority, initargs=(self.niceness,))
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    async def _run(self, func, *args):
+        if self._slots.locked():
+            raise HTTPException(
+                status_code=503,
+                detail="Too many authentication requests, please retry",
+                headers={"Retry-After": "1"},
+            )
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        return await self._run(verify_and_update_password, password, hashed_password)
+
+password_hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE,
+                                 PASSWORD_HASH_NICE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -121,26 +461,300 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+async def resolve_products(product_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+    # Fetch every referenced product with a single $in query and return them
+    # in the order of product_ids; ids with no matching product are skipped.
+    if not product_ids:
+        return []
+    projection = projection or PRODUCT_PROJECTION
+    unique_ids = list(dict.fromkeys(product_ids))
+    cursor = db.products.find({"id": {"$in": unique_ids}}, projection)
+    products_by_id = {prod["id"]: prod async for prod in cursor}
+    return [products_by_id[pid] for pid in product_ids if pid in products_by_id]
+
+def cart_items_pipeline(changes: List[dict], increment: bool) -> List[dict]:
+    # Update pipeline that applies {product_id, quantity} changes to a cart's
+    # items in one atomic server-side step: quantities of existing items are
+    # incremented (or replaced), new items are appended in request order and
+    # items left with a quantity below 1 are dropped. changes must not be empty.
+    def new_quantity(change: dict):
+        return {"$add": ["$$item.quantity", change["quantity"]]} if increment else change["quantity"]
+    
+    changed_item = {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$$item.product_id", {"$literal": change["product_id"]}]},
+             "then": {"product_id": "$$item.product_id", "quantity": new_quantity(change)}}
+            for change in changes
+        ],
+        "default": "$$item",
+    }}
+    return [
+        {"$set": {"items": {"$ifNull": ["$items", []]}}},
+        {"$set": {"items": {"$concatArrays": [
+            {"$map": {"input": "$items", "as": "item", "in": changed_item}},
+            {"$filter": {"input": {"$literal": changes}, "as": "change",
+                         "cond": {"$not": {"$in": ["$$change.product_id", "$items.product_id"]}}}},
+        ]}}},
+        {"$set": {"items": {"$filter": {"input": "$items", "as": "item",
+                                        "cond": {"$gte": ["$$item.quantity", 1]}}}}},
+    ]
+
+async def upsert_user_doc(collection, user_id: str, update):
+    # Carts and wishlists are unique per user; two first writes racing to
+    # create the document make one upsert fail, and retrying it then updates
+    try:
+        return await collection.update_one({"user_id": user_id}, update, upsert=True)
+    except DuplicateKeyError:
+        return await collection.update_one({"user_id": user_id}, update, upsert=True)
+
+# In-process catalog indexes (full-text search, facet counts, suggestions),
+# kept in sync by the product routes through product_saved/product_deleted,
+# and in the other workers through catalog_changed
+search_index = SearchIndex()
+facet_index = FacetIndex()
+suggest_index = SuggestIndex()
+
+async def build_catalog_indexes():
+    projection = {**SEARCH_PROJECTION, **FACET_PROJECTION, **SUGGEST_PROJECTION}
+    products = await db.products.find({}, projection).to_list(length=None)
+    search_index.build(products)
+    facet_index.build(products)
+    suggest_index.build(products)
+
+def index_product(product_doc: dict):
+    search_index.add(product_doc)
+    facet_index.add(product_doc)
+    suggest_index.add(product_doc)
+
+def unindex_product(product_id: str):
+    search_index.remove(product_id)
+    facet_index.remove(product_id)
+    suggest_index.remove(product_id)
+
+def product_saved(product_doc: dict):
+    index_product(product_doc)
+    catalog_changed(["products", f"product:{product_doc['id']}"], [product_doc["id"]])
+    publish_product_change(product_doc)
+
+def product_deleted(product_id: str):
+    unindex_product(product_id)
+    catalog_changed(["products", f"product:{product_id}"], [product_id])
+    live_hub.publish(product_id, {"deleted": True})
+
+def catalog_changed(tags: Iterable[str], product_ids: Iterable[str] = ()):
+    # Drops the cached responses with these tags here and, with
+    # LIVE_BACKEND=mongo, in every other worker, which first reindexes the
+    # given products (see apply_catalog_changes)
+    response_cache.invalidate(tags)
+    live_hub.broadcast({"tags": list(tags), "products": list(product_ids)})
+
+async def apply_catalog_changes(changes: asyncio.Queue):
+    # Catalog writes made by the other workers, applied in the order they
+    # were made. Products are reread rather than sent, so a message applied
+    # late still indexes the current document, and one that is gone is
+    # removed. Queued messages are applied together with one read.
+    projection = {**SEARCH_PROJECTION, **FACET_PROJECTION, **SUGGEST_PROJECTION}
+    while True:
+        messages = [await changes.get()]
+        while not changes.empty():
+            messages.append(changes.get_nowait())
+        product_ids = {product_id for message in messages for product_id in message["products"]}
+        try:
+            if product_ids:
+                found = await db.products.find({"id": {"$in": list(product_ids)}}, projection).to_list(length=None)
+                for product_doc in found:
+                    index_product(product_doc)
+                for product_id in product_ids - {product_doc["id"] for product_doc in found}:
+                    unindex_product(product_id)
+        except Exception:
+            logger.exception("Reindexing %d products changed by another worker failed", len(product_ids))
+        # After reindexing, so no response is cached from the old indexes
+        response_cache.invalidate({tag for message in messages for tag in message["tags"]})
+
+def publish_product_change(product_doc: dict):
+    fields = {field: product_doc[field] for field in LIVE_FIELDS if field in product_doc}
+    if fields:
+        live_hub.publish(product_doc["id"], fields)
+
+live_hub = LiveHub(MongoLiveBackend(db) if LIVE_BACKEND == "mongo" else MemoryLiveBackend())
+
+class Recommendations:
+    # "Players also wanted" neighbours computed offline by recommendations.py
+    # and held in memory. reload() reads only documents the batch job wrote
+    # since the previous load; ids are interned so the neighbour lists of
+    # every product share one string per product id.
+    def __init__(self):
+        self.neighbours: Dict[str, List[str]] = {}
+        self.loaded_until: Optional[datetime] = None
+
+    def get(self, product_id: str) -> List[str]:
+        return self.neighbours.get(product_id, [])
+
+    async def reload(self) -> int:
+        query = {"updated_at": {"$gte": self.loaded_until}} if self.loaded_until else {}
+        count = 0
+        async for doc in db.recommendations.find(query, {"_id": 0, "product_id": 1, "neighbours": 1, "updated_at": 1}):
+            self.neighbours[sys.intern(doc["product_id"])] = [sys.intern(pid) for pid in doc["neighbours"]]
+            if self.loaded_until is None or doc["updated_at"] > self.loaded_until:
+                self.loaded_until = doc["updated_at"]
+            count += 1
+        if count:
+            response_cache.invalidate(["recommendations"])
+        return count
+
+recommendation_store = Recommendations()
+
+popularity_counter = PopularityCounter(
+    lambda: db.products,
+    PopularityScale(epoch_seconds(POPULARITY_EPOCH), POPULARITY_HALF_LIFE_HOURS * 3600),
+    POPULARITY_FLUSH_SECONDS, POPULARITY_MAX_PENDING,
+)
+
+async def reload_recommendations_periodically():
+    if RECOMMENDATIONS_RELOAD_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(RECOMMENDATIONS_RELOAD_SECONDS)
+        try:
+            await recommendation_store.reload()
+        except Exception:
+            logger.exception("Reloading recommendations failed")
+
+# Cached catalog responses, tagged "categories", "products" (listings) and
+# "product:<id>" (detail) so writes invalidate exactly what they change
+response_cache = MemoryCacheBackend(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+def not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in etags or etag in etags
+
+async def cached_json_response(request: Request, tags: List[str], build) -> Response:
+    # build(response) produces the JSON content; headers it sets on response
+    # (e.g. X-Next-Cursor) are cached along with the body
+    key = request.url.path + "?" + "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    entry = response_cache.get(key)
+    if entry is None:
+        # Not cached if a write invalidates one of the tags during the build
+        generation = response_cache.generation(tags)
+        response = Response()
+        content = await build(response)
+        body = orjson.dumps(content, default=jsonable_encoder)
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+        etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        entry = CachedResponse(body, "application/json", headers, etag, time.time())
+        response_cache.set(key, entry, tags, generation)
+    
+    headers = {
+        **entry.headers,
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+    }
+    if request.headers.get("if-none-match"):
+        if not_modified(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and int(entry.last_modified) <= since:
+            return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+def encode_cursor(kind: str, *values) -> str:
+    # Opaque pagination cursor: url-safe base64 of the sort it belongs to and
+    # the position to resume from (Extended JSON keeps datetimes intact)
+    payload = json_util.dumps([kind, *values]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str, kind: str) -> list:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_kind, *values = json_util.loads(payload)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_kind != kind:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+    return values
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+async def load_user(username: str) -> Optional[dict]:
+    # User records change rarely, so they are served from user_cache for up
+    # to USER_CACHE_TTL_SECONDS. Nothing invalidates an entry: a change made
+    # directly in the database (e.g. granting is_admin) reaches each worker
+    # only once its entry expires. The hash is not cached, so the login
+    # rehash below never leaves an entry stale.
+    user = user_cache.get(username)
+    if user is None:
+        user = await db.users.find_one({"username": username}, {"_id": 0, "hashed_password": 0})
+        if user is not None:
+            user_cache.set(username, user)
+    return user
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = users_collection.find_one({"username": username})
+        raise credentials_exception()
+    if payload.get("sub") is None:
+        raise credentials_exception()
+    return payload
+
+async def get_current_user_record(token: str = Depends(oauth2_scheme)):
+    # The full user record, for routes that return profile fields
+    user = await load_user(decode_token(token)["sub"])
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    # The authenticated principal: id, username and is_admin are all most
+    # routes need, and a token with signed claims carries them already.
+    # Sub-requests of a batch reuse the principal the batch resolved.
+    principal = request.scope.get("principal")
+    if principal is not None:
+        return principal
+    payload = decode_token(token)
+    if AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload:
+        return {"id": payload["uid"], "username": payload["sub"], "is_admin": payload.get("adm", False)}
+    return await get_current_user_record(token)
+
+async def get_optional_user(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    # None for anonymous requests; an invalid token is still rejected
+    if token is None:
+        return None
+    return await get_current_user(request, token)
+
 # Routes
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    if not worker_state["ready"]:
+        return ORJSONResponse({"status": "unavailable", "pid": os.getpid()}, status_code=503)
+    return {"status": "ready", "pid": os.getpid(), "startup_seconds": worker_state["startup_seconds"]}
+
 @app.get("/")
 async def root():
     return {"message": "Gaming E-commerce API"}
@@ -149,12 +763,12 @@ async def root():
 @app.post("/api/auth/register", response_model=UserResponse)
 async def register(user: UserCreate):
     # Check if user exists
-    if users_collection.find_one({"$or": [{"username": user.username}, {"email": user.email}]}):
+    if await db.users.find_one({"$or": [{"username": user.username}, {"email": user.email}]}):
         raise HTTPException(status_code=400, detail="Username or email already registered")
     
     # Create user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     user_doc = {
         "id": user_id,
         "username": user.username,
@@ -164,34 +778,50 @@ async def register(user: UserCreate):
         "is_admin": False,
         "created_at": datetime.utcnow()
     }
-    users_collection.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration of the same username/email
+        raise HTTPException(status_code=400, detail="Username or email already registered")
     
     return UserResponse(**user_doc)
 
 @app.post("/api/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = users_collection.find_one({"username": form_data.username})
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    user = await db.users.find_one({"username": form_data.username})
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(form_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Transparent upgrade to the current cost factor; skipped if the
+        # password changed concurrently
+        await db.users.update_one(
+            {"id": user["id"], "hashed_password": user["hashed_password"]},
+            {"$set": {"hashed_password": new_hash}}
+        )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["username"]}, expires_delta=access_token_expires
+        data={"sub": user["username"], "uid": user["id"], "adm": user.get("is_admin", False)},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/auth/me", response_model=UserResponse)
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
+async def get_current_user_info(current_user: dict = Depends(get_current_user_record)):
     return UserResponse(**current_user)
 
 # Categories Routes
 @app.get("/api/categories", response_model=List[Category])
-async def get_categories():
-    categories = list(categories_collection.find())
-    return [Category(**cat) for cat in categories]
+async def get_categories(request: Request):
+    async def build(response: Response):
+        return await db.categories.find({}, CATEGORY_PROJECTION).to_list(length=None)
+    return await cached_json_response(request, ["categories"], build)
 
 @app.post("/api/categories", response_model=Category)
 async def create_category(category: Category, current_user: dict = Depends(get_current_user)):
@@ -200,14 +830,30 @@ async def create_category(category: Category, current_user: dict = Depends(get_c
     
     category.id = str(uuid.uuid4())
     category_doc = category.dict()
-    categories_collection.insert_one(category_doc)
+    await db.categories.insert_one(category_doc)
+    catalog_changed(["categories"])
     return category
 
 # Products Routes
 @app.get("/api/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, platform: Optional[str] = None, 
+async def get_products(request: Request, category: Optional[str] = None, platform: Optional[str] = None, 
                       genre: Optional[str] = None, featured: Optional[bool] = None,
-                      limit: int = 20, skip: int = 0):
+                      q: Optional[str] = None, sort: Optional[str] = None,
+                      price_min: Optional[float] = None, price_max: Optional[float] = None,
+                      cursor: Optional[str] = None, limit: int = 20, skip: int = 0):
+    async def build(response: Response):
+        return await query_products(response, category, platform, genre, featured, q, sort,
+                                    price_min, price_max, cursor, limit, skip)
+    return await cached_json_response(request, ["products"], build)
+
+async def query_products(response: Response, category: Optional[str] = None, platform: Optional[str] = None,
+                         genre: Optional[str] = None, featured: Optional[bool] = None,
+                         q: Optional[str] = None, sort: Optional[str] = None,
+                         price_min: Optional[float] = None, price_max: Optional[float] = None,
+                         cursor: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[dict]:
+    if sort is not None and sort not in PRODUCT_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort, expected one of: {', '.join(PRODUCT_SORTS)}")
+    
     query = {}
     if category:
         query["category_id"] = category
@@ -217,16 +863,105 @@ async def get_products(category: Optional[str] = None, platform: Optional[str] =
         query["genre"] = {"$in": [genre]}
     if featured is not None:
         query["featured"] = featured
+    if price_min is not None or price_max is not None:
+        query["price"] = {}
+        if price_min is not None:
+            query["price"]["$gte"] = price_min
+        if price_max is not None:
+            query["price"]["$lte"] = price_max
     
-    products = list(products_collection.find(query).skip(skip).limit(limit))
-    return [Product(**prod) for prod in products]
+    if q:
+        # Rank with the search index, then apply the remaining filters in Mongo
+        offset = decode_cursor(cursor, "relevance")[0] if cursor and sort is None else skip
+        if query:
+            ranked_ids = [pid for pid, _ in search_index.search(q)]
+            query["id"] = {"$in": ranked_ids}
+            matching = {doc["id"] async for doc in db.products.find(query, {"_id": 0, "id": 1})}
+            ranked_ids = [pid for pid in ranked_ids if pid in matching]
+        else:
+            top = offset + limit + 1 if sort is None else None
+            ranked_ids = [pid for pid, _ in search_index.search(q, limit=top)]
+        
+        if sort is None:
+            # Relevance order: the cursor carries the offset into the ranking
+            if len(ranked_ids) > offset + limit:
+                response.headers["X-Next-Cursor"] = encode_cursor("relevance", offset + limit)
+            products = await resolve_products(ranked_ids[offset:offset + limit])
+            return [product_row(prod) for prod in products]
+        query = {"id": {"$in": ranked_ids}}
+    
+    # Keyset pagination on (sort key, id): the cursor holds the last row's
+    # key, so every page is an index seek instead of a skip over earlier pages
+    field, direction = PRODUCT_SORTS.get(sort, ("id", ASCENDING))
+    # Sort keys outside the Product model (popularity) are read for the
+    # cursor only; every product is stored with one (see backfill_scores)
+    projection = PRODUCT_PROJECTION if field in PRODUCT_PROJECTION else {**PRODUCT_PROJECTION, field: 1}
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort or "id")
+        op = "$gt" if direction == ASCENDING else "$lt"
+        if field == "id":
+            after = {"id": {op: last_id}}
+        else:
+            after = {"$or": [{field: {op: last_value}}, {field: last_value, "id": {op: last_id}}]}
+        query = {"$and": [query, after]} if query else after
+        skip = 0
+    
+    find = db.products.find(query, projection).sort([(field, direction), ("id", direction)])
+    products = await find.skip(skip).limit(limit).to_list(length=limit)
+    if products and len(products) == limit:
+        last = products[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort or "id", last.get(field), last["id"])
+    if projection is not PRODUCT_PROJECTION:
+        for prod in products:
+            prod.pop(field, None)
+    return [product_row(prod) for prod in products]
+
+# Declared before /api/products/{product_id} so "facets" and "suggest" are
+# not taken for an id
+@app.get("/api/products/facets")
+async def get_product_facets(request: Request, category: Optional[str] = None, platform: Optional[str] = None,
+                             genre: Optional[str] = None, featured: Optional[bool] = None,
+                             q: Optional[str] = None,
+                             price_min: Optional[float] = None, price_max: Optional[float] = None):
+    async def build(response: Response):
+        # Counts for the same filters /api/products accepts, from the facet index
+        product_ids = [pid for pid, _ in search_index.search(q)] if q else None
+        return facet_index.counts(
+            {"category_id": category, "platform": platform, "genre": genre},
+            featured, price_min, price_max, product_ids,
+        )
+    return await cached_json_response(request, ["products"], build)
+
+# Search-as-you-type, answered from the in-memory prefix index
+@app.get("/api/products/suggest")
+async def suggest_products(response: Response, prefix: str = "", limit: int = 5, sort: str = "popular",
+                           fuzzy: bool = False):
+    if sort not in SUGGEST_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sort")
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
+    return suggest_index.suggest(prefix, limit, sort, fuzzy)
 
 @app.get("/api/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = products_collection.find_one({"id": product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+async def get_product(request: Request, product_id: str):
+    async def build(response: Response):
+        product = await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product_row(product)
+    response = await cached_json_response(request, [f"product:{product_id}"], build)
+    # Counted for cache hits and 304s too; missing products raise above
+    popularity_counter.record(product_id, "view")
+    return response
+
+@app.get("/api/products/{product_id}/recommendations", response_model=List[Product])
+async def get_product_recommendations(request: Request, product_id: str, limit: int = 8):
+    limit = max(1, min(limit, 50))
+    async def build(response: Response):
+        # Neighbours deleted from the catalog are skipped by resolve_products
+        products = await resolve_products(recommendation_store.get(product_id)[:limit])
+        return [product_row(prod) for prod in products]
+    return await cached_json_response(request, ["recommendations", "products"], build)
 
 @app.post("/api/products", response_model=Product)
 async def create_product(product: Product, current_user: dict = Depends(get_current_user)):
@@ -235,7 +970,8 @@ async def create_product(product: Product, current_user: dict = Depends(get_curr
     
     product.id = str(uuid.uuid4())
     product_doc = product.dict()
-    products_collection.insert_one(product_doc)
+    await db.products.insert_one({**product_doc, POPULARITY_FIELD: 0.0})
+    product_saved(product_doc)
     return product
 
 @app.put("/api/products/{product_id}", response_model=Product)
@@ -244,175 +980,726 @@ async def update_product(product_id: str, product: Product, current_user: dict =
         raise HTTPException(status_code=403, detail="Admin access required")
     
     product.id = product_id
-    result = products_collection.update_one({"id": product_id}, {"$set": product.dict()})
-    if result.matched_count == 0:
+    # Rating aggregates are maintained by create_review, never by the editor
+    product_doc = product.dict(exclude=REVIEW_AGGREGATE_FIELDS)
+    updated = await db.products.find_one_and_update(
+        {"id": product_id}, {"$set": product_doc},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    product_saved(updated)
+    return Product(**updated)
 
 @app.delete("/api/products/{product_id}")
 async def delete_product(product_id: str, current_user: dict = Depends(get_current_user)):
     if not current_user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    result = products_collection.delete_one({"id": product_id})
+    result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    product_deleted(product_id)
     return {"message": "Product deleted successfully"}
 
 # Cart Routes
 @app.get("/api/cart")
 async def get_cart(current_user: dict = Depends(get_current_user)):
-    cart = carts_collection.find_one({"user_id": current_user["id"]})
+    cart = await db.carts.find_one({"user_id": current_user["id"]})
     if not cart:
-        return {"items": [], "total": 0}
+        return ORJSONResponse({"items": [], "total": 0})
     
-    # Get product details for each cart item
+    # Get product details for all cart items in one query
+    items = cart.get("items", [])
+    products = await resolve_products([item["product_id"] for item in items])
+    products_by_id = {prod["id"]: prod for prod in products}
     items_with_details = []
     total = 0
-    for item in cart.get("items", []):
-        product = products_collection.find_one({"id": item["product_id"]})
+    for item in items:
+        product = products_by_id.get(item["product_id"])
         if product:
             item_total = product["price"] * item["quantity"]
             items_with_details.append({
-                "product": Product(**product),
+                "product": product_row(product),
                 "quantity": item["quantity"],
                 "subtotal": item_total
             })
             total += item_total
     
-    return {"items": items_with_details, "total": total}
+    return ORJSONResponse({"items": items_with_details, "total": total})
 
 @app.post("/api/cart/add")
 async def add_to_cart(item: CartItem, current_user: dict = Depends(get_current_user)):
-    cart = carts_collection.find_one({"user_id": current_user["id"]})
-    
-    if not cart:
-        cart = {"user_id": current_user["id"], "items": []}
-    
-    # Check if item already in cart
-    existing_item = None
-    for cart_item in cart.get("items", []):
-        if cart_item["product_id"] == item.product_id:
-            existing_item = cart_item
-            break
-    
-    if existing_item:
-        existing_item["quantity"] += item.quantity
-    else:
-        cart.setdefault("items", []).append({"product_id": item.product_id, "quantity": item.quantity})
-    
-    carts_collection.update_one(
-        {"user_id": current_user["id"]},
-        {"$set": cart},
-        upsert=True
-    )
+    if item.quantity < 1:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
     
+    await upsert_user_doc(db.carts, current_user["id"], cart_items_pipeline([item.dict()], increment=True))
+    popularity_counter.record(item.product_id, "cart")
     return {"message": "Item added to cart"}
 
 @app.put("/api/cart/update")
 async def update_cart_item(item: CartItem, current_user: dict = Depends(get_current_user)):
-    cart = carts_collection.find_one({"user_id": current_user["id"]})
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
+    if item.quantity < 1:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
     
-    for cart_item in cart.get("items", []):
-        if cart_item["product_id"] == item.product_id:
-            cart_item["quantity"] = item.quantity
-            break
-    else:
+    result = await db.carts.update_one(
+        {"user_id": current_user["id"], "items.product_id": item.product_id},
+        {"$set": {"items.$.quantity": item.quantity}}
+    )
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Item not found in cart")
-    
-    carts_collection.update_one({"user_id": current_user["id"]}, {"$set": cart})
     return {"message": "Cart updated"}
 
 @app.delete("/api/cart/remove/{product_id}")
 async def remove_from_cart(product_id: str, current_user: dict = Depends(get_current_user)):
-    cart = carts_collection.find_one({"user_id": current_user["id"]})
-    if not cart:
+    result = await db.carts.update_one(
+        {"user_id": current_user["id"]},
+        {"$pull": {"items": {"product_id": product_id}}}
+    )
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Cart not found")
-    
-    cart["items"] = [item for item in cart.get("items", []) if item["product_id"] != product_id]
-    carts_collection.update_one({"user_id": current_user["id"]}, {"$set": cart})
     return {"message": "Item removed from cart"}
 
+@app.post("/api/cart/items")
+async def add_cart_items(items: List[CartItem], current_user: dict = Depends(get_current_user)):
+    # Add many items at once; quantities of items already in the cart grow
+    if any(item.quantity < 1 for item in items):
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+    
+    merged = {}
+    for item in items:
+        merged[item.product_id] = merged.get(item.product_id, 0) + item.quantity
+    changes = [{"product_id": pid, "quantity": quantity} for pid, quantity in merged.items()]
+    if changes:
+        await upsert_user_doc(db.carts, current_user["id"], cart_items_pipeline(changes, increment=True))
+    return {"message": "Items added to cart"}
+
+@app.put("/api/cart/items")
+async def set_cart_items(items: List[CartItem], current_user: dict = Depends(get_current_user)):
+    # Set many quantities at once; missing items are added, quantity 0 removes
+    changes = list({item.product_id: item.dict() for item in items}.values())
+    if changes:
+        await upsert_user_doc(db.carts, current_user["id"], cart_items_pipeline(changes, increment=False))
+    return {"message": "Cart updated"}
+
+@app.delete("/api/cart")
+async def clear_cart(current_user: dict = Depends(get_current_user)):
+    await db.carts.update_one({"user_id": current_user["id"]}, {"$set": {"items": []}})
+    return {"message": "Cart cleared"}
+
 # Wishlist Routes
 @app.get("/api/wishlist")
 async def get_wishlist(current_user: dict = Depends(get_current_user)):
-    wishlist = wishlists_collection.find_one({"user_id": current_user["id"]})
+    wishlist = await db.wishlists.find_one({"user_id": current_user["id"]})
     if not wishlist:
-        return {"items": []}
+        return ORJSONResponse({"items": []})
     
-    # Get product details
-    products = []
-    for item in wishlist.get("items", []):
-        product = products_collection.find_one({"id": item["product_id"]})
-        if product:
-            products.append(Product(**product))
-    
-    return {"items": products}
+    # Get product details in one query, keeping wishlist order
+    products = await resolve_products([item["product_id"] for item in wishlist.get("items", [])])
+    return ORJSONResponse({"items": [product_row(product) for product in products]})
 
 @app.post("/api/wishlist/add")
 async def add_to_wishlist(item: WishlistItem, current_user: dict = Depends(get_current_user)):
-    wishlist = wishlists_collection.find_one({"user_id": current_user["id"]})
-    
-    if not wishlist:
-        wishlist = {"user_id": current_user["id"], "items": []}
-    
-    # Check if already in wishlist
-    for wishlist_item in wishlist.get("items", []):
-        if wishlist_item["product_id"] == item.product_id:
-            return {"message": "Item already in wishlist"}
-    
-    wishlist.setdefault("items", []).append({"product_id": item.product_id})
-    wishlists_collection.update_one(
-        {"user_id": current_user["id"]},
-        {"$set": wishlist},
-        upsert=True
+    result = await upsert_user_doc(
+        db.wishlists, current_user["id"], {"$addToSet": {"items": {"product_id": item.product_id}}}
     )
-    
+    if result.modified_count == 0 and result.upserted_id is None:
+        return {"message": "Item already in wishlist"}
+    popularity_counter.record(item.product_id, "wishlist")
     return {"message": "Item added to wishlist"}
 
 @app.delete("/api/wishlist/remove/{product_id}")
 async def remove_from_wishlist(product_id: str, current_user: dict = Depends(get_current_user)):
-    wishlist = wishlists_collection.find_one({"user_id": current_user["id"]})
-    if not wishlist:
+    result = await db.wishlists.update_one(
+        {"user_id": current_user["id"]},
+        {"$pull": {"items": {"product_id": product_id}}}
+    )
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Wishlist not found")
-    
-    wishlist["items"] = [item for item in wishlist.get("items", []) if item["product_id"] != product_id]
-    wishlists_collection.update_one({"user_id": current_user["id"]}, {"$set": wishlist})
     return {"message": "Item removed from wishlist"}
 
 # Reviews Routes
 @app.get("/api/products/{product_id}/reviews", response_model=List[Review])
-async def get_product_reviews(product_id: str):
-    reviews = list(reviews_collection.find({"product_id": product_id}))
+async def get_product_reviews(response: Response, product_id: str, sort: str = "newest",
+                              cursor: Optional[str] = None, limit: int = 20):
+    if sort not in REVIEW_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort, expected one of: {', '.join(REVIEW_SORTS)}")
+    limit = max(1, min(limit, 100))
+    
+    # Keyset pagination on (sort key, id) within the product's reviews
+    field = REVIEW_SORTS[sort]
+    query = {"product_id": product_id}
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort)
+        query["$or"] = [{field: {"$lt": last_value}}, {field: last_value, "id": {"$lt": last_id}}]
+    
+    find = db.reviews.find(query, {"_id": 0}).sort([(field, DESCENDING), ("id", DESCENDING)])
+    reviews = await find.limit(limit).to_list(length=limit)
+    if len(reviews) == limit:
+        last = reviews[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort, last[field], last["id"])
     return [Review(**review) for review in reviews]
 
 @app.post("/api/products/{product_id}/reviews", response_model=Review)
 async def create_review(product_id: str, review: Review, current_user: dict = Depends(get_current_user)):
-    # Check if user already reviewed this product
-    existing_review = reviews_collection.find_one({"user_id": current_user["id"], "product_id": product_id})
-    if existing_review:
-        raise HTTPException(status_code=400, detail="You have already reviewed this product")
+    if not 1 <= review.rating <= 5:
+        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
     review.id = str(uuid.uuid4())
     review.user_id = current_user["id"]
     review.product_id = product_id
     review.created_at = datetime.utcnow()
     
+    # The unique (product_id, user_id) index rejects a second review atomically
     review_doc = review.dict()
-    reviews_collection.insert_one(review_doc)
-    
-    # Update product average rating
-    reviews = list(reviews_collection.find({"product_id": product_id}))
-    avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-    products_collection.update_one(
-        {"id": product_id},
-        {"$set": {"average_rating": avg_rating, "total_reviews": len(reviews)}}
-    )
+    try:
+        await db.reviews.insert_one(review_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="You have already reviewed this product")
+    
+    # Update the product's rating aggregates in one atomic pipeline update, so
+    # concurrent reviews never overwrite each other. Products created before
+    # rating_sum existed derive it from their stored average and count.
+    updated = await db.products.find_one_and_update({"id": product_id}, [
+        {"$set": {
+            "rating_sum": {"$add": [
+                {"$ifNull": ["$rating_sum", {"$multiply": [
+                    {"$ifNull": ["$average_rating", 0]}, {"$ifNull": ["$total_reviews", 0]}
+                ]}]},
+                review.rating,
+            ]},
+            "total_reviews": {"$add": [{"$ifNull": ["$total_reviews", 0]}, 1]},
+            f"rating_histogram.{review.rating}": {
+                "$add": [{"$ifNull": [f"$rating_histogram.{review.rating}", 0]}, 1]
+            },
+        }},
+        {"$set": {"average_rating": {"$divide": ["$rating_sum", "$total_reviews"]}}},
+    ], projection=LIVE_PROJECTION, return_document=ReturnDocument.AFTER)
+    catalog_changed(["products", f"product:{product_id}"], [product_id])
+    if updated is not None:
+        suggest_index.rescore(updated)
+        publish_product_change(updated)
     
     return review
 
+# Order Routes
+ORDER_PROJECTION = {"_id": 0, "idempotency_key": 0}
+
+async def reserve_stock(items: List[dict]) -> Optional[dict]:
+    # Each decrement is guarded by in_stock >= quantity, so concurrent
+    # checkouts can never take stock below zero. On a shortfall the items
+    # already reserved are released and the short item is returned; on an
+    # error they are released before it is raised.
+    if any(item["quantity"] < 1 for item in items):
+        raise ValueError("Cannot reserve a quantity below 1")
+    reserved = []
+    try:
+        for item in items:
+            updated = await db.products.find_one_and_update(
+                {"id": item["product_id"], "in_stock": {"$gte": item["quantity"]}},
+                {"$inc": {"in_stock": -item["quantity"]}},
+                projection={"_id": 0, "id": 1, "in_stock": 1}
+            )
+            if updated is None:
+                await release_stock(reserved)
+                return item
+            # The pre-image is returned; the new level follows from the guard
+            updated["in_stock"] -= item["quantity"]
+            publish_product_change(updated)
+            reserved.append(item)
+    except Exception:
+        await release_stock(reserved)
+        raise
+    stock_changed(reserved)
+    return None
+
+async def release_stock(items: List[dict]):
+    if items:
+        await db.products.bulk_write([
+            UpdateOne({"id": item["product_id"]}, {"$inc": {"in_stock": item["quantity"]}}) for item in items
+        ])
+        released = [item["product_id"] for item in items]
+        async for product in db.products.find({"id": {"$in": released}}, {"_id": 0, "id": 1, "in_stock": 1}):
+            publish_product_change(product)
+        stock_changed(items)
+
+def stock_changed(items: List[dict]):
+    # Listings and details show stock levels
+    catalog_changed(["products", *(f"product:{item['product_id']}" for item in items)])
+
+async def abandon_order(order_id: str, reserved: List[dict]):
+    # Best effort: whatever cannot be undone now is logged for an operator.
+    # If the write marking the order placed did land, the order keeps its stock
+    try:
+        result = await db.orders.delete_one({"id": order_id, "status": "pending"})
+        if not result.deleted_count:
+            return
+    except Exception:
+        logger.exception("Abandoned order %s is still pending", order_id)
+    try:
+        await release_stock(reserved)
+    except Exception:
+        logger.exception("Stock reserved by abandoned order %s was not released: %s", order_id, reserved)
+
+async def replay_order(response: Response, user_id: str, idempotency_key: str) -> Optional[Order]:
+    order = await db.orders.find_one({"user_id": user_id, "idempotency_key": idempotency_key}, ORDER_PROJECTION)
+    if order is None:
+        return None
+    if order["status"] == "pending":
+        raise HTTPException(status_code=409, detail="Checkout already in progress", headers={"Retry-After": "1"})
+    response.headers["Idempotent-Replayed"] = "true"
+    return Order(**order)
+
+@app.post("/api/checkout", response_model=Order)
+async def checkout(response: Response, idempotency_key: Optional[str] = Header(None),
+                   current_user: dict = Depends(get_current_user)):
+    user_id = current_user["id"]
+    # A retried request with the same Idempotency-Key returns the original
+    # order instead of charging the cart again
+    if idempotency_key:
+        order = await replay_order(response, user_id, idempotency_key)
+        if order:
+            return order
+    
+    cart = await db.carts.find_one({"user_id": user_id})
+    cart_items = cart.get("items", []) if cart else []
+    if not cart_items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    # A quantity below 1 would turn the guarded decrement into a restock
+    if any(item.get("quantity", 0) < 1 for item in cart_items):
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+    products = await resolve_products(
+        [item["product_id"] for item in cart_items], {"_id": 0, "id": 1, "title": 1, "price": 1}
+    )
+    products_by_id = {product["id"]: product for product in products}
+    missing = [item["product_id"] for item in cart_items if item["product_id"] not in products_by_id]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Product not available: {missing[0]}")
+    
+    items = [
+        {
+            "product_id": item["product_id"],
+            "title": products_by_id[item["product_id"]]["title"],
+            "price": products_by_id[item["product_id"]]["price"],
+            "quantity": item["quantity"],
+        }
+        for item in cart_items
+    ]
+    order_doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "items": items,
+        "total": round(sum(item["price"] * item["quantity"] for item in items), 2),
+        "status": "pending",
+        "created_at": datetime.utcnow(),
+    }
+    if idempotency_key:
+        order_doc["idempotency_key"] = idempotency_key
+    # The order is recorded as pending before stock is touched; the unique
+    # (user_id, idempotency_key) index makes a concurrent retry lose here
+    try:
+        await db.orders.insert_one(order_doc)
+    except DuplicateKeyError:
+        order = await replay_order(response, user_id, idempotency_key)
+        if order is None:
+            # The racing checkout was short of stock and removed its order
+            raise HTTPException(status_code=409, detail="Checkout did not complete, please retry",
+                                headers={"Retry-After": "1"})
+        return order
+    
+    # Until the order is placed, any failure gives back the stock reserved so
+    # far and removes the pending order, so a retry with the same key starts
+    # over instead of finding it pending forever
+    reserved = False
+    try:
+        short = await reserve_stock(items)
+        if short is None:
+            reserved = True
+            await db.orders.update_one({"id": order_doc["id"]}, {"$set": {"status": "placed"}})
+    except Exception:
+        logger.exception("Checkout of order %s failed", order_doc["id"])
+        await abandon_order(order_doc["id"], items if reserved else [])
+        raise HTTPException(status_code=503, detail="Checkout failed, please retry", headers={"Retry-After": "1"})
+    if short:
+        await db.orders.delete_one({"id": order_doc["id"]})
+        raise HTTPException(status_code=409, detail=f"Not enough stock for {short['title']}")
+    
+    order_doc["status"] = "placed"
+    await db.carts.update_one(
+        {"user_id": user_id},
+        {"$pull": {"items": {"product_id": {"$in": [item["product_id"] for item in items]}}}}
+    )
+    return Order(**order_doc)
+
+@app.get("/api/orders", response_model=List[Order])
+async def get_orders(response: Response, cursor: Optional[str] = None, limit: int = 20,
+                     current_user: dict = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    
+    # Keyset pagination on (created_at, id), newest first
+    query = {"user_id": current_user["id"]}
+    if cursor:
+        last_created, last_id = decode_cursor(cursor, "orders")
+        query["$or"] = [{"created_at": {"$lt": last_created}}, {"created_at": last_created, "id": {"$lt": last_id}}]
+    
+    find = db.orders.find(query, ORDER_PROJECTION).sort([("created_at", DESCENDING), ("id", DESCENDING)])
+    orders = await find.limit(limit).to_list(length=limit)
+    if len(orders) == limit:
+        last = orders[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor("orders", last["created_at"], last["id"])
+    return [Order(**order) for order in orders]
+
+@app.get("/api/orders/{order_id}", response_model=Order)
+async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
+    order = await db.orders.find_one({"id": order_id}, ORDER_PROJECTION)
+    if not order or (order["user_id"] != current_user["id"] and not current_user.get("is_admin")):
+        raise HTTPException(status_code=404, detail="Order not found")
+    return Order(**order)
+
+# Live Update Routes
+@app.get("/api/live")
+async def live_updates(products: str):
+    # Server-Sent Events with the price, stock and rating of the given
+    # products (comma-separated ids) whenever they change
+    product_ids = list(dict.fromkeys(pid for pid in products.split(",") if pid))
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="No products to follow")
+    if len(product_ids) > LIVE_MAX_PRODUCTS:
+        raise HTTPException(status_code=400, detail=f"At most {LIVE_MAX_PRODUCTS} products per stream")
+    
+    async def load_current():
+        return await db.products.find({"id": {"$in": product_ids}}, LIVE_PROJECTION).to_list(length=None)
+    return StreamingResponse(
+        event_stream(live_hub, product_ids, load_current, LIVE_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Batch Routes
+JSON_HEADERS = {"content-type": "application/json"}
+# Sub-response headers passed on in a batch envelope
+BATCH_FORWARDED_HEADERS = ("X-Next-Cursor", "Retry-After")
+
+async def dispatch_get(scope: dict, path: str, principal: Optional[dict], admit: bool = True) -> tuple:
+    # Runs a GET through the router in-process and returns (status, headers,
+    # body): no HTTP exchange, no second token check and no middleware but
+    # admission control, yet the same handlers, response cache and validation
+    # as a direct request. Each sub-request is admitted under the policy of
+    # its own path, so a batch cannot get past a rate or concurrency cap the
+    # same calls made one by one would hit; a rejected one gets its 429/503.
+    url = urlsplit(path)
+    sub_scope = {
+        **{key: value for key, value in scope.items() if key not in ("route", "endpoint", "path_params")},
+        "method": "GET",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": [(name, value) for name, value in scope["headers"] if name == b"authorization"],
+        "principal": principal,
+    }
+    status_code, headers, body = 500, {}, bytearray()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status_code, headers
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            headers = {name.decode().lower(): value.decode() for name, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+
+    handler = app.router
+    if admit and ADMISSION_ENABLED:
+        handler = AdmissionMiddleware(app.router, admission_controller)
+    try:
+        await handler(sub_scope, receive, send)
+    except StarletteHTTPException as exc:
+        return exc.status_code, JSON_HEADERS, orjson.dumps({"detail": exc.detail})
+    except RequestValidationError as exc:
+        return 422, JSON_HEADERS, orjson.dumps({"detail": jsonable_encoder(exc.errors())})
+    except Exception:
+        logger.exception("Batch sub-request %s failed", path)
+        return 500, JSON_HEADERS, orjson.dumps({"detail": "Internal Server Error"})
+    return status_code, headers, bytes(body)
+
+def json_body(headers: dict, body: bytes) -> bytes:
+    # JSON bodies are spliced into the combined response as they are
+    if headers.get("content-type", "").startswith("application/json"):
+        return body or b"null"
+    return orjson.dumps(body.decode("utf-8", "replace"))
+
+def json_object(fields: Dict[str, bytes]) -> bytes:
+    return b"{" + b",".join(orjson.dumps(name) + b":" + value for name, value in fields.items()) + b"}"
+
+async def dispatch_parts(request: Request, paths: Dict[str, str], principal: Optional[dict]) -> Dict[str, tuple]:
+    results = await asyncio.gather(*(dispatch_get(request.scope, path, principal) for path in paths.values()))
+    return dict(zip(paths, results))
+
+async def warm_response_cache():
+    scope = {
+        "type": "http", "http_version": "1.1", "scheme": "http", "server": ("warmup", 80),
+        "client": None, "root_path": "", "headers": [], "app": app,
+    }
+    results = await asyncio.gather(*(dispatch_get(scope, path, None, admit=False) for path in WARMUP_PATHS))
+    for path, (status_code, _, _) in zip(WARMUP_PATHS, results):
+        if status_code != 200:
+            logger.warning("Warm-up of %s returned %d", path, status_code)
+
+@app.post("/api/batch")
+async def run_batch(request: Request, batch: Batch, current_user: Optional[dict] = Depends(get_optional_user)):
+    # Runs read-only sub-requests concurrently, authenticated once
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    for item in batch.requests:
+        if not item.path.startswith("/api/") or item.path.startswith(BATCH_EXCLUDED_PREFIXES):
+            raise HTTPException(status_code=400, detail=f"Path not allowed in a batch: {item.path}")
+    
+    results = await dispatch_parts(
+        request, {str(index): item.path for index, item in enumerate(batch.requests)}, current_user
+    )
+    responses = []
+    for item, (status_code, headers, body) in zip(batch.requests, results.values()):
+        envelope = {"id": item.id, "status": status_code}
+        forwarded = {name: headers[name.lower()] for name in BATCH_FORWARDED_HEADERS if name.lower() in headers}
+        if forwarded:
+            envelope["headers"] = forwarded
+        responses.append(orjson.dumps(envelope)[:-1] + b',"body":' + json_body(headers, body) + b"}")
+    return Response(b'{"responses":[' + b",".join(responses) + b"]}", media_type="application/json")
+
+def bootstrap_response(results: Dict[str, tuple]) -> Response:
+    fields = {}
+    for name, (status_code, headers, body) in results.items():
+        if status_code >= 400:
+            retry_after = headers.get("retry-after")
+            raise HTTPException(status_code=status_code, detail=orjson.loads(body).get("detail"),
+                                headers={"Retry-After": retry_after} if retry_after else None)
+        fields[name] = json_body(headers, body)
+        if "x-next-cursor" in headers:
+            fields[name + "_next_cursor"] = orjson.dumps(headers["x-next-cursor"])
+    return Response(json_object(fields), media_type="application/json")
+
+@app.get("/api/bootstrap/home")
+async def bootstrap_home(request: Request, current_user: Optional[dict] = Depends(get_optional_user)):
+    # Everything the home page renders, in one response
+    paths = {"featured": "/api/products?featured=true&limit=8", "categories": "/api/categories"}
+    return bootstrap_response(await dispatch_parts(request, paths, current_user))
+
+@app.get("/api/bootstrap/products")
+async def bootstrap_products(request: Request, current_user: Optional[dict] = Depends(get_optional_user)):
+    # Everything the products page renders, in one response. Takes the
+    # /api/products query parameters; facets get the ones they understand.
+    params = list(request.query_params.multi_items())
+    facet_params = [(k, v) for k, v in params if k not in ("sort", "cursor", "limit", "skip")]
+    paths = {
+        "products": "/api/products?" + urlencode(params),
+        "facets": "/api/products/facets?" + urlencode(facet_params),
+        "categories": "/api/categories",
+    }
+    if current_user is not None:
+        paths["wishlist"] = "/api/wishlist"
+    return bootstrap_response(await dispatch_parts(request, paths, current_user))
+
+# Admin Routes
+@app.get("/api/admin/cache")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"users": user_cache.stats(), "responses": response_cache.stats(), "suggest": suggest_index.stats()}
+
+@app.get("/api/admin/popularity")
+async def get_popularity_stats(current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return popularity_counter.stats()
+
+@app.get("/api/admin/admission")
+async def get_admission_stats(current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"enabled": ADMISSION_ENABLED, **admission_controller.stats()}
+
+# Product fields where an empty CSV cell is an empty string, not a missing value
+PRODUCT_TEXT_FIELDS = frozenset(name for name, field in Product.model_fields.items() if field.annotation is str)
+
+def format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+def report_import_error(report: dict, row: int, message: str):
+    report["error_count"] += 1
+    if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row, "error": message})
+
+def parse_import_batch(rows, report: dict) -> List[tuple]:
+    # Reads and validates up to IMPORT_BATCH_SIZE rows; runs in a worker
+    # thread so parsing a large file does not stall the event loop
+    batch = []
+    for number, row in rows:
+        report["rows"] += 1
+        if isinstance(row, str):
+            report_import_error(report, number, row)
+            continue
+        try:
+            product = Product.model_validate(row)
+        except ValidationError as exc:
+            report_import_error(report, number, format_validation_error(exc))
+            continue
+        batch.append((number, product))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            break
+    return batch
+
+async def write_import_batch(batch: List[tuple], report: dict):
+    # Upserts on id; rows without one are inserted as new products. Rating
+    # aggregates and popularity are only set on insert so re-imports keep them.
+    operations = []
+    docs = []
+    for _, product in batch:
+        product.id = product.id or str(uuid.uuid4())
+        product_doc = product.dict(exclude=REVIEW_AGGREGATE_FIELDS)
+        aggregates = {**product.dict(include=REVIEW_AGGREGATE_FIELDS), POPULARITY_FIELD: 0.0}
+        operations.append(UpdateOne(
+            {"id": product.id}, {"$set": product_doc, "$setOnInsert": aggregates}, upsert=True
+        ))
+        docs.append(product_doc)
+
+    failed = set()
+    try:
+        result = (await db.products.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as exc:
+        # Unordered: every other row in the batch was still written
+        result = exc.details
+        for error in result["writeErrors"]:
+            failed.add(error["index"])
+            report_import_error(report, batch[error["index"]][0], error["errmsg"])
+
+    report["inserted"] += result["nUpserted"]
+    report["updated"] += result["nMatched"]
+    saved = [product_doc for index, product_doc in enumerate(docs) if index not in failed]
+    for product_doc in saved:
+        index_product(product_doc)
+    # Once per batch rather than per row. Imports push no live updates: open
+    # pages show imported prices and stock on their next load.
+    catalog_changed(["products", *(f"product:{product_doc['id']}" for product_doc in saved)],
+                    [product_doc["id"] for product_doc in saved])
+
+@app.post("/api/admin/products/import")
+async def import_products(file: UploadFile = File(...), format: Optional[str] = None,
+                          current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    fmt = detect_format(file.filename, format)
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+
+    report = {"rows": 0, "inserted": 0, "updated": 0, "error_count": 0, "errors": []}
+    rows = read_rows(file.file, fmt, PRODUCT_TEXT_FIELDS)
+    started = time.perf_counter()
+    while True:
+        batch = await run_in_threadpool(parse_import_batch, rows, report)
+        if not batch:
+            break
+        await write_import_batch(batch, report)
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["rows"] / elapsed, 1) if elapsed else 0.0
+    return report
+
+@app.get("/api/admin/products/export")
+async def export_products(format: str = "ndjson", current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
+    # Sorted on the unique id index so the export is stable and resumable
+    cursor = db.products.find({}, PRODUCT_PROJECTION).sort("id", ASCENDING).batch_size(IMPORT_BATCH_SIZE)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_stream(cursor, format, list(Product.model_fields)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+# Image Routes
+async def store_upload(file: UploadFile) -> str:
+    data = await file.read(IMAGE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image larger than {IMAGE_MAX_UPLOAD_BYTES} bytes")
+    try:
+        # Hashing and resizing are CPU bound; keep them off the event loop
+        return await run_in_threadpool(image_store.save, data)
+    except ImageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+def image_info(digest: str) -> dict:
+    return {
+        "id": digest,
+        "image_url": image_url(digest),
+        "variants": {variant: image_url(digest, variant) for variant in IMAGE_VARIANTS},
+    }
+
+@app.post("/api/admin/images")
+async def upload_image(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return image_info(await store_upload(file))
+
+@app.post("/api/products/{product_id}/image", response_model=Product)
+async def upload_product_image(product_id: str, file: UploadFile = File(...),
+                               current_user: dict = Depends(get_current_user)):
+    if not current_user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    digest = await store_upload(file)
+    updated = await db.products.find_one_and_update(
+        {"id": product_id}, {"$set": {"image_url": image_url(digest)}},
+        projection={"_id": 0}, return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product_saved(updated)
+    return Product(**updated)
+
+@app.get("/api/images/{digest}/{variant}")
+async def get_image(request: Request, digest: str, variant: str):
+    # The URL names immutable content, so the ETag needs no file read
+    etag = f'"{digest}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    image = await run_in_threadpool(image_store.load, digest, variant)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data, media_type = image
+    
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, len(data))
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(data, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+@app.get("/api/placeholder/{width}/{height}")
+async def get_placeholder(request: Request, width: int, height: int):
+    width = max(1, min(width, PLACEHOLDER_MAX_SIZE))
+    height = max(1, min(height, PLACEHOLDER_MAX_SIZE))
+    etag = f'"placeholder-{width}x{height}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(placeholder_svg(width, height), media_type="image/svg+xml", headers=headers)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,446 @@
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from search import tokenize
+
+# Product fields offered while typing, and the response key of each. Titles
+# are one entry per product; the other fields one entry per distinct value.
+SUGGEST_FIELDS = {"title": "titles", "developer": "developers", "publisher": "publishers", "genre": "genres"}
+SUGGEST_PROJECTION = {"_id": 0, "id": 1, "average_rating": 1, "total_reviews": 1,
+                      **{field: 1 for field in SUGGEST_FIELDS}}
+SUGGEST_SORTS = ("popular", "rating")
+SUGGEST_MAX_LIMIT = 20
+
+# Index keys are word suffixes cut to KEY_LENGTH characters, for at most
+# MAX_WORDS words of each value; longer prefixes are checked against the text
+KEY_LENGTH = 24
+MAX_WORDS = 8
+# Keys buffered before a merge into the main sorted list
+PENDING_SIZE = 2048
+# Prefixes matching at least CACHE_MIN_RANGE keys keep their best
+# CACHE_DEPTH entries, for at most CACHE_SIZE (prefix, sort) pairs
+CACHE_MIN_RANGE = 64
+CACHE_DEPTH = 2 * SUGGEST_MAX_LIMIT
+CACHE_SIZE = 50000
+# Typo tolerance (one edit after the first character) from this length on
+FUZZY_MIN_LENGTH = 3
+
+_SEP = "\x00"
+_END = "￿"
+
+
+def normalize(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def _entry_id(key: str) -> int:
+    return int(key[key.rindex(_SEP) + 1:])
+
+
+def _key_texts(text: str) -> List[str]:
+    starts = [0] + [i + 1 for i, ch in enumerate(text) if ch == " "]
+    return list(dict.fromkeys(text[start:start + KEY_LENGTH] for start in starts[:MAX_WORDS]))
+
+
+class _Entry:
+    # A suggestion: its display value and the summed review count and
+    # rating of its products. The normalized text is derived when needed
+    # rather than kept next to the value.
+    __slots__ = ("value", "product_id", "count", "popular", "rating_sum")
+
+    def __init__(self, value: str, product_id: Optional[str] = None):
+        self.value = value
+        self.product_id = product_id
+        self.count = 0
+        self.popular = 0.0
+        self.rating_sum = 0.0
+
+    @property
+    def text(self) -> str:
+        return normalize(self.value)
+
+    def score(self, sort: str) -> Tuple[float, float]:
+        rating = self.rating_sum / self.count if self.count else 0.0
+        return (rating, self.popular) if sort == "rating" else (self.popular, rating)
+
+    def scores(self) -> Dict[str, Tuple[float, float]]:
+        return {sort: self.score(sort) for sort in SUGGEST_SORTS}
+
+
+class _Ranking:
+    # Best entries for one (prefix, sort), best first. complete means it
+    # holds every entry of the prefix; otherwise it is a correct top list
+    # that may shrink below CACHE_DEPTH as entries fall out of it.
+    __slots__ = ("ids", "complete")
+
+    def __init__(self, ids: List[int], complete: bool):
+        self.ids = ids
+        self.complete = complete
+
+
+class PrefixIndex:
+    # Word-prefix lookup over the values of one field. Each entry is indexed
+    # under the suffixes of its normalized text that start a word ("legend
+    # of zelda", "of zelda", "zelda"), each followed by NUL and the entry id,
+    # in one sorted list searched with bisect. New keys go to a small sorted
+    # pending list merged in once it fills, so a bulk import costs one merge
+    # per PENDING_SIZE keys rather than a list insert per key. Keys of
+    # removed entries are skipped until enough pile up to compact.
+    def __init__(self):
+        self.entries: Dict[int, _Entry] = {}
+        self._keys: List[str] = []
+        self._pending: List[str] = []
+        self._stale = 0
+        self._top: Dict[Tuple[str, str], _Ranking] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key_count(self) -> int:
+        return len(self._keys) + len(self._pending)
+
+    def insert(self, entry_id: int, entry: _Entry, text: str, defer: bool = False):
+        # defer=True appends unsorted keys for build(); merge() must follow
+        self.entries[entry_id] = entry
+        suffix = _SEP + str(entry_id)
+        for key_text in _key_texts(text):
+            if defer:
+                self._pending.append(key_text + suffix)
+            else:
+                insort(self._pending, key_text + suffix)
+        if not defer:
+            if len(self._pending) >= PENDING_SIZE:
+                self.merge()
+            self._touch(entry_id, None)
+
+    def remove(self, entry_id: int):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        texts = _key_texts(entry.text)
+        for prefix in self._prefixes(texts):
+            for sort in SUGGEST_SORTS:
+                ranking = self._top.get((prefix, sort))
+                if ranking is not None and entry_id in ranking.ids:
+                    ranking.ids.remove(entry_id)
+        self._stale += len(texts)
+        if self._stale > PENDING_SIZE and self._stale * 4 > len(self._keys):
+            self.compact()
+
+    def rescore(self, entry_id: int, old_scores: Dict[str, Tuple[float, float]]):
+        # Call after changing an entry's counters
+        self._touch(entry_id, old_scores)
+
+    def merge(self):
+        # Two sorted runs: list.sort merges them in linear time
+        if self._pending:
+            self._keys += self._pending
+            self._keys.sort()
+            self._pending = []
+
+    def compact(self):
+        self.merge()
+        entries = self.entries
+        self._keys = [key for key in self._keys if _entry_id(key) in entries]
+        self._stale = 0
+
+    def warm(self):
+        # Ranks every prefix matching at least CACHE_MIN_RANGE keys, so no
+        # lookup has to scan a wide range. Rankings are built bottom-up in
+        # one pass over the keys: a prefix's best entries are the best of
+        # its own exact keys and of its children's rankings.
+        self.merge()
+        self._top.clear()
+        self._warm("", 0, len(self._keys))
+
+    def _warm(self, prefix: str, lo: int, hi: int) -> Dict[str, _Ranking]:
+        keys, entries = self._keys, self.entries
+        if hi - lo < CACHE_MIN_RANGE:
+            ids = {entry_id for entry_id in map(_entry_id, keys[lo:hi]) if entry_id in entries}
+            complete = True
+        else:
+            ids, complete = set(), True
+            depth, i = len(prefix), lo
+            while i < hi:
+                ch = keys[i][depth]
+                if ch == _SEP:
+                    # Keys whose text is exactly the prefix sort first
+                    end = bisect_left(keys, prefix + "\x01", i, hi)
+                    ids.update(entry_id for entry_id in map(_entry_id, keys[i:end]) if entry_id in entries)
+                else:
+                    end = bisect_left(keys, prefix + chr(ord(ch) + 1), i, hi)
+                    for ranking in self._warm(prefix + ch, i, end).values():
+                        ids.update(ranking.ids)
+                        complete = complete and ranking.complete
+                i = end
+        rankings = {}
+        for sort in SUGGEST_SORTS:
+            ranked = heapq.nlargest(CACHE_DEPTH, ids, key=lambda i: entries[i].score(sort))
+            rankings[sort] = _Ranking(ranked, complete and len(ids) <= CACHE_DEPTH)
+            if prefix and hi - lo >= CACHE_MIN_RANGE and len(self._top) < CACHE_SIZE:
+                self._top[(prefix, sort)] = rankings[sort]
+        return rankings
+
+    @staticmethod
+    def _prefixes(texts: List[str]):
+        return {text[:length] for text in texts for length in range(1, len(text) + 1)}
+
+    def _range(self, prefix: str) -> List[str]:
+        keys, pending, end = self._keys, self._pending, prefix + _END
+        found = keys[bisect_left(keys, prefix):bisect_left(keys, end)]
+        if pending:
+            found += pending[bisect_left(pending, prefix):bisect_left(pending, end)]
+        return found
+
+    def _has(self, prefix: str) -> bool:
+        for keys in (self._keys, self._pending):
+            i = bisect_left(keys, prefix)
+            if i < len(keys) and keys[i].startswith(prefix):
+                return True
+        return False
+
+    def _touch(self, entry_id: int, old_scores: Optional[Dict[str, Tuple[float, float]]]):
+        # Keeps the cached rankings of the entry's prefixes correct without
+        # recomputing them: an entry scoring above the last one kept takes
+        # its place, one that falls below it leaves the (now shorter) list
+        entries = self.entries
+        entry = entries[entry_id]
+        for prefix in self._prefixes(_key_texts(entry.text)):
+            for sort in SUGGEST_SORTS:
+                ranking = self._top.get((prefix, sort))
+                if ranking is None:
+                    continue
+                ids, score = ranking.ids, entry.score(sort)
+                if entry_id in ids:
+                    ids.remove(entry_id)
+                    dropped = old_scores is not None and score < old_scores[sort]
+                    if dropped and not ranking.complete and ids and score < entries[ids[-1]].score(sort):
+                        continue
+                elif not ranking.complete and (not ids or score <= entries[ids[-1]].score(sort)):
+                    continue
+                ids.append(entry_id)
+                ids.sort(key=lambda i: entries[i].score(sort), reverse=True)
+                if len(ids) > CACHE_DEPTH:
+                    del ids[CACHE_DEPTH:]
+                    ranking.complete = False
+
+    def _rank(self, prefix: str, sorts: Iterable[str]) -> Dict[str, List[int]]:
+        keys = self._range(prefix)
+        entries = self.entries
+        ids = [i for i in {_entry_id(key) for key in keys} if i in entries]
+        ranked = {}
+        for sort in sorts:
+            ranked[sort] = heapq.nlargest(CACHE_DEPTH, ids, key=lambda i: entries[i].score(sort))
+            if len(keys) >= CACHE_MIN_RANGE:
+                if len(self._top) >= CACHE_SIZE:
+                    del self._top[next(iter(self._top))]
+                self._top[(prefix, sort)] = _Ranking(list(ranked[sort]), len(ids) <= CACHE_DEPTH)
+        return ranked
+
+    def _ranked(self, prefix: str, sort: str, limit: int) -> List[int]:
+        # Best entries having a key that starts with prefix (<= KEY_LENGTH)
+        ranking = self._top.get((prefix, sort))
+        if ranking is not None and (ranking.complete or len(ranking.ids) >= limit):
+            return ranking.ids[:limit]
+        return self._rank(prefix, (sort,))[sort][:limit]
+
+    def lookup(self, prefix: str, limit: int, sort: str) -> List[int]:
+        if len(prefix) <= KEY_LENGTH:
+            return self._ranked(prefix, sort, limit)
+        entries, needle = self.entries, " " + prefix
+        ids = {_entry_id(key) for key in self._range(prefix[:KEY_LENGTH])}
+        matches = [i for i in ids if i in entries and needle in " " + entries[i].text]
+        return heapq.nlargest(limit, matches, key=lambda i: entries[i].score(sort))
+
+    def _next_chars(self, prefix: str) -> List[str]:
+        # Distinct characters following prefix in some key, found by jumping
+        # from one run of keys to the next rather than scanning them all
+        chars = set()
+        depth = len(prefix)
+        for keys in (self._keys, self._pending):
+            i = bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                ch = keys[i][depth]
+                if ch != _SEP:
+                    chars.add(ch)
+                i = bisect_left(keys, prefix + chr(ord(ch) + 1), i)
+        return sorted(chars)
+
+    def fuzzy_lookup(self, prefix: str, limit: int, sort: str, exclude: Iterable[int] = ()) -> List[int]:
+        # Entries one edit (deletion, transposition, substitution or
+        # insertion) away from prefix; the first character must match.
+        # Substitutions and insertions only try characters that occur at
+        # that position, so most candidate prefixes are never generated.
+        prefix = prefix[:KEY_LENGTH]
+        exclude = set(exclude)
+        variants = set()
+        for i in range(1, len(prefix)):
+            head, rest = prefix[:i], prefix[i:]
+            variants.add(head + rest[1:])
+            if len(rest) > 1:
+                variants.add(head + rest[1] + rest[0] + rest[2:])
+            for ch in self._next_chars(head):
+                variants.add(head + ch + rest[1:])
+                variants.add(head + ch + rest)
+        variants.discard(prefix)
+        entries = self.entries
+        found = set()
+        for variant in variants:
+            if self._has(variant):
+                found.update(self._ranked(variant, sort, limit + len(exclude)))
+        found -= exclude
+        return heapq.nlargest(limit, found, key=lambda i: entries[i].score(sort))
+
+
+class SuggestIndex:
+    # Search-as-you-type over titles, developers, publishers and genres,
+    # ranked by popularity (review count) or average rating. A developer,
+    # publisher or genre scores the sum of its products' review counts, or
+    # their mean rating. Products are added, replaced, rescored and removed
+    # one at a time from the catalog hooks.
+    def __init__(self):
+        self.fields = {field: PrefixIndex() for field in SUGGEST_FIELDS}
+        self._value_ids: Dict[str, Dict[str, int]] = {field: {} for field in SUGGEST_FIELDS if field != "title"}
+        # product id -> (entry ids, review count, average rating)
+        self._docs: Dict[str, Tuple[Tuple[int, ...], float, float]] = {}
+        self._entry_fields: Dict[int, str] = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def clear(self):
+        self.__init__()
+
+    def build(self, products: Iterable[dict]):
+        self.clear()
+        for product in products:
+            self._add(product, defer=True)
+        for index in self.fields.values():
+            index.warm()
+
+    def add(self, product: dict):
+        self._add(product, defer=False)
+
+    @staticmethod
+    def _values(product: dict) -> Dict[str, Dict[str, str]]:
+        # field -> {normalized text: display value}
+        values = {}
+        for field in SUGGEST_FIELDS:
+            value = product.get(field)
+            items = {}
+            for item in (value if isinstance(value, list) else [value]):
+                text = normalize(item) if isinstance(item, str) else ""
+                if text:
+                    items.setdefault(text, item.strip())
+            values[field] = items
+        return values
+
+    def _texts(self, entry_ids: Tuple[int, ...]) -> Dict[str, set]:
+        texts = {field: set() for field in SUGGEST_FIELDS}
+        for entry_id in entry_ids:
+            field = self._entry_fields[entry_id]
+            texts[field].add(self.fields[field].entries[entry_id].text)
+        return texts
+
+    def _add(self, product: dict, defer: bool):
+        product_id = product["id"]
+        old = self._docs.get(product_id)
+        values = self._values(product)
+        if old is not None:
+            if self._texts(old[0]) == {field: set(items) for field, items in values.items()}:
+                self.rescore(product)
+                return
+            self.remove(product_id)
+        # Imports leave out the review aggregates; keep the current ones
+        popular = float(product.get("total_reviews", old[1] if old else 0) or 0)
+        rating = float(product.get("average_rating", old[2] if old else 0) or 0)
+
+        entry_ids = []
+        for field, items in values.items():
+            index = self.fields[field]
+            for text, value in items.items():
+                entry_id = None if field == "title" else self._value_ids[field].get(text)
+                if entry_id is None:
+                    entry_id = self._next_id
+                    self._next_id += 1
+                    entry = _Entry(value, product_id if field == "title" else None)
+                    entry.count, entry.popular, entry.rating_sum = 1, popular, rating
+                    self._entry_fields[entry_id] = field
+                    index.insert(entry_id, entry, text, defer=defer)
+                    if field != "title":
+                        self._value_ids[field][text] = entry_id
+                else:
+                    entry = index.entries[entry_id]
+                    old_scores = entry.scores()
+                    entry.count += 1
+                    entry.popular += popular
+                    entry.rating_sum += rating
+                    if not defer:
+                        index.rescore(entry_id, old_scores)
+                entry_ids.append(entry_id)
+        self._docs[product_id] = (tuple(entry_ids), popular, rating)
+
+    def rescore(self, product: dict):
+        # Only the review aggregates changed, e.g. after a new review
+        old = self._docs.get(product["id"])
+        if old is None:
+            return
+        entry_ids, old_popular, old_rating = old
+        popular = float(product.get("total_reviews", old_popular) or 0)
+        rating = float(product.get("average_rating", old_rating) or 0)
+        if (popular, rating) == (old_popular, old_rating):
+            return
+        for entry_id in entry_ids:
+            index = self.fields[self._entry_fields[entry_id]]
+            entry = index.entries[entry_id]
+            old_scores = entry.scores()
+            entry.popular += popular - old_popular
+            entry.rating_sum += rating - old_rating
+            index.rescore(entry_id, old_scores)
+        self._docs[product["id"]] = (entry_ids, popular, rating)
+
+    def remove(self, product_id: str):
+        old = self._docs.pop(product_id, None)
+        if old is None:
+            return
+        entry_ids, popular, rating = old
+        for entry_id in entry_ids:
+            field = self._entry_fields[entry_id]
+            index = self.fields[field]
+            entry = index.entries[entry_id]
+            if entry.count <= 1:
+                if field != "title":
+                    del self._value_ids[field][entry.text]
+                index.remove(entry_id)
+                del self._entry_fields[entry_id]
+                continue
+            old_scores = entry.scores()
+            entry.count -= 1
+            entry.popular -= popular
+            entry.rating_sum -= rating
+            index.rescore(entry_id, old_scores)
+
+    def suggest(self, prefix: str, limit: int = 5, sort: str = "popular",
+                fuzzy: bool = False) -> Dict[str, List[dict]]:
+        prefix = normalize(prefix)
+        results = {}
+        for field, key in SUGGEST_FIELDS.items():
+            index = self.fields[field]
+            ids = index.lookup(prefix, limit, sort) if prefix else []
+            if fuzzy and len(ids) < limit and len(prefix) >= FUZZY_MIN_LENGTH:
+                ids = ids + index.fuzzy_lookup(prefix, limit - len(ids), sort, ids)
+            entries = [index.entries[entry_id] for entry_id in ids]
+            if field == "title":
+                results[key] = [{"id": entry.product_id, "title": entry.value} for entry in entries]
+            else:
+                results[key] = [{"value": entry.value, "products": entry.count} for entry in entries]
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self._docs),
+            **{key: {"entries": len(self.fields[field]), "keys": self.fields[field].key_count()}
+               for field, key in SUGGEST_FIELDS.items()},
+        }
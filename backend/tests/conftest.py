@@ -0,0 +1,128 @@
+"""Fixtures for API tests against an in-memory MongoDB stand-in.
+
+The app runs in-process through its lifespan with mongomock-motor in place of
+Motor, so the tests need no database server:
+
+    pip install pytest mongomock-motor
+    python -m pytest tests
+"""
+import asyncio
+import collections
+import functools
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update(
+    MONGO_URL="mongodb://localhost:27017",
+    SECRET_KEY="test",
+    ALGORITHM="HS256",
+    ACCESS_TOKEN_EXPIRE_MINUTES="30",
+    ADMISSION_ENABLED="false",
+    WARMUP_PATHS="",
+)
+
+import database  # noqa: E402
+
+database.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+
+def yield_first(method):
+    # mongomock-motor runs each operation without ever suspending; yielding
+    # first lets concurrent requests interleave at every database call the way
+    # round trips to a server make them
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        await asyncio.sleep(0)
+        return await method(*args, **kwargs)
+    return wrapper
+
+
+for name in ("find_one", "find_one_and_update", "insert_one", "update_one", "update_many",
+             "delete_one", "bulk_write", "count_documents"):
+    setattr(mongomock_motor.AsyncMongoMockCollection, name,
+            yield_first(getattr(mongomock_motor.AsyncMongoMockCollection, name)))
+mongomock_motor.AsyncCursor.to_list = yield_first(mongomock_motor.AsyncCursor.to_list)
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    # Counts the reads sent to each collection. The stand-in emits no command
+    # monitoring events, so its read methods are wrapped instead.
+    counts = collections.Counter()
+
+    def counted(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            counts[self.name] += 1
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    for name in ("find", "find_one", "aggregate"):
+        monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, name,
+                            counted(getattr(mongomock_motor.AsyncMongoMockCollection, name)))
+    return counts
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    # A fresh in-memory database per test; in-process caches start empty
+    server.response_cache = server.MemoryCacheBackend(
+        maxsize=server.RESPONSE_CACHE_SIZE, ttl=server.RESPONSE_CACHE_TTL_SECONDS)
+    server.user_cache.clear()
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+async def create_user(is_admin: bool = False) -> dict:
+    # Inserted directly, skipping bcrypt; returns auth headers for the user
+    username = "user-%s" % uuid.uuid4().hex[:12]
+    user = {"id": str(uuid.uuid4()), "username": username, "email": "%s@example.com" % username,
+            "full_name": username, "hashed_password": "", "is_admin": is_admin, "created_at": datetime.utcnow()}
+    await server.db.users.insert_one(user)
+    token = server.create_access_token(
+        {"sub": username, "uid": user["id"], "adm": is_admin}, expires_delta=timedelta(minutes=30))
+    return {"Authorization": "Bearer %s" % token}
+
+
+async def create_product(**fields) -> dict:
+    product = {
+        "id": str(uuid.uuid4()), "title": "Game", "description": "A game", "price": 10.0,
+        "image_url": "", "category_id": "action", "platform": ["PC"], "genre": ["Action"], "rating": "T",
+        "release_date": datetime(2024, 1, 1), "developer": "Studio", "publisher": "Publisher",
+        "in_stock": 10, "featured": False, "average_rating": 0.0, "total_reviews": 0, "rating_histogram": {},
+        "popularity": 0.0,
+    }
+    product.update(fields)
+    await server.db.products.insert_one(dict(product))
+    server.product_saved(product)
+    return product
+
+
+async def fill_cart(client, headers: dict, *items) -> str:
+    # Writes the cart document directly, so a test can also set up carts the
+    # cart routes would refuse. items are (product_id, quantity) pairs;
+    # returns the user's id
+    user_id = (await client.get("/api/auth/me", headers=headers)).json()["id"]
+    await server.db.carts.update_one(
+        {"user_id": user_id},
+        {"$set": {"items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items]}},
+        upsert=True,
+    )
+    return user_id
@@ -0,0 +1,49 @@
+import pytest
+
+import server
+from admission import AdmissionController, AdmissionPolicy
+from conftest import create_product
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    # Reviews limited to a burst of 2 for the whole worker, catalog reads to
+    # 3 per client
+    controller = AdmissionController([
+        AdmissionPolicy("reviews", ("GET",), ("/api/products/{product_id}/reviews",), route_rate=0.01, route_burst=2),
+        AdmissionPolicy("catalog", ("GET",), ("/api/products", "/api/products/*"), client_rate=0.01, client_burst=3),
+    ])
+    monkeypatch.setattr(server, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(server, "admission_controller", controller)
+    return controller
+
+
+async def test_batch_sub_requests_are_admitted_per_path(client, admission):
+    product = await create_product()
+    paths = ["/api/products/%s/reviews?sort=%s" % (product["id"], sort) for sort in ("newest", "highest") * 3]
+    paths += ["/api/products?q=game&limit=%d" % limit for limit in range(1, 6)]
+
+    response = await client.post("/api/batch", json={"requests": [{"id": path, "path": path} for path in paths]})
+
+    assert response.status_code == 200
+    results = response.json()["responses"]
+    reviews, catalog = results[:6], results[6:]
+    assert [result["status"] for result in reviews].count(200) == 2
+    assert [result["status"] for result in catalog].count(200) == 3
+    rejected = [result for result in results if result["status"] != 200]
+    assert {result["status"] for result in rejected} == {429, 503}
+    assert all(int(result["headers"]["Retry-After"]) >= 1 for result in rejected)
+    assert admission.inflight == 0
+
+
+async def test_bootstrap_passes_on_a_rejected_part(client, admission):
+    await create_product(featured=True)
+    paths = ["/api/products?limit=%d" % limit for limit in range(1, 4)]
+    await client.post("/api/batch", json={"requests": [{"path": path} for path in paths]})
+
+    response = await client.get("/api/bootstrap/home")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
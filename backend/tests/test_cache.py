@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+import server
+from conftest import create_product, create_user, fill_cart
+
+pytestmark = pytest.mark.anyio
+
+
+async def listed(client, product_id: str) -> dict:
+    response = await client.get("/api/products", params={"limit": 50})
+    assert response.status_code == 200
+    return next(product for product in response.json() if product["id"] == product_id)
+
+
+async def test_entry_built_across_an_invalidation_is_not_cached(client):
+    request = Request({"type": "http", "method": "GET", "path": "/api/products", "query_string": b"",
+                       "headers": []})
+    builds = []
+
+    async def build(response):
+        builds.append(len(builds))
+        # A write lands while the build is reading
+        server.response_cache.invalidate(["product:1"])
+        return builds[-1]
+
+    first = await server.cached_json_response(request, ["products", "product:1"], build)
+    second = await server.cached_json_response(request, ["products", "product:1"], build)
+
+    assert (first.body, second.body) == (b"0", b"1")
+    assert server.response_cache.stats()["stale_sets"] == 2
+
+
+async def test_listings_follow_reviews_and_checkouts(client):
+    product = await create_product(in_stock=5)
+    headers = await create_user()
+    assert (await listed(client, product["id"]))["in_stock"] == 5
+
+    review = {"user_id": "", "product_id": product["id"], "rating": 4, "comment": "Good"}
+    assert (await client.post("/api/products/%s/reviews" % product["id"], json=review,
+                              headers=headers)).status_code == 200
+    assert (await listed(client, product["id"]))["average_rating"] == 4.0
+
+    await fill_cart(client, headers, (product["id"], 2))
+    assert (await client.post("/api/checkout", headers=headers)).status_code == 200
+    assert (await listed(client, product["id"]))["in_stock"] == 3
+
+
+async def test_catalog_changes_from_another_worker_reindex_and_drop_cached_listings(client):
+    product = await create_product(title="Alpha Quest")
+    assert [p["id"] for p in (await client.get("/api/products", params={"q": "alpha"})).json()] == [product["id"]]
+    # Another worker renamed the product and broadcast the change
+    await server.db.products.update_one({"id": product["id"]}, {"$set": {"title": "Beta Quest"}})
+    changes = asyncio.Queue()
+    changes.put_nowait({"tags": ["products", f"product:{product['id']}"], "products": [product["id"]]})
+
+    syncer = asyncio.create_task(server.apply_catalog_changes(changes))
+    while not changes.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+    syncer.cancel()
+
+    assert (await client.get("/api/products", params={"q": "alpha"})).json() == []
+    assert [p["title"] for p in (await client.get("/api/products", params={"q": "beta"})).json()] == ["Beta Quest"]
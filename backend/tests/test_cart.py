@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import server
+from conftest import create_product, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def cart_quantities(client, headers) -> dict:
+    response = await client.get("/api/cart", headers=headers)
+    assert response.status_code == 200
+    return {item["product"]["id"]: item["quantity"] for item in response.json()["items"]}
+
+
+async def test_concurrent_adds_lose_no_quantity(client):
+    products = [await create_product() for _ in range(3)]
+    headers = await create_user()
+
+    adds = [
+        client.post("/api/cart/add", json={"product_id": product["id"], "quantity": quantity}, headers=headers)
+        for quantity in (1, 2, 3) for product in products for _ in range(4)
+    ]
+    responses = await asyncio.gather(*adds)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert await cart_quantities(client, headers) == {product["id"]: 24 for product in products}
+    assert await server.db.carts.count_documents({}) == 1
+
+
+async def test_concurrent_bulk_adds_and_updates(client):
+    first, second = await create_product(), await create_product()
+    headers = await create_user()
+    await client.post("/api/cart/add", json={"product_id": first["id"], "quantity": 1}, headers=headers)
+
+    bulk = [{"product_id": first["id"], "quantity": 1}, {"product_id": second["id"], "quantity": 2}]
+    responses = await asyncio.gather(
+        *(client.post("/api/cart/items", json=bulk, headers=headers) for _ in range(10)),
+        client.put("/api/cart/items", json=[{"product_id": first["id"], "quantity": 0}], headers=headers),
+    )
+
+    assert all(response.status_code == 200 for response in responses)
+    quantities = await cart_quantities(client, headers)
+    # The removal lands somewhere among the bulk adds; none of the adds to
+    # the other product are lost either way
+    assert quantities[second["id"]] == 20
+    assert quantities.get(first["id"], 0) <= 10
+
+
+@pytest.mark.parametrize("quantity", [0, -50])
+async def test_update_rejects_quantities_below_one(client, quantity):
+    product = await create_product()
+    headers = await create_user()
+    await client.post("/api/cart/add", json={"product_id": product["id"], "quantity": 2}, headers=headers)
+
+    response = await client.put("/api/cart/update", json={"product_id": product["id"], "quantity": quantity},
+                                headers=headers)
+
+    assert response.status_code == 400
+    assert await cart_quantities(client, headers) == {product["id"]: 2}
@@ -0,0 +1,23 @@
+import io
+
+from catalog_io import read_rows
+
+
+def test_lines_that_are_not_utf8_are_reported_and_skipped():
+    data = b'\xef\xbb\xbf{"title": "Uno"}\n{"title": "Caf\xe9"}\n' + b'{"title": "Due"}\n' * 5000
+
+    rows = list(read_rows(io.BytesIO(data), "ndjson"))
+
+    assert rows[0] == (1, {"title": "Uno"})
+    assert rows[1][0] == 2 and rows[1][1].startswith("Invalid JSON")
+    assert rows[2:] == [(number, {"title": "Due"}) for number in range(3, 5003)]
+
+
+def test_csv_stops_at_the_first_line_that_is_not_utf8():
+    data = "title,price\r\nUno,10\r\nCafé,10\r\nDue,10\r\n".encode("latin-1")
+
+    rows = list(read_rows(io.BytesIO(data), "csv"))
+
+    assert rows[0] == (2, {"title": "Uno", "price": "10"})
+    assert rows[1][0] == 3 and "UTF-8" in rows[1][1]
+    assert len(rows) == 2
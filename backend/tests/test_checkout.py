@@ -0,0 +1,101 @@
+import asyncio
+
+import mongomock_motor
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+import server
+from conftest import create_product, create_user, fill_cart
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_checkouts_never_oversell(client):
+    stock = 5
+    product = await create_product(in_stock=stock, price=11.0)
+    users = [await create_user() for _ in range(20)]
+    for headers in users:
+        await fill_cart(client, headers, (product["id"], 1))
+
+    responses = await asyncio.gather(*(client.post("/api/checkout", headers=headers) for headers in users))
+
+    statuses = [response.status_code for response in responses]
+    assert statuses.count(200) == stock
+    assert statuses.count(409) == len(users) - stock
+    stored = await server.db.products.find_one({"id": product["id"]})
+    assert stored["in_stock"] == 0
+    assert await server.db.orders.count_documents({"status": "placed"}) == stock
+    assert await server.db.orders.count_documents({"status": "pending"}) == 0
+
+
+async def test_checkout_rejects_quantities_below_one(client):
+    product = await create_product(in_stock=5)
+    headers = await create_user()
+    # The cart routes refuse such quantities; an older cart may still hold one
+    await fill_cart(client, headers, (product["id"], -50))
+
+    response = await client.post("/api/checkout", headers=headers)
+
+    assert response.status_code == 400
+    assert (await server.db.products.find_one({"id": product["id"]}))["in_stock"] == 5
+    assert await server.db.orders.count_documents({}) == 0
+
+
+async def test_idempotent_checkout_places_one_order(client):
+    product = await create_product(in_stock=5)
+    headers = {**await create_user(), "Idempotency-Key": "checkout-1"}
+    await fill_cart(client, headers, (product["id"], 2))
+
+    first = await client.post("/api/checkout", headers=headers)
+    second = await client.post("/api/checkout", headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["id"] == second.json()["id"]
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert (await server.db.products.find_one({"id": product["id"]}))["in_stock"] == 3
+
+
+async def test_failed_reservation_releases_stock_and_order(client, monkeypatch):
+    first = await create_product(in_stock=5)
+    second = await create_product(in_stock=5)
+    headers = {**await create_user(), "Idempotency-Key": "checkout-2"}
+    await fill_cart(client, headers, (first["id"], 2), (second["id"], 1))
+    reserve = mongomock_motor.AsyncMongoMockCollection.find_one_and_update
+    calls = []
+
+    async def flaky_reserve(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise AutoReconnect("connection reset")
+        return await reserve(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "find_one_and_update", flaky_reserve)
+    failed = await client.post("/api/checkout", headers=headers)
+
+    assert failed.status_code == 503
+    assert failed.headers["Retry-After"] == "1"
+    assert (await server.db.products.find_one({"id": first["id"]}))["in_stock"] == 5
+    assert await server.db.orders.count_documents({}) == 0
+
+    retried = await client.post("/api/checkout", headers=headers)
+
+    assert retried.status_code == 200
+    assert (await server.db.products.find_one({"id": first["id"]}))["in_stock"] == 3
+    assert (await server.db.products.find_one({"id": second["id"]}))["in_stock"] == 4
+
+
+async def test_duplicate_of_an_abandoned_checkout_answers_409(client, monkeypatch):
+    product = await create_product(in_stock=5)
+    headers = {**await create_user(), "Idempotency-Key": "checkout-3"}
+    await fill_cart(client, headers, (product["id"], 1))
+
+    async def lost_race(self, document, *args, **kwargs):
+        # The racing checkout inserted its order and removed it after a shortfall
+        raise DuplicateKeyError("E11000 duplicate key")
+
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "insert_one", lost_race)
+    response = await client.post("/api/checkout", headers=headers)
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert (await server.db.products.find_one({"id": product["id"]}))["in_stock"] == 5
@@ -0,0 +1,19 @@
+import pytest
+
+from conftest import create_product
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_empty_filter_values_are_ignored_like_on_listings(client):
+    await create_product(category_id="action", platform=["PC"])
+    await create_product(category_id="rpg", platform=["PC", "Xbox"])
+    params = {"category": "", "platform": "", "genre": ""}
+
+    listing = await client.get("/api/products", params=params)
+    facets = await client.get("/api/products/facets", params=params)
+
+    assert len(listing.json()) == 2
+    assert facets.json()["total"] == 2
+    assert facets.json()["category_id"] == {"action": 1, "rpg": 1}
+    assert facets.json()["platform"] == {"PC": 2, "Xbox": 1}
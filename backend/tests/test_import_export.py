@@ -0,0 +1,52 @@
+import pytest
+
+import server
+from conftest import create_product, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def stored_products() -> list:
+    return await server.db.products.find({}, server.PRODUCT_PROJECTION).sort("id", 1).to_list(None)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+async def test_export_then_import_leaves_products_unchanged(client, fmt):
+    admin = await create_user(is_admin=True)
+    await create_product(title="Plain")
+    await create_product(title="Bare", image_url="", description="", platform=[], genre=[], featured=True,
+                         rating_histogram={"5": 2}, average_rating=5.0, total_reviews=2)
+    before = await stored_products()
+
+    exported = await client.get("/api/admin/products/export", params={"format": fmt}, headers=admin)
+    await server.db.products.delete_many({})
+    response = await client.post("/api/admin/products/import", params={"format": fmt},
+                                 files={"file": ("products." + fmt, exported.content)}, headers=admin)
+
+    assert response.status_code == 200
+    assert response.json()["error_count"] == 0, response.json()["errors"]
+    assert response.json()["inserted"] == 2
+    assert await stored_products() == before
+
+
+async def test_import_invalidates_once_per_batch_and_publishes_nothing(client, monkeypatch):
+    admin = await create_user(is_admin=True)
+    monkeypatch.setattr(server, "IMPORT_BATCH_SIZE", 10)
+    invalidations, published = [], []
+    monkeypatch.setattr(server.response_cache, "invalidate", invalidations.append)
+    monkeypatch.setattr(server.live_hub, "publish", lambda product_id, fields: published.append(product_id))
+    rows = b"".join(
+        b'{"title": "Game %d", "description": "", "price": 5, "image_url": "", "category_id": "rpg", '
+        b'"platform": ["PC"], "genre": ["RPG"], "rating": "T", "release_date": "2024-01-01T00:00:00", '
+        b'"developer": "Studio", "publisher": "Publisher", "in_stock": 1}\n' % number
+        for number in range(25)
+    )
+
+    response = await client.post("/api/admin/products/import", files={"file": ("products.ndjson", rows)},
+                                 headers=admin)
+
+    assert response.json()["inserted"] == 25
+    assert len(invalidations) == 3
+    assert sum(len(tags) - 1 for tags in invalidations) == 25
+    assert published == []
+    assert len(server.search_index.search("game")) == 25
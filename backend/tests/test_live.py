@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import mongomock_motor
+import pytest
+from bson import ObjectId
+
+from live import MongoLiveBackend
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_mongo_backend_publishes_only_while_started():
+    database = mongomock_motor.AsyncMongoMockClient()["live"]
+    # Created uncapped up front: the stand-in cannot create capped collections
+    await database.create_collection("live_events")
+    backend = MongoLiveBackend(database)
+    delivered = []
+
+    backend.publish("before", {"price": 1.0})
+    await backend.start(lambda product_id, fields: delivered.append(product_id))
+    backend.publish("during", {"price": 2.0})
+    await backend.stop()
+    backend.publish("after", {"price": 3.0})
+
+    events = await database.live_events.find({}, {"_id": 0, "ts": 0}).to_list(None)
+    assert events == [{"product_id": "during", "fields": {"price": 2.0}}]
+
+
+async def test_mongo_backend_broadcasts_to_the_other_workers_only():
+    database = mongomock_motor.AsyncMongoMockClient()["live"]
+    await database.create_collection("live_events")
+    sender, other = MongoLiveBackend(database), MongoLiveBackend(database)
+    received = {sender: [], other: []}
+    for backend in (sender, other):
+        await backend.start(lambda product_id, fields: None, received[backend].append)
+
+    sender.broadcast({"tags": ["products"], "products": ["1"]})
+    # The stand-in's cursors do not wait for new events; the tail reopens them
+    for _ in range(30):
+        if received[other]:
+            break
+        await asyncio.sleep(0.1)
+    await sender.stop()
+    await other.stop()
+
+    assert received == {sender: [], other: [{"tags": ["products"], "products": ["1"]}]}
+
+
+async def test_mongo_backend_delivers_events_whose_ids_are_out_of_order():
+    database = mongomock_motor.AsyncMongoMockClient()["live"]
+    await database.create_collection("live_events")
+    backend = MongoLiveBackend(database)
+    delivered = []
+    await backend.start(lambda product_id, fields: delivered.append(product_id))
+
+    async def delivery_of(product_id):
+        for _ in range(30):
+            if product_id in delivered:
+                return
+            await asyncio.sleep(0.1)
+
+    # Another process wrote the second event with a lower id, after the tail
+    # had already seen the first; the tail reopens once more before stopping
+    # and must not deliver either again
+    events = database.live_events
+    await events.insert_one({"_id": ObjectId(), "product_id": "first", "fields": {}, "ts": datetime.utcnow()})
+    await delivery_of("first")
+    earlier_id = ObjectId.from_datetime(datetime(2020, 1, 1))
+    await events.insert_one({"_id": earlier_id, "product_id": "second", "fields": {}, "ts": datetime.utcnow()})
+    await delivery_of("second")
+    await asyncio.sleep(1.1)
+    await backend.stop()
+
+    assert delivered == ["first", "second"]
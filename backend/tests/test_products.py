@@ -0,0 +1,43 @@
+import pytest
+
+import server
+from conftest import create_product, create_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def page_ids(client, params: dict) -> list:
+    ids, cursor = [], None
+    while True:
+        response = await client.get("/api/products", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [product["id"] for product in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids
+
+
+async def test_popular_sort_pages_through_unscored_products(client):
+    admin = await create_user(is_admin=True)
+    body = {"title": "New", "description": "Not played yet", "price": 20.0, "image_url": "", "category_id": "rpg",
+            "platform": ["PC"], "genre": ["RPG"], "rating": "T", "release_date": "2025-01-01T00:00:00",
+            "developer": "Studio", "publisher": "Publisher", "in_stock": 3}
+    for _ in range(20):
+        assert (await client.post("/api/products", json=body, headers=admin)).status_code == 200
+    scored = [await create_product(popularity=float(score)) for score in range(1, 11)]
+
+    ids = await page_ids(client, {"sort": "popular", "limit": 7})
+
+    assert len(ids) == len(set(ids)) == 30
+    assert ids[:10] == [product["id"] for product in reversed(scored)]
+
+
+async def test_backfill_scores_products_stored_without_one(client):
+    for _ in range(5):
+        product = await create_product()
+        await server.db.products.update_one({"id": product["id"]}, {"$unset": {"popularity": ""}})
+    await create_product(popularity=2.0)
+
+    assert await server.backfill_scores(server.db.products) == 5
+    assert await server.db.products.count_documents({"popularity": 0.0}) == 5
+    assert len(await page_ids(client, {"sort": "popular", "limit": 2})) == 6
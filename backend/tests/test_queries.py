@@ -0,0 +1,54 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from conftest import create_product, create_user, fill_cart
+
+pytestmark = pytest.mark.anyio
+
+
+async def count_reads(client, queries, path: str, headers: dict) -> dict:
+    queries.clear()
+    response = await client.get(path, headers=headers)
+    assert response.status_code == 200
+    return dict(queries)
+
+
+async def fill_wishlist(client, headers: dict, product_ids: list):
+    for product_id in product_ids:
+        response = await client.post("/api/wishlist/add", json={"product_id": product_id}, headers=headers)
+        assert response.status_code == 200
+
+
+async def place_orders(client, headers: dict, products: list):
+    user_id = (await client.get("/api/auth/me", headers=headers)).json()["id"]
+    now = datetime.utcnow()
+    await server.db.orders.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": user_id, "status": "placed", "total": 10.0 * len(products),
+         "idempotency_key": "order-%d" % index,
+         "created_at": now - timedelta(minutes=index),
+         "items": [{"product_id": product["id"], "title": product["title"], "price": product["price"],
+                    "quantity": 1} for product in products]}
+        for index in range(len(products))
+    ])
+
+
+@pytest.mark.parametrize("path, fill", [
+    ("/api/cart", lambda client, headers, products: fill_cart(
+        client, headers, *((product["id"], 2) for product in products))),
+    ("/api/wishlist", lambda client, headers, products: fill_wishlist(
+        client, headers, [product["id"] for product in products])),
+    ("/api/orders", place_orders),
+], ids=["cart", "wishlist", "orders"])
+async def test_reads_do_not_grow_with_items(client, queries, path, fill):
+    products = [await create_product() for _ in range(40)]
+    reads = []
+    for count in (1, 40):
+        headers = await create_user()
+        await fill(client, headers, products[:count])
+        reads.append(await count_reads(client, queries, path, headers))
+
+    assert reads[0] == reads[1]
+    assert reads[1].get("products", 0) <= 1
@@ -0,0 +1,30 @@
+import pytest
+
+from search import SearchIndex
+
+
+def product(product_id: str, words: int) -> dict:
+    return {"id": product_id, "title": "", "description": " ".join("word%d" % n for n in range(words))}
+
+
+def test_average_length_follows_adds_and_removes():
+    index = SearchIndex()
+    lengths = {"a": 3, "b": 10, "c": 200, "d": 40}
+    for product_id, words in lengths.items():
+        index.add(product(product_id, words))
+
+    assert index._avg_length == pytest.approx(index._total_length / 4)
+    index.remove("c")
+    assert index._avg_length == pytest.approx(index._total_length / 3)
+    index.add(product("b", 1))
+    assert index._avg_length == pytest.approx(index._total_length / 3)
+
+
+def test_build_and_adds_agree_on_the_average():
+    products = [product(str(n), n * 7 + 1) for n in range(20)]
+    built, added = SearchIndex(), SearchIndex()
+    built.build(products)
+    for item in products:
+        added.add(item)
+
+    assert added._avg_length == pytest.approx(built._avg_length)
@@ -0,0 +1,26 @@
+import uvicorn
+
+import serve
+
+
+class FakeProcess:
+    def __init__(self, events: list, name: str):
+        self.events = events
+        self.name = name
+
+    def terminate(self):
+        self.events.append(("terminate", self.name))
+
+    def join(self):
+        self.events.append(("join", self.name))
+
+
+def test_supervisor_signals_every_worker_before_waiting():
+    events = []
+    supervisor = serve.DrainingSupervisor(uvicorn.Config("server:app"), target=None, sockets=[])
+    supervisor.processes = [FakeProcess(events, name) for name in ("a", "b", "c")]
+
+    supervisor.shutdown()
+
+    assert events == [("terminate", "a"), ("terminate", "b"), ("terminate", "c"),
+                      ("join", "a"), ("join", "b"), ("join", "c")]
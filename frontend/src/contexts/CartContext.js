@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import axios from 'axios';
+import { subscribeToProducts, applyProductUpdate } from '../utils/live';
 import toast from 'react-hot-toast';
 import { useAuth } from './AuthContext';
 
@@ -41,6 +42,16 @@ export const CartProvider = ({ children }) => {
     setCartTotal(total);
   }, [cartItems]);
 
+  // Live price and stock for the products in the cart
+  const cartProductIds = cartItems.map(item => item.product.id).join(',');
+  useEffect(() => subscribeToProducts(API_BASE_URL, cartProductIds.split(','), (update) => {
+    setCartItems(prev => prev.map(item => {
+      if (item.product.id !== update.id) return item;
+      const product = applyProductUpdate(item.product, update);
+      return { ...item, product, subtotal: product.price * item.quantity };
+    }));
+  }), [cartProductIds]);
+
   const loadCart = async () => {
     if (!isAuthenticated) return;
     
@@ -117,10 +128,7 @@ export const CartProvider = ({ children }) => {
     if (!isAuthenticated) return { success: false };
 
     try {
-      // Remove all items one by one (since we don't have a clear all endpoint)
-      for (const item of cartItems) {
-        await axios.delete(`${API_BASE_URL}/api/cart/remove/${item.product.id}`);
-      }
+      await axios.delete(`${API_BASE_URL}/api/cart`);
       await loadCart();
       toast.success('Carrello svuotato');
       return { success: true };
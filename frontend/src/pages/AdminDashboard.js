@@ -14,6 +14,7 @@ import {
 import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 import toast from 'react-hot-toast';
+import { imageVariant } from '../utils/images';
 
 const AdminDashboard = () => {
   const [activeTab, setActiveTab] = useState('overview');
@@ -23,6 +24,7 @@ const AdminDashboard = () => {
   const [showProductForm, setShowProductForm] = useState(false);
   const [editingProduct, setEditingProduct] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const [uploadingImage, setUploadingImage] = useState(false);
 
   const { user, isAuthenticated, isAdmin } = useAuth();
   const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
@@ -119,6 +121,26 @@ const AdminDashboard = () => {
     }
   };
 
+  const handleImageUpload = async (e) => {
+    const file = e.target.files[0];
+    if (!file) return;
+
+    setUploadingImage(true);
+    try {
+      const formData = new FormData();
+      formData.append('file', file);
+      const response = await axios.post(`${API_BASE_URL}/api/admin/images`, formData);
+      setProductForm(prev => ({ ...prev, image_url: response.data.image_url }));
+      toast.success('Immagine caricata!');
+    } catch (error) {
+      const message = error.response?.data?.detail || 'Errore nel caricamento dell\'immagine';
+      toast.error(message);
+    } finally {
+      setUploadingImage(false);
+      e.target.value = '';
+    }
+  };
+
   const handleEditProduct = (product) => {
     setEditingProduct(product);
     setProductForm({
@@ -258,7 +280,7 @@ const AdminDashboard = () => {
                 {products.filter(p => p.featured).slice(0, 3).map(product => (
                   <div key={product.id} className="flex items-center space-x-3 p-3 bg-slate-700/30 rounded-lg">
                     <img 
-                      src={product.image_url || '/api/placeholder/50/50'} 
+                      src={imageVariant(product.image_url, 'thumb', '/api/placeholder/50/50')} 
                       className="w-12 h-12 object-cover rounded-lg"
                       alt={product.title}
                     />
@@ -321,7 +343,7 @@ const AdminDashboard = () => {
                       <td className="py-4">
                         <div className="flex items-center space-x-3">
                           <img 
-                            src={product.image_url || '/api/placeholder/50/50'} 
+                            src={imageVariant(product.image_url, 'thumb', '/api/placeholder/50/50')} 
                             className="w-12 h-12 object-cover rounded-lg"
                             alt={product.title}
                           />
@@ -493,12 +515,29 @@ const AdminDashboard = () => {
               <div>
                 <label className="block text-sm font-medium text-blur-blue mb-2">URL Immagine</label>
                 <input
-                  type="url"
+                  type="text"
                   value={productForm.image_url}
                   onChange={(e) => setProductForm(prev => ({ ...prev, image_url: e.target.value }))}
                   className="input-field w-full"
                   placeholder="https://example.com/image.jpg"
                 />
+                <div className="flex items-center space-x-3 mt-2">
+                  <input
+                    type="file"
+                    accept="image/*"
+                    onChange={handleImageUpload}
+                    disabled={uploadingImage}
+                    className="text-sm text-text-muted"
+                  />
+                  {uploadingImage && <span className="text-sm text-text-muted">Caricamento...</span>}
+                  {productForm.image_url && !uploadingImage && (
+                    <img
+                      src={imageVariant(productForm.image_url, 'thumb')}
+                      alt="Anteprima"
+                      className="w-12 h-12 object-cover rounded-lg"
+                    />
+                  )}
+                </div>
               </div>
 
               <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
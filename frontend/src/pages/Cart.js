@@ -3,6 +3,7 @@ import { Link } from 'react-router-dom';
 import { FaTrash, FaMinus, FaPlus, FaShoppingCart, FaArrowRight } from 'react-icons/fa';
 import { useCart } from '../contexts/CartContext';
 import { useAuth } from '../contexts/AuthContext';
+import { imageVariant } from '../utils/images';
 
 const Cart = () => {
   const { cartItems, cartTotal, cartCount, updateCartItem, removeFromCart, loading } = useCart();
@@ -98,7 +99,7 @@ const Cart = () => {
                   <div className="md:col-span-1">
                     <Link to={`/products/${item.product.id}`}>
                       <img 
-                        src={item.product.image_url || '/api/placeholder/200/250'} 
+                        src={imageVariant(item.product.image_url, 'card', '/api/placeholder/200/250')} 
                         alt={item.product.title}
                         className="w-full h-32 md:h-40 object-cover rounded-xl hover:scale-105 transition-transform duration-300"
                       />
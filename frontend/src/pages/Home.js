@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { FaStar, FaGamepad, FaFire, FaArrowRight, FaPlay } from 'react-icons/fa';
 import axios from 'axios';
+import { imageVariant } from '../utils/images';
 
 const Home = () => {
   const [featuredProducts, setFeaturedProducts] = useState([]);
@@ -12,9 +13,9 @@ const Home = () => {
   useEffect(() => {
     const loadFeaturedProducts = async () => {
       try {
-        // Load featured products
-        const response = await axios.get(`${API_BASE_URL}/api/products?featured=true&limit=8`);
-        setFeaturedProducts(response.data);
+        // Everything the page needs in one request
+        const response = await axios.get(`${API_BASE_URL}/api/bootstrap/home`);
+        setFeaturedProducts(response.data.featured);
       } catch (error) {
         console.error('Failed to load featured products:', error);
       } finally {
@@ -136,7 +137,7 @@ const Home = () => {
                 >
                   <div className="relative overflow-hidden">
                     <img 
-                      src={product.image_url || '/api/placeholder/300/400'} 
+                      src={imageVariant(product.image_url, 'card', '/api/placeholder/300/400')} 
                       alt={product.title}
                       className="w-full h-64 object-cover group-hover:scale-110 transition-transform duration-500"
                     />
@@ -15,11 +15,16 @@ import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 import { useCart } from '../contexts/CartContext';
 import toast from 'react-hot-toast';
+import { imageVariant } from '../utils/images';
+import { subscribeToProducts, applyProductUpdate } from '../utils/live';
 
 const ProductDetail = () => {
   const { id } = useParams();
   const [product, setProduct] = useState(null);
   const [reviews, setReviews] = useState([]);
+  const [reviewsCursor, setReviewsCursor] = useState(null);
+  const [loadingMoreReviews, setLoadingMoreReviews] = useState(false);
+  const [recommendations, setRecommendations] = useState([]);
   const [loading, setLoading] = useState(true);
   const [isInWishlist, setIsInWishlist] = useState(false);
   const [newReview, setNewReview] = useState({ rating: 5, comment: '' });
@@ -33,11 +38,17 @@ const ProductDetail = () => {
   useEffect(() => {
     loadProduct();
     loadReviews();
+    loadRecommendations();
     if (isAuthenticated) {
       checkWishlistStatus();
     }
   }, [id, isAuthenticated]);
 
+  // Live price, stock and rating while the page is open
+  useEffect(() => subscribeToProducts(API_BASE_URL, [id], (update) => {
+    setProduct(prev => applyProductUpdate(prev, update));
+  }), [id]);
+
   const loadProduct = async () => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/products/${id}`);
@@ -50,15 +61,35 @@ const ProductDetail = () => {
     }
   };
 
-  const loadReviews = async () => {
+  // Reviews come in pages, newest first; X-Next-Cursor is set while there
+  // are more. Without a cursor the list starts over from the first page.
+  const loadReviews = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/products/${id}/reviews`);
-      setReviews(response.data);
+      const response = await axios.get(`${API_BASE_URL}/api/products/${id}/reviews`, {
+        params: cursor ? { cursor } : {}
+      });
+      setReviews(prev => (cursor ? [...prev, ...response.data] : response.data));
+      setReviewsCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Failed to load reviews:', error);
     }
   };
 
+  const loadMoreReviews = async () => {
+    setLoadingMoreReviews(true);
+    await loadReviews(reviewsCursor);
+    setLoadingMoreReviews(false);
+  };
+
+  const loadRecommendations = async () => {
+    try {
+      const response = await axios.get(`${API_BASE_URL}/api/products/${id}/recommendations?limit=4`);
+      setRecommendations(response.data);
+    } catch (error) {
+      setRecommendations([]);
+    }
+  };
+
   const checkWishlistStatus = async () => {
     try {
       const response = await axios.get(`${API_BASE_URL}/api/wishlist`);
@@ -179,7 +210,7 @@ const ProductDetail = () => {
         <div className="space-y-4">
           <div className="relative overflow-hidden rounded-2xl">
             <img 
-              src={product.image_url || '/api/placeholder/600/800'} 
+              src={imageVariant(product.image_url, 'large', '/api/placeholder/600/800')} 
               alt={product.title}
               className="w-full h-96 lg:h-[600px] object-cover"
             />
@@ -304,6 +335,28 @@ const ProductDetail = () => {
         </div>
       </div>
 
+      {/* Recommendations */}
+      {recommendations.length > 0 && (
+        <div className="mb-12">
+          <h2 className="text-3xl font-gaming font-bold gradient-text mb-6">
+            I giocatori hanno desiderato anche
+          </h2>
+          <div className="grid grid-cols-2 md:grid-cols-4 gap-6">
+            {recommendations.map(item => (
+              <Link key={item.id} to={`/products/${item.id}`} className="card group">
+                <img
+                  src={imageVariant(item.image_url, 'card', '/api/placeholder/300/400')}
+                  alt={item.title}
+                  className="w-full h-48 object-cover rounded-xl mb-3"
+                />
+                <h3 className="text-text-light font-semibold truncate">{item.title}</h3>
+                <p className="text-modern-blue font-bold">€{item.price}</p>
+              </Link>
+            ))}
+          </div>
+        </div>
+      )}
+
       {/* Reviews Section */}
       <div className="space-y-8">
         <div className="flex items-center justify-between">
@@ -393,6 +446,17 @@ const ProductDetail = () => {
               </div>
             ))
           )}
+          {reviewsCursor && (
+            <div className="text-center">
+              <button
+                onClick={loadMoreReviews}
+                disabled={loadingMoreReviews}
+                className="btn-secondary"
+              >
+                {loadingMoreReviews ? 'Caricamento...' : 'Mostra altre recensioni'}
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link, useSearchParams } from 'react-router-dom';
 import { 
   FaStar, 
@@ -15,14 +15,20 @@ import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 import { useCart } from '../contexts/CartContext';
 import toast from 'react-hot-toast';
+import { imageVariant } from '../utils/images';
+import { subscribeToProducts, applyProductUpdate } from '../utils/live';
 
 const Products = () => {
   const [products, setProducts] = useState([]);
   const [categories, setCategories] = useState([]);
+  const [facets, setFacets] = useState(null);
   const [loading, setLoading] = useState(true);
   const [wishlist, setWishlist] = useState([]);
   const [showFilters, setShowFilters] = useState(false);
+  const [suggestions, setSuggestions] = useState(null);
+  const [showSuggestions, setShowSuggestions] = useState(false);
   const [searchParams, setSearchParams] = useSearchParams();
+  const bootstrapped = useRef(false);
 
   const [filters, setFilters] = useState({
     search: searchParams.get('search') || '',
@@ -33,6 +39,9 @@ const Products = () => {
     priceMax: searchParams.get('priceMax') || '',
     sortBy: searchParams.get('sortBy') || 'title'
   });
+  // What is typed in the search box; it becomes filters.search once typing
+  // pauses, on Enter or when a suggestion is picked
+  const [searchText, setSearchText] = useState(filters.search);
 
   const { isAuthenticated } = useAuth();
   const { addToCart } = useCart();
@@ -40,63 +49,104 @@ const Products = () => {
   const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
 
   useEffect(() => {
-    loadProducts();
-    loadCategories();
-    if (isAuthenticated) {
-      loadWishlist();
-    }
+    loadPage();
   }, [isAuthenticated]);
 
   useEffect(() => {
+    // The first render's products come from the bootstrap call
+    if (!bootstrapped.current) {
+      bootstrapped.current = true;
+      return;
+    }
     loadProducts();
   }, [filters]);
 
-  const loadProducts = async () => {
-    try {
-      setLoading(true);
-      const params = new URLSearchParams();
-      
-      if (filters.category) params.append('category', filters.category);
-      if (filters.platform) params.append('platform', filters.platform);
-      if (filters.genre) params.append('genre', filters.genre);
-      
-      const response = await axios.get(`${API_BASE_URL}/api/products?${params.toString()}`);
-      let filteredProducts = response.data;
-
-      // Client-side filtering for search and price
-      if (filters.search) {
-        const searchTerm = filters.search.toLowerCase();
-        filteredProducts = filteredProducts.filter(product =>
-          product.title.toLowerCase().includes(searchTerm) ||
-          product.description.toLowerCase().includes(searchTerm)
-        );
-      }
+  // The full search (products and facet counts) runs once typing pauses,
+  // not on every keystroke
+  useEffect(() => {
+    if (searchText === filters.search) return;
+    const timer = setTimeout(() => updateFilters({ search: searchText }), 400);
+    return () => clearTimeout(timer);
+  }, [searchText, filters]);
 
-      if (filters.priceMin) {
-        filteredProducts = filteredProducts.filter(product => product.price >= parseFloat(filters.priceMin));
+  // Suggestions while typing: one request per pause in typing, and a
+  // keystroke cancels the previous request so answers never arrive out of order
+  useEffect(() => {
+    const prefix = searchText.trim();
+    if (!prefix) {
+      setSuggestions(null);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API_BASE_URL}/api/products/suggest`, {
+          params: { prefix, limit: 5, fuzzy: true },
+          signal: controller.signal
+        });
+        setSuggestions(response.data);
+      } catch (error) {
+        if (!axios.isCancel(error)) setSuggestions(null);
       }
+    }, 150);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchText]);
 
-      if (filters.priceMax) {
-        filteredProducts = filteredProducts.filter(product => product.price <= parseFloat(filters.priceMax));
-      }
+  const hasSuggestions = suggestions && ['titles', 'developers', 'publishers', 'genres']
+    .some(key => suggestions[key].length > 0);
 
-      // Sorting
-      filteredProducts.sort((a, b) => {
-        switch (filters.sortBy) {
-          case 'price_asc':
-            return a.price - b.price;
-          case 'price_desc':
-            return b.price - a.price;
-          case 'rating':
-            return b.average_rating - a.average_rating;
-          case 'newest':
-            return new Date(b.release_date) - new Date(a.release_date);
-          default:
-            return a.title.localeCompare(b.title);
-        }
-      });
+  const pickSuggestion = (changes) => {
+    setShowSuggestions(false);
+    setSearchText(changes.search);
+    updateFilters(changes);
+  };
+
+  const submitSearch = () => {
+    setShowSuggestions(false);
+    if (searchText !== filters.search) updateFilters({ search: searchText });
+  };
+
+  // Live price, stock and rating for the products on screen
+  const productIds = products.map(product => product.id).join(',');
+  useEffect(() => subscribeToProducts(API_BASE_URL, productIds.split(','), (update) => {
+    setProducts(prev => prev.map(product => applyProductUpdate(product, update)));
+  }), [productIds]);
+
+  const filterParams = () => {
+    const params = new URLSearchParams();
+    if (filters.category) params.append('category', filters.category);
+    if (filters.platform) params.append('platform', filters.platform);
+    if (filters.genre) params.append('genre', filters.genre);
+    if (filters.search) params.append('q', filters.search);
+    if (filters.priceMin) params.append('price_min', filters.priceMin);
+    if (filters.priceMax) params.append('price_max', filters.priceMax);
+    return params;
+  };
+
+  const facetCount = (field, value) => {
+    if (!facets) return '';
+    return ` (${facets[field][value] || 0})`;
+  };
 
-      setProducts(filteredProducts);
+  const productParams = () => {
+    const params = filterParams();
+    // Relevance order when searching unless the user picked a sort
+    if (!filters.search || searchParams.get('sortBy')) params.append('sort', filters.sortBy);
+    return params;
+  };
+
+  const loadPage = async () => {
+    // Products, facet counts, categories and the wishlist in one request
+    try {
+      setLoading(true);
+      const response = await axios.get(`${API_BASE_URL}/api/bootstrap/products?${productParams().toString()}`);
+      setProducts(response.data.products);
+      setFacets(response.data.facets);
+      setCategories(response.data.categories);
+      setWishlist(response.data.wishlist?.items?.map(item => item.id) || []);
     } catch (error) {
       console.error('Failed to load products:', error);
       toast.error('Errore nel caricamento dei prodotti');
@@ -105,26 +155,33 @@ const Products = () => {
     }
   };
 
-  const loadCategories = async () => {
+  const loadProducts = async () => {
+    // Products and facet counts for the new filters, batched
     try {
-      const response = await axios.get(`${API_BASE_URL}/api/categories`);
-      setCategories(response.data);
+      setLoading(true);
+      const response = await axios.post(`${API_BASE_URL}/api/batch`, {
+        requests: [
+          { id: 'products', path: `/api/products?${productParams().toString()}` },
+          { id: 'facets', path: `/api/products/facets?${filterParams().toString()}` }
+        ]
+      });
+      const [productsResult, facetsResult] = response.data.responses;
+      if (productsResult.status !== 200) throw new Error(productsResult.body?.detail);
+      setProducts(productsResult.body);
+      // Counts are optional; the filters work without them
+      setFacets(facetsResult.status === 200 ? facetsResult.body : null);
     } catch (error) {
-      console.error('Failed to load categories:', error);
+      console.error('Failed to load products:', error);
+      toast.error('Errore nel caricamento dei prodotti');
+    } finally {
+      setLoading(false);
     }
   };
 
-  const loadWishlist = async () => {
-    try {
-      const response = await axios.get(`${API_BASE_URL}/api/wishlist`);
-      setWishlist(response.data.items?.map(item => item.id) || []);
-    } catch (error) {
-      console.error('Failed to load wishlist:', error);
-    }
-  };
+  const handleFilterChange = (key, value) => updateFilters({ [key]: value });
 
-  const handleFilterChange = (key, value) => {
-    const newFilters = { ...filters, [key]: value };
+  const updateFilters = (changes) => {
+    const newFilters = { ...filters, ...changes };
     setFilters(newFilters);
     
     // Update URL params
@@ -146,6 +203,7 @@ const Products = () => {
       sortBy: 'title'
     };
     setFilters(clearedFilters);
+    setSearchText('');
     setSearchParams(new URLSearchParams());
   };
 
@@ -233,6 +291,7 @@ const Products = () => {
               <option value="price_asc">Prezzo crescente</option>
               <option value="price_desc">Prezzo decrescente</option>
               <option value="rating">Valutazione</option>
+              <option value="popular">Più popolari</option>
               <option value="newest">Più recenti</option>
             </select>
           </div>
@@ -262,10 +321,55 @@ const Products = () => {
                   <input
                     type="text"
                     placeholder="Cerca videogiochi..."
-                    value={filters.search}
-                    onChange={(e) => handleFilterChange('search', e.target.value)}
+                    value={searchText}
+                    onChange={(e) => {
+                      setSearchText(e.target.value);
+                      setShowSuggestions(true);
+                    }}
+                    onKeyDown={(e) => {
+                      if (e.key === 'Enter') submitSearch();
+                    }}
+                    onFocus={() => setShowSuggestions(true)}
+                    onBlur={() => setShowSuggestions(false)}
                     className="input-field pl-10 w-full"
                   />
+                  {showSuggestions && hasSuggestions && (
+                    // onMouseDown keeps the input focused until the click lands
+                    <div
+                      className="absolute z-30 mt-1 w-full bg-bg-card border border-slate-700 rounded-lg shadow-lg py-2"
+                      onMouseDown={(e) => e.preventDefault()}
+                    >
+                      {suggestions.titles.map(item => (
+                        <Link
+                          key={item.id}
+                          to={`/products/${item.id}`}
+                          className="block px-3 py-1 text-text-light hover:text-modern-blue"
+                        >
+                          {item.title}
+                        </Link>
+                      ))}
+                      {[['developers', 'Sviluppatore'], ['publishers', 'Editore']].map(([key, label]) =>
+                        suggestions[key].map(item => (
+                          <button
+                            key={`${key}-${item.value}`}
+                            onClick={() => pickSuggestion({ search: item.value })}
+                            className="block w-full text-left px-3 py-1 text-text-light hover:text-modern-blue"
+                          >
+                            {item.value} <span className="text-xs text-text-muted">{label} · {item.products}</span>
+                          </button>
+                        ))
+                      )}
+                      {suggestions.genres.map(item => (
+                        <button
+                          key={`genre-${item.value}`}
+                          onClick={() => pickSuggestion({ search: '', genre: item.value })}
+                          className="block w-full text-left px-3 py-1 text-text-light hover:text-modern-blue"
+                        >
+                          {item.value} <span className="text-xs text-text-muted">Genere · {item.products}</span>
+                        </button>
+                      ))}
+                    </div>
+                  )}
                 </div>
               </div>
 
@@ -280,7 +384,7 @@ const Products = () => {
                   <option value="">Tutte le categorie</option>
                   {categories.map(category => (
                     <option key={category.id} value={category.id}>
-                      {category.name}
+                      {category.name}{facetCount('category_id', category.id)}
                     </option>
                   ))}
                 </select>
@@ -300,7 +404,7 @@ const Products = () => {
                         onChange={(e) => handleFilterChange('platform', e.target.value)}
                         className="text-modern-blue focus:ring-modern-blue/20 border-slate-600"
                       />
-                      <span className="ml-2 text-text-light">{platform}</span>
+                      <span className="ml-2 text-text-light">{platform}{facetCount('platform', platform)}</span>
                     </label>
                   ))}
                   <label className="flex items-center">
@@ -331,7 +435,7 @@ const Products = () => {
                         onChange={(e) => handleFilterChange('genre', e.target.value)}
                         className="text-modern-blue focus:ring-modern-blue/20 border-slate-600"
                       />
-                      <span className="ml-2 text-text-light">{genre}</span>
+                      <span className="ml-2 text-text-light">{genre}{facetCount('genre', genre)}</span>
                     </label>
                   ))}
                   <label className="flex items-center">
@@ -414,7 +518,7 @@ const Products = () => {
                   <div className="relative overflow-hidden">
                     <Link to={`/products/${product.id}`}>
                       <img 
-                        src={product.image_url || '/api/placeholder/300/400'} 
+                        src={imageVariant(product.image_url, 'card', '/api/placeholder/300/400')} 
                         alt={product.title}
                         className="w-full h-64 object-cover group-hover:scale-110 transition-transform duration-500"
                       />
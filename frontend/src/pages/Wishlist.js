@@ -5,6 +5,7 @@ import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
 import { useCart } from '../contexts/CartContext';
 import toast from 'react-hot-toast';
+import { imageVariant } from '../utils/images';
 
 const Wishlist = () => {
   const [wishlistItems, setWishlistItems] = useState([]);
@@ -155,7 +156,7 @@ const Wishlist = () => {
               <div className="relative overflow-hidden">
                 <Link to={`/products/${product.id}`}>
                   <img 
-                    src={product.image_url || '/api/placeholder/300/400'} 
+                    src={imageVariant(product.image_url, 'card', '/api/placeholder/300/400')} 
                     alt={product.title}
                     className="w-full h-64 object-cover group-hover:scale-110 transition-transform duration-500"
                   />
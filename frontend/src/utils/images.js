@@ -0,0 +1,9 @@
+// Uploaded images are served as /api/images/<hash>/<variant>; pick the
+// variant sized for where the image is shown. Other URLs pass through.
+const IMAGE_PATH = /^(\/api\/images\/[0-9a-f]{64})\/[a-z]+$/;
+
+export const imageVariant = (url, variant, fallback) => {
+  if (!url) return fallback;
+  const match = url.match(IMAGE_PATH);
+  return match ? `${match[1]}/${variant}` : url;
+};
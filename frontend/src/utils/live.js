@@ -0,0 +1,15 @@
+// Price, stock and rating changes pushed by the server over /api/live
+// (Server-Sent Events) instead of re-fetching. The browser reconnects by
+// itself, and every connection starts with the products' current values.
+export const subscribeToProducts = (apiBaseUrl, productIds, onUpdate) => {
+  const ids = [...new Set(productIds)].filter(Boolean);
+  if (ids.length === 0 || typeof EventSource === 'undefined') return () => {};
+
+  const source = new EventSource(`${apiBaseUrl}/api/live?products=${ids.map(encodeURIComponent).join(',')}`);
+  source.addEventListener('product', (event) => onUpdate(JSON.parse(event.data)));
+  return () => source.close();
+};
+
+export const applyProductUpdate = (product, update) => (
+  product && product.id === update.id ? { ...product, ...update } : product
+);
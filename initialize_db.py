@@ -1,19 +1,251 @@
+"""Seed the database with the curated catalog and, optionally, synthetic data.
+
+    python initialize_db.py                     # categories, sample products, admin
+    python initialize_db.py --products 1000000 --users 200000 --reviews 5000000
+
+Synthetic products, users, carts, wishlists and reviews are generated from a
+fixed --seed, so the same arguments always produce the same dataset. Product
+popularity is skewed (a few products get most carts, wishlists and reviews;
+see --skew). Documents are inserted in batches by --workers processes, and
+product rating aggregates are recomputed from the generated reviews.
+Synthetic users log in with the password "password".
+"""
+import argparse
 import asyncio
+import multiprocessing
+import random
 import sys
 import os
+import time
 sys.path.append('/app/backend')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
 
-from server import categories_collection, products_collection, users_collection
+from pymongo import MongoClient
+from server import db, MONGO_URL, DB_NAME, MONGO_POOL_OPTIONS
 from server import get_password_hash
+from indexes import apply_indexes
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+
+# Synthetic ids are derived from (kind, index), so any worker can refer to any
+# product or user without a lookup and reruns produce the same ids
+SEED_NAMESPACE = uuid.UUID("6f1c1e0a-52b4-4c43-9a39-6d1a0c8e2f10")
+SEED_USER_PREFIX = "seed-user-"
+
+TITLE_WORDS = [
+    "Shadow", "Legends", "Empire", "Galaxy", "Dragon", "Racing", "Storm", "Kingdom", "Night",
+    "Steel", "Quest", "Frontier", "Origins", "Rising", "Zero", "Tactics", "Chronicles", "Hunter",
+    "Rebellion", "Horizon", "Inferno", "Odyssey", "Arena", "Titans", "Wasteland", "Velocity",
+]
+DESCRIPTION_WORDS = [
+    "avventura", "mondo", "aperto", "battaglie", "strategia", "personaggi", "storia", "multiplayer",
+    "esplorazione", "missioni", "grafica", "città", "campagna", "squadra", "armi", "corse",
+]
+PLATFORMS = ["PC", "PlayStation", "Xbox", "Nintendo"]
+GENRES = ["Action", "RPG", "Sports", "Racing", "Adventure", "Strategy", "Open World", "Shooter"]
+STUDIOS = ["Studio %d" % i for i in range(300)]
+# Review scores lean positive, as on real stores
+RATING_WEIGHTS = [5, 7, 15, 33, 40]
+SEED_EPOCH = datetime(2024, 1, 1)
+
+
+def seeded_id(kind: str, index: int) -> str:
+    return str(uuid.uuid5(SEED_NAMESPACE, "%s-%d" % (kind, index)))
+
+
+def skewed_index(rng: random.Random, count: int, skew: float) -> int:
+    # Power-law pick: with skew=3 the first 10% of indexes get ~46% of picks
+    return min(int(count * rng.random() ** skew), count - 1)
+
+
+def pick_products(rng: random.Random, config: dict, count: int) -> list:
+    picked = set()
+    count = min(count, config["products"])
+    while len(picked) < count:
+        picked.add(skewed_index(rng, config["products"], config["skew"]))
+    return [seeded_id("product", index) for index in picked]
+
+
+def generate_products(rng, start, end, config):
+    for index in range(start, end):
+        yield {
+            "id": seeded_id("product", index),
+            "title": " ".join(rng.sample(TITLE_WORDS, rng.randint(2, 3))) + " %d" % rng.randint(1, 9),
+            "description": " ".join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(12, 30))),
+            "price": round(rng.uniform(4.99, 79.99), 2),
+            "image_url": "https://images.unsplash.com/photo-1542751371-adc38448a05e?w=600&h=800&fit=crop",
+            "category_id": rng.choice(config["category_ids"]),
+            "platform": rng.sample(PLATFORMS, rng.randint(1, 3)),
+            "genre": rng.sample(GENRES, rng.randint(1, 3)),
+            "rating": rng.choice(["E", "T", "M"]),
+            "release_date": SEED_EPOCH - timedelta(days=rng.randint(0, 20 * 365)),
+            "developer": rng.choice(STUDIOS),
+            "publisher": rng.choice(STUDIOS),
+            "in_stock": rng.randint(0, 500),
+            "featured": rng.random() < 0.01,
+            "average_rating": 0.0,
+            "total_reviews": 0,
+            "rating_histogram": {},
+            "popularity": 0.0,
+        }
+
+
+def generate_users(rng, start, end, config):
+    for index in range(start, end):
+        username = "%s%d" % (SEED_USER_PREFIX, index)
+        yield {
+            "id": seeded_id("user", index),
+            "username": username,
+            "email": "%s@example.com" % username,
+            "full_name": "Utente %d" % index,
+            "hashed_password": config["password_hash"],
+            "is_admin": False,
+            "created_at": SEED_EPOCH - timedelta(seconds=rng.randint(0, 3 * 365 * 86400)),
+        }
+
+
+def generate_carts(rng, start, end, config):
+    for index in range(start, end):
+        if rng.random() < config["cart_ratio"]:
+            items = pick_products(rng, config, rng.randint(1, 5))
+            yield {
+                "user_id": seeded_id("user", index),
+                "items": [{"product_id": product_id, "quantity": rng.randint(1, 3)} for product_id in items],
+            }
 
-async def initialize_database():
+
+def generate_wishlists(rng, start, end, config):
+    for index in range(start, end):
+        if rng.random() < config["wishlist_ratio"]:
+            items = pick_products(rng, config, rng.randint(1, 10))
+            yield {"user_id": seeded_id("user", index), "items": [{"product_id": product_id} for product_id in items]}
+
+
+def generate_reviews(rng, start, end, config):
+    # Reviews per user are exponentially distributed around the requested
+    # mean; a user reviews each product at most once
+    mean = config["reviews"] / config["users"]
+    for index in range(start, end):
+        user_id = seeded_id("user", index)
+        for product_id in pick_products(rng, config, int(rng.expovariate(1 / mean)) if mean else 0):
+            yield {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "user_id": user_id,
+                "product_id": product_id,
+                "rating": rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                "comment": " ".join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(3, 20))),
+                "created_at": SEED_EPOCH - timedelta(seconds=rng.randint(0, 2 * 365 * 86400)),
+            }
+
+
+GENERATORS = {
+    "products": generate_products,
+    "users": generate_users,
+    "carts": generate_carts,
+    "wishlists": generate_wishlists,
+    "reviews": generate_reviews,
+}
+
+_worker = {}
+
+
+def init_worker(url: str, name: str, config: dict):
+    # Each process opens its own synchronous client
+    _worker["db"] = MongoClient(url)[name]
+    _worker["config"] = config
+
+
+def seed_batch(task):
+    collection, start, end = task
+    config = _worker["config"]
+    # Seeded per batch, so the data does not depend on the number of workers
+    rng = random.Random("%s:%s:%d" % (config["seed"], collection, start))
+    inserted = 0
+    batch = []
+    for doc in GENERATORS[collection](rng, start, end, config):
+        batch.append(doc)
+        if len(batch) >= config["batch_size"]:
+            inserted += len(_worker["db"][collection].insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+    if batch:
+        inserted += len(_worker["db"][collection].insert_many(batch, ordered=False).inserted_ids)
+    return collection, end - start, inserted
+
+
+def seed_synthetic(args, category_ids):
+    config = {
+        "seed": args.seed,
+        "products": args.products,
+        "users": args.users,
+        "reviews": args.reviews,
+        "skew": args.skew,
+        "cart_ratio": args.cart_ratio,
+        "wishlist_ratio": args.wishlist_ratio,
+        "batch_size": args.batch_size,
+        "category_ids": category_ids,
+        "password_hash": get_password_hash("password"),
+    }
+    totals = {"products": args.products}
+    if args.users:
+        totals.update(users=args.users, carts=args.users, wishlists=args.users, reviews=args.users)
+    tasks = [
+        (collection, start, min(start + args.batch_size, total))
+        for collection, total in totals.items()
+        for start in range(0, total, args.batch_size)
+    ]
+    done = dict.fromkeys(totals, 0)
+    inserted = dict.fromkeys(totals, 0)
+
+    started = time.perf_counter()
+    # spawn: the parent already holds a Mongo client, which must not be forked
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=init_worker, initargs=(MONGO_URL, DB_NAME, config)) as pool:
+        for collection, processed, count in pool.imap_unordered(seed_batch, tasks):
+            done[collection] += processed
+            inserted[collection] += count
+            elapsed = time.perf_counter() - started
+            progress = " · ".join("%s %d%%" % (name, 100 * done[name] // totals[name]) for name in totals)
+            print("\r⏳ %s · %.0f doc/s   " % (progress, sum(inserted.values()) / elapsed), end="", flush=True)
+    elapsed = time.perf_counter() - started
+    print("\n✅ Inseriti %d documenti sintetici in %.1fs (%.0f doc/s)" % (
+        sum(inserted.values()), elapsed, sum(inserted.values()) / elapsed))
+    return inserted
+
+
+async def refresh_rating_aggregates():
+    # Recompute each reviewed product's aggregates with the same fields
+    # create_review maintains incrementally
+    await db.reviews.aggregate([
+        {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": "$_id.product_id",
+            "total_reviews": {"$sum": "$count"},
+            "rating_sum": {"$sum": {"$multiply": ["$_id.rating", "$count"]}},
+            "histogram": {"$push": {"k": {"$toString": "$_id.rating"}, "v": "$count"}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "id": "$_id",
+            "total_reviews": 1,
+            "rating_sum": 1,
+            "average_rating": {"$divide": ["$rating_sum", "$total_reviews"]},
+            "rating_histogram": {"$arrayToObject": "$histogram"},
+        }},
+        {"$merge": {"into": "products", "on": "id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ], allowDiskUse=True).to_list(length=None)
+
+async def initialize_database(args):
     print("🎮 Inizializzazione database Gaming E-commerce...")
+    await db.connect(MONGO_URL, DB_NAME, **MONGO_POOL_OPTIONS)
     
     # Clear existing data
-    categories_collection.delete_many({})
-    products_collection.delete_many({})
+    await db.categories.delete_many({})
+    await db.products.delete_many({})
+    if args.products or args.users:
+        # Carts, wishlists and reviews point at the products just removed
+        for collection in ("carts", "wishlists", "reviews"):
+            await db[collection].delete_many({})
+        await db.users.delete_many({"username": {"$regex": "^" + SEED_USER_PREFIX}})
     
     # Create categories
     categories = [
@@ -55,7 +287,7 @@ async def initialize_database():
         }
     ]
     
-    categories_collection.insert_many(categories)
+    await db.categories.insert_many(categories)
     print(f"✅ Inserite {len(categories)} categorie")
     
     # Create sample products
@@ -213,11 +445,12 @@ async def initialize_database():
         }
     ]
     
-    products_collection.insert_many(products)
+    # Every product carries a popularity score for the popular sort
+    await db.products.insert_many([{**product, "popularity": 0.0} for product in products])
     print(f"✅ Inseriti {len(products)} prodotti")
     
     # Create admin user if not exists
-    admin_exists = users_collection.find_one({"username": "admin"})
+    admin_exists = await db.users.find_one({"username": "admin"})
     if not admin_exists:
         admin_user = {
             "id": str(uuid.uuid4()),
@@ -228,17 +461,45 @@ async def initialize_database():
             "is_admin": True,
             "created_at": datetime.utcnow()
         }
-        users_collection.insert_one(admin_user)
+        await db.users.insert_one(admin_user)
         print("✅ Creato utente amministratore (username: admin, password: admin123)")
     
+    synthetic = {}
+    if args.products or args.users:
+        synthetic = seed_synthetic(args, [category["id"] for category in categories])
+        # Unique indexes are built after the bulk load; $merge needs products.id
+        await apply_indexes(db)
+        if synthetic.get("reviews"):
+            await refresh_rating_aggregates()
+            print("✅ Aggiornate le valutazioni dei prodotti")
+    
     print("🎯 Database inizializzato con successo!")
     print("\n📋 Riepilogo:")
     print(f"   • {len(categories)} categorie")
     print(f"   • {len(products)} prodotti")
     print("   • 1 utente amministratore")
+    for collection, count in synthetic.items():
+        print(f"   • {count} {collection} sintetici")
     print("\n🔑 Credenziali admin:")
     print("   • Username: admin")
     print("   • Password: admin123")
+    db.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=0, help="synthetic products")
+    parser.add_argument("--users", type=int, default=0, help="synthetic users (with carts, wishlists, reviews)")
+    parser.add_argument("--reviews", type=int, default=0, help="approximate total synthetic reviews")
+    parser.add_argument("--cart-ratio", type=float, default=0.3, help="share of users with a cart")
+    parser.add_argument("--wishlist-ratio", type=float, default=0.2, help="share of users with a wishlist")
+    parser.add_argument("--skew", type=float, default=3.0, help="product popularity skew (1 = uniform)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if args.users and not args.products:
+        parser.error("--users needs --products to fill carts, wishlists and reviews")
+    return args
 
 if __name__ == "__main__":
-    asyncio.run(initialize_database())
\ No newline at end of file
+    asyncio.run(initialize_database(parse_args()))